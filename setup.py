@@ -144,7 +144,7 @@ setup(
     # For an analysis of "install_requires" vs pip's requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=['PyQt5>=5.10.1',
-                      'Quamash>=0.6.0',
+                      'qasync>=0.10.0',
                       'netifaces>=0.10.6'],  # Optional
 
     # List additional groups of dependencies here (e.g. development
@@ -156,10 +156,11 @@ setup(
     # Similar to `install_requires` above, these must be valid existing
     # projects.
 
-    # extras_require={  # Optional
-    #     'dev': ['check-manifest'],
-    #     'test': ['coverage'],
-    # },
+    extras_require={  # Optional
+        'sampling': ['numpy>=1.13'],
+        'bench': ['numpy>=1.23'],
+        'rfb': ['numpy>=1.23'],
+    },
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.
@@ -167,7 +168,7 @@ setup(
     # If using Python 2.6 or earlier, then these have to be included in
     # MANIFEST.in as well.
     package_data={
-        'virtscreen': ['icon/*.png', 'assets/*.qml', 'assets/*.json'],
+        'virtscreen': ['icon/*.png', 'assets/*.qml', 'assets/*.qmlc', 'assets/*.json'],
     },
 
     # Although 'package_data' is the preferred approach, in some case you may
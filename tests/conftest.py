@@ -0,0 +1,111 @@
+"""Shared fixtures
+
+Tests run against the simulated xrandr, cvt, x11vnc and x0vncserver of
+virtscreen.simulate, so no X server or VNC server is needed.
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import logging
+import subprocess
+from typing import Callable
+
+import pytest
+
+from virtscreen.process import is_virtscreen
+from virtscreen.simulate import Simulator
+
+# virtscreen.path reads $XDG_CONFIG_HOME on import, so a single simulator
+# is entered before any test module imports VirtScreen.
+_simulator: Simulator = None
+
+
+def pytest_configure(config):
+    global _simulator
+    _simulator = Simulator().__enter__()
+
+
+def pytest_unconfigure(config):
+    if _simulator is not None:
+        _simulator.__exit__(None, None, None)
+
+
+@pytest.fixture
+def sim() -> Simulator:
+    """The simulator, reset to a laptop and an empty config directory"""
+    _simulator.configure(topology='laptop', latency={}, failures={},
+                         x11vnc_log='connect_disconnect', sleep_scale=0)
+    home = os.path.join(_simulator.path, 'config', 'virtscreen')
+    shutil.rmtree(home, ignore_errors=True)
+    os.makedirs(home)
+    return _simulator
+
+
+@pytest.fixture
+def loop(request) -> asyncio.AbstractEventLoop:
+    """A new asyncio event loop. Parametrized indirectly with 'qt', the
+    qasync loop driving offscreen Qt that main_gui runs."""
+    if getattr(request, 'param', 'asyncio') == 'qt':
+        pytest.importorskip('qasync')
+        from virtscreen.bench import _qt_loop
+        loop = _qt_loop()
+    else:
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def run_until(loop) -> Callable[..., float]:
+    """Run the event loop until done() is true and return the seconds it
+    took. Fails after the timeout."""
+    def run(done: Callable[[], bool], timeout: float = 10) -> float:
+        async def wait():
+            while not done():
+                await asyncio.sleep(0.001)
+        start = time.monotonic()
+        loop.run_until_complete(asyncio.wait_for(wait(), timeout))
+        return time.monotonic() - start
+    return run
+
+
+@pytest.fixture
+def states() -> list:
+    """VNC states emitted by the backend fixture"""
+    return []
+
+
+@pytest.fixture
+def backend(sim, loop, run_until, states):
+    """A Backend with the virtual screen created on VIRTUAL1"""
+    from virtscreen.qt_backend import Backend
+    backend = Backend(logger=logging.info)
+    backend.onVncStateChanged.connect(states.append)
+    backend.createVirtScreen('VIRTUAL1', 1368, 1024, False, False, '', '')
+    assert backend.virtScreenCreated
+    yield backend
+    if backend.vncState is not Backend.VNCState.OFF:
+        backend.stopVNC()
+        run_until(lambda: backend.vncState is Backend.VNCState.OFF)
+    if backend.virtScreenCreated:
+        backend.deleteVirtScreen()
+    backend._reconcileHandle.cancel()
+
+
+@pytest.fixture
+def other_instance(tmp_path):
+    """A running process looking like another VirtScreen"""
+    script = tmp_path / 'virtscreen'
+    script.write_text('import time\ntime.sleep(60)\n')
+    process = subprocess.Popen([sys.executable, str(script)])
+    # The command line is empty until exec() completes
+    deadline = time.monotonic() + 5
+    while not is_virtscreen(process.pid) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield process
+    process.kill()
+    process.wait()
@@ -0,0 +1,161 @@
+import time
+import logging
+
+import pytest
+
+from virtscreen.bench import VNC_STATE_LINES
+from virtscreen.port import find_free_port
+from virtscreen.qt_backend import Backend
+
+OFF, ERROR, WAITING, CONNECTED = (Backend.VNCState.OFF, Backend.VNCState.ERROR,
+                                  Backend.VNCState.WAITING, Backend.VNCState.CONNECTED)
+SHUTDOWN_LIMIT = 1.0  # seconds
+LATENCY_LIMIT = 0.1  # seconds from an x11vnc line to onVncStateChanged
+
+
+@pytest.fixture(params=list(VNC_STATE_LINES))
+def server(request, sim) -> str:
+    """Each simulated VNC server, set in the config"""
+    _configure(server=request.param)
+    return request.param
+
+
+def test_vnc_state_transitions(sim, server, backend, states, run_until):
+    backend.startVNC(find_free_port(5900, 100))
+    # x11vnc starts, a client connects and leaves
+    run_until(lambda: states[-2:] == [CONNECTED, WAITING])
+    assert states == [WAITING, CONNECTED, WAITING]
+    backend.stopVNC()
+    run_until(lambda: states[-1] is OFF)
+    assert states == [WAITING, CONNECTED, WAITING, OFF]
+
+
+@pytest.mark.parametrize('loop', ['asyncio', 'qt'], indirect=True)
+def test_vnc_state_latency(sim, server, loop, backend, run_until):
+    changes = []
+    backend.onVncStateChanged.connect(lambda state: changes.append((time.time(), state)))
+    start = time.time()
+    backend.startVNC(find_free_port(5900, 100))
+    run_until(lambda: [state for _, state in changes[-2:]] == [CONNECTED, WAITING])
+    emitted = [(t, line) for t, line in sim.emitted() if t >= start]
+    connection_line, disconnection_line = VNC_STATE_LINES[server]
+    connection = next(t for t, line in emitted if connection_line in line)
+    disconnection = next(t for t, line in emitted if disconnection_line in line)
+    connected, disconnected = (t for t, _ in changes[-2:])
+    assert 0 <= connected - connection < LATENCY_LIMIT
+    assert 0 <= disconnected - disconnection < LATENCY_LIMIT
+
+
+def test_vnc_port_in_use(sim, server, backend, states, run_until):
+    sim.configure(x11vnc_log='port_in_use')
+    errors = []
+    backend.onError.connect(errors.append)
+    backend.startVNC(find_free_port(5900, 100))
+    run_until(lambda: states[-1:] == [OFF])
+    assert states == [WAITING, ERROR, OFF]
+    assert errors and 'port is already used' in errors[0]
+
+
+def test_start_without_screen(sim, backend, states):
+    errors = []
+    backend.onError.connect(errors.append)
+    backend.deleteVirtScreen()
+    backend.startVNC(find_free_port(5900, 100))
+    assert errors and states == []
+
+
+def test_stop_when_not_running(sim, backend, states):
+    errors = []
+    backend.onError.connect(errors.append)
+    backend.stopVNC()
+    assert errors == ["stopVNC called while it is not running"]
+    assert states == []
+
+
+def test_shutdown_timing(sim, backend, states, run_until):
+    sim.configure(x11vnc_log='startup')
+    backend.startVNC(find_free_port(5900, 100))
+    run_until(lambda: states[-1:] == [WAITING])
+    backend.stopVNC()
+    assert run_until(lambda: states[-1] is OFF) < SHUTDOWN_LIMIT
+
+
+def _configure(**vnc):
+    from virtscreen.config import load_config, save_config
+    config, _ = load_config()
+    config['vnc'].update(vnc)
+    save_config(config)
+
+
+def test_on_demand_force_stop(sim, backend, states, run_until, monkeypatch):
+    import socket
+    monkeypatch.setattr('virtscreen.qt_backend.time.sleep', lambda seconds: None)
+    _configure(onDemand=True)
+    errors = []
+    backend.onError.connect(errors.append)
+    port = find_free_port(5900, 100)
+    backend.startVNC(port)
+    assert states == [WAITING]
+    client = socket.create_connection(('127.0.0.1', port))
+    try:
+        run_until(lambda: states[-1:] == [CONNECTED])
+        # At exit, while the sessions are still shutting down
+        backend.stopVNC(force=True)
+        backend.stopVNC(force=True)
+        backend.stopVNC()
+        assert errors == []
+        run_until(lambda: states[-1] is OFF)
+    finally:
+        client.close()
+
+
+def test_on_demand_force_stop_without_clients(sim, backend, states, monkeypatch):
+    monkeypatch.setattr('virtscreen.qt_backend.time.sleep', lambda seconds: None)
+    _configure(onDemand=True)
+    errors = []
+    backend.onError.connect(errors.append)
+    backend.startVNC(find_free_port(5900, 100))
+    backend.stopVNC(force=True)
+    backend.stopVNC(force=True)
+    assert errors == []
+    assert states == [WAITING, OFF]
+
+
+def test_long_password_warning(sim, backend, caplog):
+    errors = []
+    backend.onError.connect(errors.append)
+    with caplog.at_level(logging.INFO):
+        backend.addVNCPassword('secret', False)
+        assert 'first 8 characters' not in caplog.text
+        backend.addVNCPassword('a longer secret', False)
+    assert 'first 8 characters' in caplog.text
+    assert errors == [] and len(backend.vncPasswords) == 2
+    backend.addVNCPassword('#comment', True)
+    assert errors and '#' in errors[0]
+    assert len(backend.vncPasswords) == 2
+
+
+def test_on_demand_log_truncated_and_rotated(sim, backend, states, run_until, monkeypatch):
+    import os
+    import socket
+    from virtscreen.path import X11VNC_LOG_PATH
+    monkeypatch.setattr('virtscreen.qt_backend.time.sleep', lambda seconds: None)
+    monkeypatch.setattr(Backend, 'ON_DEMAND_LOG_MAX_BYTES', 100)
+    _configure(onDemand=True)
+    with open(X11VNC_LOG_PATH, 'w') as f:
+        f.write('log of the previous run\n')
+    port = find_free_port(5900, 100)
+    backend.startVNC(port)
+    assert os.path.getsize(X11VNC_LOG_PATH) == 0
+    # A long running session, then the next connection
+    with open(X11VNC_LOG_PATH, 'w') as f:
+        f.write('x' * 200)
+    client = socket.create_connection(('127.0.0.1', port))
+    try:
+        run_until(lambda: states[-1:] == [CONNECTED])
+        assert os.path.getsize(X11VNC_LOG_PATH + '.1') == 200
+        assert os.path.getsize(X11VNC_LOG_PATH) < 200
+    finally:
+        client.close()
+    backend.stopVNC(force=True)
+    run_until(lambda: states[-1] is OFF)
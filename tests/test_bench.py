@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import pytest
+
+from virtscreen import bench
+
+
+def test_installed_skips_stand_ins(sim):
+    stand_in = os.path.join(sim.path, 'bin', 'x11vnc')
+    assert shutil.which('x11vnc') == stand_in
+    assert bench._installed(sim, 'x11vnc') != stand_in
+    assert bench._installed(sim, 'sh') is not None
+
+
+@pytest.mark.skipif(shutil.which('Xvfb') is None, reason="Xvfb is not installed")
+def test_xvfb_comparison(sim):
+    try:
+        results = bench.SCENARIOS['xvfb'](sim)
+    except bench.Unavailable as e:
+        pytest.skip(str(e))
+    servers = [name for name in ('builtin', 'x11vnc') if f"{name}_first_frame_ms" in results]
+    assert servers
+    for name in servers:
+        # The whole screen first, then a glyph per update
+        assert results[f"{name}_full_bytes"] > results[f"{name}_bytes_per_frame"] > 0
+        assert results[f"{name}_cpu_ms_per_frame"] >= 0
+    if 'x11vnc' in servers:
+        assert results['x11vnc_scale_0.5_full_bytes'] < results['x11vnc_full_bytes']
+
+
+def test_compare_direction():
+    baseline = [10.0, 10.1, 9.9, 10.0, 10.05]
+    faster = [8.0, 8.1, 7.9]
+    assert bench.compare(baseline, faster)[2] == 'better'
+    assert bench.compare(baseline, faster, higher_is_better=True)[2] == 'worse'
+    assert bench.compare(baseline, [10.0, 10.02, 9.98], higher_is_better=True)[2] == '~'
+
+
+def test_report_frame_rates(capsys):
+    runs = [{'results': {'resources': {'nice_server_fps': [50.0, 50.5, 49.5],
+                                       'nice_desktop_p99_ms': [2.0, 2.1, 1.9]}}}]
+    # More frames and a larger timer overshoot
+    samples = {'resources': {'nice_server_fps': [80.0, 80.5, 79.5],
+                             'nice_desktop_p99_ms': [4.0, 4.1, 3.9]}}
+    assert bench.report(samples, runs) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1].split()[1] == 'nice_server_fps' and lines[1].endswith('better')
+    assert lines[2].split()[1] == 'nice_desktop_p99_ms' and lines[2].endswith('worse')
@@ -0,0 +1,37 @@
+import ctypes
+from ctypes.util import find_library
+
+import pytest
+
+pytest.importorskip('numpy')
+from virtscreen import capture
+
+pytestmark = pytest.mark.skipif(find_library('X11') is None, reason="libX11 is not installed")
+
+
+def _address(handler) -> int:
+    return ctypes.cast(handler, ctypes.c_void_p).value
+
+
+def test_error_handler_restored_after_last_capture():
+    xlib = capture._load('X11')
+    xlib.XSetErrorHandler.restype = ctypes.c_void_p
+    xlib.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+    foreign = []
+    previous = capture._XErrorHandler(lambda display, event: foreign.append(display) or 0)
+    xlib.XSetErrorHandler(previous)
+    try:
+        capture._install_error_handler(xlib, 1)
+        capture._install_error_handler(xlib, 2)
+        # Errors of other displays go to the previous handler
+        errors = capture._xerrors
+        capture._on_xerror(1, None)
+        capture._on_xerror(3, None)
+        assert capture._xerrors == errors + 1 and foreign == [3]
+        capture._restore_error_handler(xlib, 1)
+        assert xlib.XSetErrorHandler(capture._ERROR_HANDLER) == _address(capture._ERROR_HANDLER)
+        capture._restore_error_handler(xlib, 2)
+        assert xlib.XSetErrorHandler(None) == _address(previous)
+    finally:
+        capture._displays.clear()
+        capture._previous_handler = None
@@ -0,0 +1,83 @@
+import json
+import copy
+
+from virtscreen.config import SCHEMA_VERSION, migrate, validate, load_config
+from virtscreen.path import CONFIG_PATH, DEFAULT_CONFIG_PATH
+
+# config.json of 0.3.1, before schema versions
+CONFIG_0_3_1 = {
+    "version": "0.3.1",
+    "x11vncVersion": "0.9.15",
+    "theme_color": 3,
+    "virt": {"device": "VIRTUAL1", "width": 1600, "height": 900,
+             "portrait": True, "hidpi": False},
+    "vnc": {"port": 5901, "autostart": True},
+    "displaySettingApp": "arandr",
+    "x11vncOptions": {
+        "-ncache": {"available": True, "enabled": False, "arg": 10},
+        "-multiptr": {"available": True, "enabled": True, "arg": None},
+        "-repeat": {"available": False, "enabled": True, "arg": None},
+    },
+    "customX11vncArgs": {"enabled": False, "value": ""},
+    "presets": [],
+}
+
+
+def _default() -> dict:
+    with open(DEFAULT_CONFIG_PATH) as f:
+        return json.load(f)
+
+
+def test_migrate_from_0_3_1():
+    config = copy.deepcopy(CONFIG_0_3_1)
+    assert migrate(config)
+    assert config['schemaVersion'] == SCHEMA_VERSION
+    # User settings are kept, new settings added
+    assert config['virt']['width'] == 1600 and config['vnc']['port'] == 5901
+    assert config['vnc']['server'] == 'x11vnc'
+    assert config['vnc']['watchdog']['recovery'] == 'restart'
+    assert config['x11vncOptions']['-threads'] == \
+        {'available': None, 'enabled': False, 'arg': None}
+    # A migrated config has every setting of a new one
+    assert not validate(config, _default())
+    json.dumps(config)
+    assert not migrate(config)
+
+
+def test_validate_x11vnc_options():
+    config = copy.deepcopy(_default())
+    config['schemaVersion'] = SCHEMA_VERSION
+    options = config['x11vncOptions']
+    options['-ncache'] = {'enabled': 'yes'}
+    options['-custom'] = None
+    options['-clip'] = {'available': True, 'enabled': False, 'arg': 'xinerama0'}
+    assert validate(config, _default())
+    assert options['-ncache'] == _default()['x11vncOptions']['-ncache']
+    assert '-custom' not in options
+    assert options['-clip']['arg'] == 'xinerama0'
+
+
+def test_validate_allowed_values():
+    config = copy.deepcopy(_default())
+    config['schemaVersion'] = SCHEMA_VERSION
+    config['vnc']['watchdog']['recovery'] = 'recreate'
+    assert not validate(config, _default())
+    config['vnc']['watchdog']['recovery'] = 'reboot'
+    assert validate(config, _default())
+    assert config['vnc']['watchdog']['recovery'] == 'restart'
+
+
+def test_load_migrates_file(sim):
+    with open(CONFIG_PATH, 'w') as f:
+        json.dump(CONFIG_0_3_1, f)
+    config, created = load_config()
+    assert not created and config['schemaVersion'] == SCHEMA_VERSION
+    with open(CONFIG_PATH) as f:
+        assert json.load(f) == config
+
+
+def test_load_broken_file(sim):
+    with open(CONFIG_PATH, 'w') as f:
+        f.write('{"version": ')
+    config, created = load_config()
+    assert created and config == dict(_default(), version=config['version'])
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from virtscreen.idle import IdleController
+from virtscreen.remote import X11VNCRemote
+
+TIMEOUT = 0.2  # seconds
+WAIT = 1000  # ms
+POINTER = "19/10/2026 10:00:05 # pointer(mask: 0x1, x: 100, y: 200) ButtonPress\n"
+
+
+class _Remote(X11VNCRemote):
+    """Records the commands instead of running x11vnc -R"""
+
+    def __init__(self):
+        super(_Remote, self).__init__()
+        self.sent = []
+
+    def send(self, command: str) -> None:
+        self.sent.append(command)
+
+
+@pytest.fixture
+def idle(sim, loop):
+    changes = []
+    controller = IdleController(_Remote(), TIMEOUT, WAIT, changes.append)
+    controller.changes = changes
+    yield controller
+    controller.stop()
+
+
+def test_idle_after_timeout(idle, run_until):
+    idle.start()
+    assert idle.remote.sent == []
+    # Pointer events are only logged during the second half of the timeout
+    run_until(lambda: idle.watching)
+    assert idle.remote.sent == ['debug_pointer'] and not idle.idle
+    elapsed = run_until(lambda: idle.idle)
+    assert elapsed > TIMEOUT / 4
+    assert idle.changes == [True]
+    assert idle.remote.sent == ['debug_pointer', f"wait:{WAIT}", f"defer:{WAIT}"]
+
+
+def test_input_wakes_up(idle, run_until):
+    idle.start()
+    run_until(lambda: idle.idle)
+    idle.remote.sent.clear()
+    idle.feed_output(POINTER)
+    assert not idle.idle and idle.changes == [True, False]
+    # Full rate is restored, and the log stays quiet until the next watch
+    assert idle.remote.sent == ['nodebug_pointer', 'wait:20', 'defer:20']
+    assert not idle.watching
+
+
+def test_input_restarts_timeout(idle, loop, run_until):
+    idle.start()
+    run_until(lambda: idle.watching)
+    idle.feed_output("19/10/2026 10:00:04 client_count: 1\n")
+    assert idle.watching
+    idle.feed_output(POINTER)
+    assert not idle.watching and idle.remote.sent == ['debug_pointer', 'nodebug_pointer']
+    loop.run_until_complete(asyncio.sleep(TIMEOUT / 4))
+    assert not idle.idle
+    run_until(lambda: idle.idle)
+    assert idle.changes == [True]
+
+
+def test_input_ignored_before_watching(idle):
+    idle.start()
+    idle.feed_output(POINTER)
+    assert idle.remote.sent == [] and idle.handle is not None
+
+
+def test_stop_while_idle(idle, run_until):
+    idle.start()
+    run_until(lambda: idle.idle)
+    idle.stop()
+    assert idle.changes == [True, False]
+    assert idle.remote.sent[-3:] == ['nodebug_pointer', 'wait:20', 'defer:20']
+    assert idle.handle is None and not idle.remote.requests
@@ -0,0 +1,72 @@
+import json
+import atexit
+import logging
+
+import pytest
+
+from virtscreen.log import setup_logging, operation
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    """Set up logging to a file and restore the root logger afterwards"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    path = tmp_path / 'log.txt'
+    listeners = []
+
+    def setup(json_format: bool):
+        listener = setup_logging(logging.DEBUG, str(path), json_format)
+        atexit.unregister(listener.stop)
+        listeners.append(listener)
+        return listener
+    yield path, setup
+    for listener in listeners:
+        if listener._thread is not None:
+            listener.stop()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def _fail():
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logging.exception("Failed %s", 'dividing')
+
+
+def test_json_exception(log_file):
+    path, setup = log_file
+    listener = setup(True)
+    _fail()
+    listener.stop()
+    entry = json.loads(path.read_text().splitlines()[-1])
+    assert entry['message'] == "Failed dividing"
+    assert entry['level'] == 'ERROR'
+    assert entry['exception'].startswith('Traceback')
+    assert 'ZeroDivisionError' in entry['exception']
+
+
+def test_text_exception(log_file):
+    path, setup = log_file
+    listener = setup(False)
+    _fail()
+    listener.stop()
+    text = path.read_text()
+    assert "Failed dividing\nTraceback" in text
+    assert text.count('ZeroDivisionError') == 1
+
+
+def test_operation_fields(log_file):
+    path, setup = log_file
+    listener = setup(True)
+    with operation('createVirtScreen'):
+        pass
+    listener.stop()
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert entries[-1]['op'] == entries[-2]['op']
+    assert entries[-1]['op'].startswith('createVirtScreen-')
+    assert entries[-1]['duration'] >= 0
@@ -0,0 +1,64 @@
+import os
+import pstats
+import signal
+
+import pytest
+
+from virtscreen import profiling
+from virtscreen.profiling import Profiler, install, read_pid
+from virtscreen.xrandr import XRandR
+
+
+@pytest.fixture
+def restore_signal():
+    handler = signal.getsignal(profiling.PROFILE_SIGNAL)
+    yield
+    signal.signal(profiling.PROFILE_SIGNAL, handler)
+
+
+def _work() -> None:
+    for _ in range(20):
+        XRandR().get_primary_screen()
+
+
+def test_profile_files(sim, tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.start()
+    assert profiler.active
+    _work()
+    paths = profiler.stop()
+    assert not profiler.active
+    assert [os.path.splitext(path)[1] for path in paths] == ['.pstats', '.folded', '.txt']
+    assert pstats.Stats(paths[0]).total_calls > 0
+    with open(paths[1]) as f:
+        stack, count = f.readline().rsplit(' ', 1)
+    assert int(count) > 0 and ';' in stack
+    with open(paths[2]) as f:
+        assert 'xrandr.py' in f.read()
+
+
+def test_signal_toggles(sim, tmp_path, restore_signal):
+    pid_path = str(tmp_path / 'virtscreen.pid')
+    profiler = install(pid_path, str(tmp_path))
+    with open(pid_path) as f:
+        assert f.read() == str(os.getpid())
+    os.kill(os.getpid(), profiling.PROFILE_SIGNAL)
+    assert profiler.active
+    _work()
+    os.kill(os.getpid(), profiling.PROFILE_SIGNAL)
+    assert not profiler.active
+    assert len([name for name in os.listdir(str(tmp_path)) if name.startswith('profile-')]) == 3
+
+
+def test_keep_pid_of_running_instance(sim, tmp_path, restore_signal, other_instance):
+    pid_path = str(tmp_path / 'virtscreen.pid')
+    with open(pid_path, 'w') as f:
+        f.write(str(other_instance.pid))
+    install(pid_path, str(tmp_path))
+    assert read_pid(pid_path) == other_instance.pid
+    other_instance.kill()
+    other_instance.wait()
+    # The pid file of an exited instance is replaced
+    install(pid_path, str(tmp_path))
+    with open(pid_path) as f:
+        assert f.read() == str(os.getpid())
@@ -0,0 +1,94 @@
+import shutil
+import asyncio
+import socket
+
+import pytest
+
+from virtscreen.quality import QualityController, HiDPIScaler
+from virtscreen.remote import X11VNCRemote
+
+SS_OUTPUT = """\
+0 0 192.168.0.2:5900 192.168.0.10:51234
+\t cubic wscale:7,7 rto:204 rtt:150.5/3.2 ato:40 mss:1448 bytes_acked:204800 notsent:200000
+0 0 192.168.0.2:5900 192.168.0.11:51300
+\t cubic wscale:7,7 rto:204 rtt:1.2/0.4 ato:40 mss:1448 bytes_acked:4096
+"""
+
+
+def _remote() -> X11VNCRemote:
+    remote = X11VNCRemote()
+    remote.close()  # Nothing to send to
+    return remote
+
+
+def test_parse_ss():
+    controller = QualityController(_remote(), 5900, interval=1.0)
+    slow, fast = controller.parse(SS_OUTPUT)
+    assert (slow.peer, slow.rtt, slow.notsent, slow.acked) == \
+        ('192.168.0.10:51234', 150.5, 200000, 204800)
+    assert (fast.peer, fast.rtt, fast.notsent) == ('192.168.0.11:51300', 1.2, 0)
+    # Rates are computed from the previous sample
+    slow, fast = controller.parse(SS_OUTPUT.replace('bytes_acked:204800', 'bytes_acked:307200'))
+    assert slow.rate == 100.0 and fast.rate == 0.0
+
+
+def test_degrade_with_hysteresis():
+    controller = QualityController(_remote(), 5900)
+    clients = controller.parse(SS_OUTPUT)
+    for _ in range(QualityController.DEGRADE_AFTER - 1):
+        controller.decide(clients)
+    assert controller.level == 0
+    controller.decide(clients)
+    assert controller.level == 1
+
+
+@pytest.mark.skipif(not shutil.which('ss'), reason="ss is not installed")
+def test_sample_connected_client(loop):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    try:
+        controller = QualityController(_remote(), listener.getsockname()[1])
+        clients = loop.run_until_complete(controller.sample())
+        assert [c.peer for c in clients] == [f"127.0.0.1:{client.getsockname()[1]}"]
+    finally:
+        for sock in (client, server, listener):
+            sock.close()
+
+
+def test_hint_reset_between_clients(loop):
+    scaler = HiDPIScaler(_remote(), 5900)
+    scaler.feed_output("19/10/2026 10:00:01 network rate 1000.0 KB/sec\n")
+    scaler.start()
+    assert scaler.level == len(HiDPIScaler.LEVELS) - 1
+    scaler.stop()
+    # The next client starts from full scale, not the previous link
+    assert scaler.hint is None
+    scaler.start()
+    assert scaler.level == 0
+    scaler.stop()
+
+
+@pytest.mark.parametrize('rate, scale', [(30000.0, 1), (8000.0, 0.75), (1000.0, 0.5)])
+def test_scale_down_for_link_rate(loop, rate, scale):
+    assert HiDPIScaler.startup_scale() == 1
+    scaler = HiDPIScaler(_remote(), 5900)
+    scaler.start()
+    assert scaler.level == 0
+    # Full scale until x11vnc measures the link
+    scaler.feed_output("19/10/2026 10:00:01 client_count: 1\n")
+    assert scaler.level == 0
+    scaler.feed_output(f"19/10/2026 10:00:01 network rate {rate} KB/sec\n")
+    assert HiDPIScaler.LEVELS[scaler.level]['scale'] == scale
+    scaler.stop()
+
+
+def test_stop_while_sampling(loop):
+    controller = QualityController(_remote(), 5900, interval=0.01)
+    controller.start()
+    loop.run_until_complete(asyncio.sleep(0.1))
+    controller.stop()
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert controller.handle is None and controller.sampling is None
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from virtscreen.resources import ResourceLimits
+from virtscreen.process import AsyncSubprocess
+
+
+def test_defaults_spawn_without_preexec():
+    limits = ResourceLimits.from_config({})
+    assert limits.preexec_fn is None
+    assert limits.wrap('x11vnc') == 'x11vnc'
+    assert ResourceLimits(nice=10).preexec_fn is not None
+
+
+def test_cpu_list():
+    allowed = sorted(os.sched_getaffinity(0))
+    limits = ResourceLimits(cpu_affinity=f"{allowed[0]}-{allowed[0]}")
+    assert limits.cpus == {allowed[0]}
+    assert limits.preexec_fn is not None
+    with pytest.raises(ValueError, match='Invalid CPU list'):
+        ResourceLimits(cpu_affinity='0-x')
+
+
+def test_unavailable_cpu():
+    unavailable = max(os.sched_getaffinity(0)) + 1
+    with pytest.raises(ValueError, match=f"CPU {unavailable} is not available"):
+        ResourceLimits.from_config({'cpuAffinity': str(unavailable)})
+
+
+@pytest.mark.parametrize('ionice, message', [
+    ('fast', 'Unknown I/O scheduling class'),
+    ('best-effort:high', 'Invalid I/O priority level'),
+    ('best-effort:8', 'between 0 and 7'),
+])
+def test_invalid_ionice(ionice, message):
+    with pytest.raises(ValueError, match=message):
+        ResourceLimits.from_config({'ionice': ionice})
+
+
+def test_ionice_wrap():
+    assert ResourceLimits(ionice='idle').wrap('x11vnc') == 'ionice -c 3 x11vnc'
+    assert ResourceLimits(ionice='best-effort:7').wrap('x11vnc') == 'ionice -c 2 -n 7 x11vnc'
+
+
+def test_failed_spawn_is_reported(run_until):
+    exits = []
+    program = AsyncSubprocess(lambda: None, lambda data: None, lambda data: None, exits.append)
+    program.run('virtscreen-no-such-program')
+    run_until(lambda: exits)
+    assert exits == [1]
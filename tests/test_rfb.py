@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+import pytest
+
+np = pytest.importorskip('numpy')
+from virtscreen.rfb import RFBServer
+from virtscreen.port import find_free_port
+from virtscreen.bench import _FrameSource, _rfb_session, RFB_PASSWORD
+
+WIDTH, HEIGHT = 256, 128
+
+
+class _BrokenCapture(_FrameSource):
+    """Captures the given number of frames, then fails like a lost X server"""
+
+    def __init__(self, frames: int):
+        super(_BrokenCapture, self).__init__([np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)])
+        self.left: int = frames
+
+    def grab(self):
+        if not self.left:
+            raise RuntimeError("XShmGetImage failed.")
+        self.left -= 1
+        return super(_BrokenCapture, self).grab()
+
+
+def _session(loop, server: RFBServer, frames: int):
+    port = find_free_port(5900, 100)
+    listener = loop.run_until_complete(asyncio.start_server(server.handle, '127.0.0.1', port))
+    try:
+        return loop.run_until_complete(asyncio.wait_for(_rfb_session(port, 16, frames), 10))
+    finally:
+        server.close()
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+
+
+def test_updates(loop):
+    frames = [np.full((HEIGHT, WIDTH, 4), value, dtype=np.uint8) for value in (0, 255)]
+    server = RFBServer(_FrameSource(frames), password=RFB_PASSWORD, fps=1000)
+    updates = _session(loop, server, 3)
+    assert len(updates) == 3 and all(sent > 4 for sent, _ in updates)
+
+
+def test_capture_failure_closes_clients(loop, caplog):
+    server = RFBServer(_BrokenCapture(1), password=RFB_PASSWORD, fps=1000)
+    with caplog.at_level(logging.INFO):
+        with pytest.raises(asyncio.IncompleteReadError):
+            _session(loop, server, 3)
+    assert "Screen capture failed: XShmGetImage failed." in caplog.text
+    assert "client_count: 0" in caplog.text
+    assert not server.clients and server._updates is None
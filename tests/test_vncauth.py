@@ -0,0 +1,48 @@
+import pytest
+
+from virtscreen.vncauth import (write_password_list, read_password_list, write_password_file,
+                                read_password_file, VIEWONLY_MARKER)
+
+
+def _lines(path) -> list:
+    return path.read_text().splitlines()
+
+
+@pytest.mark.parametrize('full, view_only, lines', [
+    (['alpha'], [], ['alpha']),
+    # x11vnc reads the second line of a two line list as view-only
+    (['alpha', 'bravo'], [], ['alpha', 'bravo', VIEWONLY_MARKER]),
+    (['alpha', 'bravo', 'charlie'], [], ['alpha', 'bravo', 'charlie']),
+    (['alpha'], ['bravo'], ['alpha', VIEWONLY_MARKER, 'bravo']),
+    (['alpha', 'bravo'], ['charlie'], ['alpha', 'bravo', VIEWONLY_MARKER, 'charlie']),
+])
+def test_password_list_layout(tmp_path, full, view_only, lines):
+    path = tmp_path / 'passwds'
+    write_password_list(full, view_only, str(path))
+    assert _lines(path) == lines
+    assert read_password_list(str(path)) == (full, view_only)
+    assert path.stat().st_mode & 0o077 == 0
+
+
+@pytest.mark.parametrize('password', [
+    '', 'two\nlines', '#secret', VIEWONLY_MARKER, 'a__SKIP__', '__COMM__b', '__EMPTY__',
+])
+def test_password_list_rejects(tmp_path, password):
+    with pytest.raises(ValueError):
+        write_password_list(['alpha', password], [], str(tmp_path / 'passwds'))
+    assert not (tmp_path / 'passwds').exists()
+
+
+def test_password_list_rejects_truncated_collision(tmp_path):
+    # VNC authentication only uses the first 8 characters
+    with pytest.raises(ValueError):
+        write_password_list(['password1'], ['password2'], str(tmp_path / 'passwds'))
+    write_password_list(['password1', 'password2'], ['viewonly'], str(tmp_path / 'passwds'))
+
+
+def test_password_file(tmp_path):
+    path = str(tmp_path / 'passwd')
+    write_password_file('secret', path)
+    assert read_password_file(path) == 'secret'
+    write_password_file('longer than eight', path)
+    assert read_password_file(path) == 'longer t'
@@ -0,0 +1,26 @@
+import pytest
+
+from virtscreen.vncserver import SERVERS, VNCServer, get_server
+
+def test_servers_are_complete():
+    for server in SERVERS.values():
+        server()
+
+
+def test_incomplete_server_fails_on_creation():
+    class Incomplete(VNCServer):
+        name = program = 'incomplete'
+
+        def build_args(self, port, clip, options='', password_path=None, inetd=False):
+            return self.program
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_x0vncserver_clients(sim):
+    server = get_server('x0vncserver')
+    assert server.parse_output(" Connections: accepted: 127.0.0.1::51234\n") == 1
+    assert server.parse_output(" SConnection: Client needs protocol version 3.8\n") is None
+    assert server.parse_output(" Connections: closed: 127.0.0.1::51234 (Clean disconnection)\n"
+                               " Connections: closed: 127.0.0.1::51300 (Clean disconnection)\n"
+                               ) == 0
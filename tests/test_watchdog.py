@@ -0,0 +1,125 @@
+import sys
+import socket
+import asyncio
+import subprocess
+
+import pytest
+
+from virtscreen import watchdog
+from virtscreen.watchdog import StallWatchdog, ProcessSample
+from virtscreen.port import find_free_port
+from virtscreen.qt_backend import Backend
+
+TIMEOUT = 0.3  # seconds
+INTERVAL = 0.05
+
+
+@pytest.fixture
+def sleeper():
+    """A process doing no I/O, like a server blocked on an X server grab"""
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    yield process
+    process.kill()
+    process.wait()
+
+
+def _watchdog(pid: int, port: int = 0, probe: bool = False) -> StallWatchdog:
+    stalls = []
+    dog = StallWatchdog(lambda: pid, port, stalls.append, TIMEOUT, probe, INTERVAL)
+    dog.stalls = stalls
+    return dog
+
+
+def test_stall_without_io(sim, sleeper, run_until):
+    dog = _watchdog(sleeper.pid)
+    dog.start()
+    elapsed = run_until(lambda: dog.stalls)
+    assert elapsed >= TIMEOUT
+    assert dog.stalls[0].startswith(f"no I/O for {TIMEOUT:g} s")
+    assert dog.handle is None
+
+
+def test_output_is_heartbeat(sim, sleeper, loop, run_until):
+    dog = _watchdog(sleeper.pid)
+    dog.start()
+    ticks = int(2 * TIMEOUT / INTERVAL)
+
+    async def chat():
+        for _ in range(ticks):
+            dog.feed_output("19/10/2026 10:00:01 client 1 network rate 1200.5 KB/sec\n")
+            await asyncio.sleep(INTERVAL)
+    loop.run_until_complete(chat())
+    assert dog.stalls == []
+    # Silence after the last line
+    run_until(lambda: dog.stalls)
+    dog.stop()
+
+
+def test_spinning(sim, loop, run_until, monkeypatch):
+    samples = iter(ProcessSample('R', i * INTERVAL, 4096) for i in range(1000))
+    monkeypatch.setattr(watchdog.ProcessSample, 'read', classmethod(lambda cls, pid: next(samples)))
+    dog = _watchdog(1)
+    dog.start()
+    run_until(lambda: dog.stalls)
+    assert dog.stalls[0].startswith("spinning at 100% CPU without I/O")
+
+
+def test_exited_process_is_ignored(sim, loop, run_until):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    dog = _watchdog(process.pid)
+    dog.start()
+    loop.run_until_complete(asyncio.sleep(2 * TIMEOUT))
+    assert dog.stalls == [] and dog.handle is not None
+    dog.stop()
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1)
+    yield sock
+    sock.close()
+
+
+def test_probe_answered(sim, sleeper, loop):
+    probes = []
+
+    async def serve(reader, writer):
+        probes.append(writer)
+        writer.write(b"RFB 003.008\n")
+    port = find_free_port(5900, 100)
+    server = loop.run_until_complete(asyncio.start_server(serve, '127.0.0.1', port))
+    dog = _watchdog(sleeper.pid, port, probe=True)
+    try:
+        dog.start()
+        loop.run_until_complete(asyncio.sleep(3 * TIMEOUT))
+        # Suspected and probed, but the server answers
+        assert probes and dog.stalls == [] and dog.handle is not None
+    finally:
+        dog.stop()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+
+
+def test_probe_silent(sim, sleeper, listener, run_until, monkeypatch):
+    monkeypatch.setattr(StallWatchdog, 'PROBE_TIMEOUT', 0.2)
+    # Connections are accepted by the kernel, but nothing is sent
+    dog = _watchdog(sleeper.pid, listener.getsockname()[1], probe=True)
+    dog.start()
+    run_until(lambda: dog.stalls)
+    assert dog.stalls[0].endswith(", no answer on the port")
+
+
+def test_backend_restarts_hung_server(sim, backend, states, run_until):
+    from virtscreen.config import load_config, save_config
+    sim.configure(x11vnc_log='connect_hang')
+    config, _ = load_config()
+    config['vnc']['watchdog'].update(enabled=True, timeout=1, probe=True, recovery='restart')
+    save_config(config)
+    backend.startVNC(find_free_port(5900, 100))
+    run_until(lambda: states[-3:] == [Backend.VNCState.OFF, Backend.VNCState.WAITING,
+                                      Backend.VNCState.CONNECTED])
+    assert states == [Backend.VNCState.WAITING, Backend.VNCState.CONNECTED,
+                      Backend.VNCState.OFF, Backend.VNCState.WAITING, Backend.VNCState.CONNECTED]
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import atexit
+import subprocess
+
+import pytest
+
+from virtscreen.simulate import TOPOLOGIES
+from virtscreen.xrandr import XRandR
+from virtscreen.path import VIRT_MODES_PATH
+from virtscreen.process import is_virtscreen
+
+
+def test_parse_laptop(sim):
+    xrandr = XRandR()
+    assert [screen.name for screen in xrandr.screens] == ['eDP1', 'DP1', 'HDMI1', 'VIRTUAL1']
+    primary = xrandr.primary
+    assert (primary.name, primary.primary, primary.connected, primary.active) == \
+        ('eDP1', True, True, True)
+    assert (primary.width, primary.height, primary.x_offset, primary.y_offset) == \
+        (1920, 1080, 0, 0)
+    virtual = xrandr.screens[3]
+    assert not virtual.connected and not virtual.active
+
+
+@pytest.mark.parametrize('topology', ['laptop', 'dual', 'desktop'])
+def test_parse_topologies(sim, topology):
+    sim.configure(topology=topology)
+    xrandr = XRandR()
+    expected = TOPOLOGIES[topology]
+    assert [screen.name for screen in xrandr.screens] == [o['name'] for o in expected]
+    assert [screen.active for screen in xrandr.screens] == \
+        [bool(o.get('mode')) for o in expected]
+    assert [screen.connected for screen in xrandr.screens] == [o['connected'] for o in expected]
+
+
+def test_parse_offsets(sim):
+    sim.configure(topology='dual')
+    hdmi = next(s for s in XRandR().screens if s.name == 'HDMI1')
+    assert (hdmi.width, hdmi.height, hdmi.x_offset, hdmi.y_offset) == (2560, 1440, 1920, 0)
+
+
+def test_parse_errors(sim):
+    sim.configure(topology='no_primary')
+    with pytest.raises(RuntimeError, match='no primary screen'):
+        XRandR()
+    sim.configure(topology='laptop')
+    xrandr = XRandR()
+    xrandr.virt_name = 'eDP1'
+    with pytest.raises(RuntimeError, match='other than the primary'):
+        xrandr.get_virtual_screen()
+    xrandr.virt_name = 'VIRTUAL9'
+    with pytest.raises(RuntimeError, match='No virtual screen'):
+        xrandr.get_virtual_screen()
+
+
+def _output(sim, name):
+    return next(output for output in sim.outputs() if output['name'] == name)
+
+
+def test_create_delete(sim):
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    xrandr.create_virtual_screen(1368, 1024, pos='right')
+    virtual = _output(sim, 'VIRTUAL1')
+    assert virtual['mode'] == '1368x1024_virt'
+    assert virtual['pos'] == [1920, 0]
+    assert xrandr.virt.active and xrandr.owned_mode == '1368x1024_virt'
+    xrandr.delete_virtual_screen()
+    virtual = _output(sim, 'VIRTUAL1')
+    assert virtual['mode'] is None and virtual['modes'] == []
+    assert xrandr.owned_mode == ''
+
+
+def test_create_reuses_mode(sim):
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    calls = len(sim.calls())
+    for _ in range(2):
+        xrandr.create_virtual_screen(1368, 1024, pos='left')
+        xrandr.delete_virtual_screen()
+    # The mode is created once and added again the second time
+    newmodes = [call for call in sim.calls()[calls:] if call[:2] == ['xrandr', '--newmode']]
+    assert len(newmodes) == 1
+
+
+@pytest.mark.parametrize('portrait, hidpi, size', [
+    (False, False, (1368, 1024)),
+    (True, False, (1024, 1368)),
+    (False, True, (2736, 2048)),
+    (True, True, (2048, 2736)),
+])
+def test_create_sizes(sim, portrait, hidpi, size):
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    xrandr.create_virtual_screen(1368, 1024, portrait, hidpi, 'below')
+    try:
+        assert (xrandr.virt.width, xrandr.virt.height) == size
+        assert _output(sim, 'VIRTUAL1')['mode'] == f"{size[0]}x{size[1]}_virt"
+        assert (xrandr.virt.x_offset, xrandr.virt.y_offset) == (0, 1080)
+    finally:
+        xrandr.delete_virtual_screen()
+
+
+def test_create_auto_position(sim):
+    sim.configure(topology='dual')
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    xrandr.create_virtual_screen(1368, 1024, pos='auto')
+    try:
+        active = [s for s in xrandr.screens if s.active]
+        for i, a in enumerate(active):
+            for b in active[i + 1:]:
+                assert (a.x_offset + a.width <= b.x_offset or b.x_offset + b.width <= a.x_offset
+                        or a.y_offset + a.height <= b.y_offset
+                        or b.y_offset + b.height <= a.y_offset), f"{a} overlaps {b}"
+    finally:
+        xrandr.delete_virtual_screen()
+
+
+def test_create_failure(sim):
+    sim.configure(failures={'xrandr --newmode': 'BadName'})
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    with pytest.raises(subprocess.CalledProcessError):
+        xrandr.create_virtual_screen(1368, 1024, pos='right')
+    assert _output(sim, 'VIRTUAL1')['mode'] is None
+
+
+def _leak_screen(sim, pid=None):
+    """Create the virtual screen like an instance that then crashed,
+    recorded as owned by pid"""
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    xrandr.create_virtual_screen(1368, 1024, pos='right')
+    atexit.unregister(xrandr.delete_virtual_screen)
+    if pid is not None:
+        with open(VIRT_MODES_PATH, 'w') as f:
+            json.dump({xrandr.owned_mode: [pid]}, f)
+
+
+def test_reconcile_leaked_mode(sim):
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    _leak_screen(sim, dead.pid)
+    xrandr = XRandR()
+    assert xrandr.reconcile() == ['xrandr --output VIRTUAL1 --off',
+                                  'xrandr --delmode VIRTUAL1 1368x1024_virt',
+                                  'xrandr --rmmode 1368x1024_virt']
+    virtual = _output(sim, 'VIRTUAL1')
+    assert virtual['mode'] is None and virtual['modes'] == []
+    # Idempotent
+    assert xrandr.reconcile() == []
+
+
+def test_reconcile_unattached_mode(sim):
+    subprocess.check_call(['xrandr', '--newmode', '800x600_virt',
+                           '38.22', '800', '832', '912', '1024', '600', '601', '604', '622'])
+    xrandr = XRandR()
+    assert xrandr.reconcile() == ['xrandr --rmmode 800x600_virt']
+    assert xrandr.reconcile() == []
+
+
+def test_reconcile_keeps_own_mode(sim):
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    xrandr.create_virtual_screen(1368, 1024, pos='right')
+    try:
+        assert xrandr.reconcile() == []
+        assert _output(sim, 'VIRTUAL1')['mode'] == '1368x1024_virt'
+    finally:
+        xrandr.delete_virtual_screen()
+
+
+def test_reconcile_keeps_modes_of_running_instances(sim, other_instance):
+    _leak_screen(sim, other_instance.pid)
+    xrandr = XRandR()
+    assert xrandr.reconcile() == []
+    assert _output(sim, 'VIRTUAL1')['mode'] == '1368x1024_virt'
+    # Reclaimed once the other instance has exited
+    other_instance.kill()
+    other_instance.wait()
+    assert len(xrandr.reconcile()) == 3
+    assert _output(sim, 'VIRTUAL1')['mode'] is None
+
+
+def test_is_virtscreen_matches_entry_point(tmp_path, other_instance):
+    assert is_virtscreen(other_instance.pid)
+    # A reused pid of a process only mentioning virtscreen in its arguments
+    path = str(tmp_path / '.config' / 'virtscreen' / 'config.json')
+    process = subprocess.Popen(['sleep', '60', path])
+    try:
+        cmdline = f'/proc/{process.pid}/cmdline'
+        deadline = time.monotonic() + 5
+        while path.encode() not in open(cmdline, 'rb').read() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not is_virtscreen(process.pid)
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_owner_recorded(sim):
+    xrandr = XRandR()
+    xrandr.virt_name = 'VIRTUAL1'
+    xrandr.create_virtual_screen(1368, 1024, pos='right')
+    with open(VIRT_MODES_PATH) as f:
+        assert json.load(f) == {'1368x1024_virt': [os.getpid()]}
+    xrandr.delete_virtual_screen()
+    with open(VIRT_MODES_PATH) as f:
+        assert json.load(f) == {}
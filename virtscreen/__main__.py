@@ -5,11 +5,11 @@ import sys
 import os
 import signal
 import json
-import shutil
 import argparse
 import logging
-from logging.handlers import RotatingFileHandler
-from typing import Callable
+import subprocess
+import time
+from typing import Callable, List
 import asyncio
 
 # Import OpenGL library for Nvidia driver
@@ -21,13 +21,19 @@ ctypes.CDLL(find_library('GL'), ctypes.RTLD_GLOBAL)
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtQml import qmlRegisterType, QQmlApplicationEngine
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import Qt, QUrl
-from quamash import QEventLoop
+from PyQt5.QtCore import Qt, QUrl, QTimer
+from qasync import QEventLoop
 
 from .display import DisplayProperty
 from .xrandr import XRandR
 from .qt_backend import Backend, Cursor, Network
+from .log import setup_logging
+from .session import Preflight, load_session, process_age
+from . import metrics
+from . import profiling
+from .vncserver import available_servers
 from .path import HOME_PATH, ICON_PATH, MAIN_QML_PATH, CONFIG_PATH, LOGGING_PATH
+from .path import BENCH_HISTORY_PATH, PID_PATH
 
 def error(*args, **kwargs) -> None:
     """Error printing"""
@@ -36,6 +42,10 @@ def error(*args, **kwargs) -> None:
 
 def main() -> None:
     """Start main program"""
+    if sys.argv[1:2] == ['bench']:
+        sys.exit(main_bench(sys.argv[2:]))
+    if sys.argv[1:2] == ['profile']:
+        sys.exit(main_profile(sys.argv[2:]))
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter,
         description='Make your iPad/tablet/computer as a secondary monitor on Linux.\n\n'
@@ -52,7 +62,14 @@ def main() -> None:
                'virtscreen --left    # CLI mode. On the left to the primary monitor\n'
                'virtscreen --below   # CLI mode. Below the primary monitor.\n'
                'virtscreen --below --portrait           # Below, and portrait mode.\n'
-               'virtscreen --below --portrait  --hipdi  # Below, portrait, HiDPI mode.\n')
+               'virtscreen --below --portrait  --hipdi  # Below, portrait, HiDPI mode.\n'
+               'virtscreen --auto-position    # CLI mode. Next to any monitor, without overlaps\n'
+               'virtscreen --right --relative-to HDMI1  # Right to the HDMI1 monitor.\n'
+               'virtscreen --restore  # CLI mode. Restore the last working session quickly,\n'
+               '                        e.g. from a login script\n'
+               'virtscreen bench      # Measure performance offline and compare it with\n'
+               '                        previous runs. See virtscreen bench --help\n'
+               'virtscreen profile    # Start or stop profiling the running VirtScreen\n')
     parser.add_argument('--auto', action='store_true',
         help='create a virtual screen automatically using previous\n'
              'settings (from both GUI mode and CLI mode)')
@@ -65,6 +82,15 @@ def main() -> None:
         help='above the primary monitor')
     parser.add_argument('--below', '--down', action='store_true',
         help='below the primary monitor')
+    parser.add_argument('--auto-position', action='store_true',
+        help='place the virtual screen next to any monitor, avoiding\n'
+             'overlaps and keeping the total screen size small')
+    parser.add_argument('--relative-to', type=str, metavar='OUTPUT',
+        help='place the virtual screen next to OUTPUT (e.g. HDMI1)\n'
+             'instead of the primary monitor')
+    parser.add_argument('--restore', action='store_true',
+        help='restore the last session (screen layout and VNC port)\n'
+             'saved when the VNC server last started. For login scripts')
     parser.add_argument('--portrait', action='store_true',
         help='Portrait mode. Width and height of the screen are swapped')
     parser.add_argument('--hidpi', action='store_true',
@@ -72,6 +98,9 @@ def main() -> None:
     parser.add_argument('--log', type=str,
         help='Python logging level, For example, --log=INFO.\n'
              'Only used for reporting bugs and debugging')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text',
+        help='Format of log records. json writes one JSON object\n'
+             'per line with timestamps, operation ids and durations')
     # Add signal handler
     def on_exit(self, signum=None, frame=None):
         sys.exit(0)
@@ -79,17 +108,57 @@ def main() -> None:
         signal.signal(sig, on_exit)
 
     args = vars(parser.parse_args())
-    cli_args = ['auto', 'left', 'right', 'above', 'below', 'portrait', 'hidpi']
+    cli_args = ['auto', 'left', 'right', 'above', 'below', 'portrait', 'hidpi',
+                'auto_position', 'relative_to']
     # Start main
-    if any((value and arg in cli_args) for arg, value in args.items()):
+    if args['restore']:
+        main_restore(args)
+    elif any((value and arg in cli_args) for arg, value in args.items()):
         main_cli(args)
     else:
         main_gui(args)
     error('Program should not reach here.')
     sys.exit(1)
 
-def check_env(args: argparse.Namespace, msg: Callable[[str], None]) -> None:
-    """Check environments and arguments before start. This also enable logging"""
+def main_bench(argv: List[str]) -> int:
+    """Run the benchmarks, keeping their history in HOME_PATH"""
+    if not HOME_PATH:
+        error("Cannot detect home directory.")
+        return 1
+    # The benchmarks run in a fresh interpreter since scenarios use their
+    # own config directory, read by virtscreen.path on import.
+    return subprocess.call([sys.executable, '-m', 'virtscreen.bench',
+                            '--history', BENCH_HISTORY_PATH, *argv])
+
+def main_profile(argv: List[str]) -> int:
+    """Toggle profiling of the running VirtScreen"""
+    parser = argparse.ArgumentParser(
+        prog='virtscreen profile',
+        description='Start or stop profiling the running VirtScreen. The profile is\n'
+                    f'written to {HOME_PATH} when profiling stops.',
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--duration', type=float, metavar='SECONDS',
+        help='profile for SECONDS, then stop')
+    args = parser.parse_args(argv)
+    pid = profiling.read_pid(PID_PATH)
+    if pid is None:
+        error("VirtScreen is not running.")
+        return 1
+    os.kill(pid, profiling.PROFILE_SIGNAL)
+    if args.duration is None:
+        print(f"Toggled profiling of VirtScreen (pid {pid}). Run it again to stop\n"
+              f"and write profile-*.pstats, .folded and .txt to {HOME_PATH}.")
+        return 0
+    print(f"Profiling VirtScreen (pid {pid}) for {args.duration:g} s...")
+    time.sleep(args.duration)
+    os.kill(pid, profiling.PROFILE_SIGNAL)
+    print(f"Done. The profile is written to {HOME_PATH}/profile-*.")
+    return 0
+
+def check_env(args: argparse.Namespace, msg: Callable[[str], None],
+              check_programs: bool = True) -> None:
+    """Check environments and arguments before start. This also enable logging.
+    If check_programs is False, VNC servers and xrandr are left to the caller."""
     if os.environ.get('XDG_SESSION_TYPE', '').lower() == 'wayland':
         msg("Currently Wayland is not supported")
         sys.exit(1)
@@ -103,9 +172,9 @@ def check_env(args: argparse.Namespace, msg: Callable[[str], None]) -> None:
         except:
             msg("Cannot create ~/.config/virtscreen")
             sys.exit(1)
-    # Check x11vnc
-    if not shutil.which('x11vnc'):
-        msg("x11vnc is not installed.")
+    # Check VNC servers
+    if check_programs and not available_servers():
+        msg("No VNC server is installed. Install x11vnc or TigerVNC (x0vncserver).")
         sys.exit(1)
     # Enable logging
     if args['log'] is None:
@@ -117,23 +186,35 @@ def check_env(args: argparse.Namespace, msg: Callable[[str], None]) -> None:
     # When logging level is INFO or lower, print logs in terminal
     # Otherwise log to a file
     log_to_file = True if log_level > logging.INFO else False
-    FORMAT = "[%(levelname)s:%(filename)s:%(lineno)s:%(funcName)s()] %(message)s"
-    logging.basicConfig(level=log_level, format=FORMAT,
-                        **({'filename': LOGGING_PATH} if log_to_file else {}))
-    if log_to_file:
-        logger = logging.getLogger()
-        handler = RotatingFileHandler(LOGGING_PATH, mode='a', maxBytes=1024*4, backupCount=1)
-        logger.addHandler(handler)
+    setup_logging(log_level, LOGGING_PATH if log_to_file else None,
+                  args['log_format'] == 'json')
     logging.info('logging enabled')
     del args['log']
+    del args['log_format']
     logging.info(f'{args}')
     # Check if xrandr is correctly parsed.
+    if not check_programs:
+        return
     try:
         test = XRandR()
     except RuntimeError as e:
         msg(str(e))
         sys.exit(1)
 
+def create_engine() -> QQmlApplicationEngine:
+    """Register the Python types and load the QML frontend"""
+    # Register the Python type.  Its URI is 'People', it's v1.0 and the type
+    # will be called 'Person' in QML.
+    qmlRegisterType(DisplayProperty, 'VirtScreen.DisplayProperty', 1, 0, 'DisplayProperty')
+    qmlRegisterType(Backend, 'VirtScreen.Backend', 1, 0, 'Backend')
+    qmlRegisterType(Cursor, 'VirtScreen.Cursor', 1, 0, 'Cursor')
+    qmlRegisterType(Network, 'VirtScreen.Network', 1, 0, 'Network')
+
+    # Create a component factory and load the QML script.
+    engine = QQmlApplicationEngine()
+    engine.load(QUrl(MAIN_QML_PATH))
+    return engine
+
 def main_gui(args: argparse.Namespace):
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
     app = QApplication(sys.argv)
@@ -148,27 +229,27 @@ def main_gui(args: argparse.Namespace):
         dialog("Cannot detect system tray on this system.")
         sys.exit(1)
     check_env(args, dialog)
+    # Profiling on demand, toggled by SIGUSR1 (virtscreen profile)
+    if HOME_PATH:
+        profiling.install(PID_PATH, HOME_PATH)
 
     app.setApplicationName("VirtScreen")
     app.setWindowIcon(QIcon(ICON_PATH))
     os.environ["QT_QUICK_CONTROLS_STYLE"] = "Material"
 
-    # Register the Python type.  Its URI is 'People', it's v1.0 and the type
-    # will be called 'Person' in QML.
-    qmlRegisterType(DisplayProperty, 'VirtScreen.DisplayProperty', 1, 0, 'DisplayProperty')
-    qmlRegisterType(Backend, 'VirtScreen.Backend', 1, 0, 'Backend')
-    qmlRegisterType(Cursor, 'VirtScreen.Cursor', 1, 0, 'Cursor')
-    qmlRegisterType(Network, 'VirtScreen.Network', 1, 0, 'Network')
-
-    # Create a component factory and load the QML script.
-    engine = QQmlApplicationEngine()
-    engine.load(QUrl(MAIN_QML_PATH))
+    engine = create_engine()
     if not engine.rootObjects():
         dialog("Failed to load QML")
         sys.exit(1)
-    sys.exit(app.exec_())
+    # Python runs signal handlers (e.g. SIGTERM) only when it gets control
+    # back from Qt, so wake it up regularly.
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+    # A single loop dispatches both Qt events and asyncio callbacks
+    # (subprocess I/O, timers). It returns when the application quits.
     with loop:
-        loop.run_forever()
+        sys.exit(loop.run_forever())
 
 def main_cli(args: argparse.Namespace):
     loop = asyncio.get_event_loop()
@@ -185,16 +266,22 @@ def main_cli(args: argparse.Namespace):
     with open(CONFIG_PATH, 'r') as f:
         config = json.load(f)
     # Override settings from arguments
-    position = ''
+    position = config['virt']['position']
+    relative_to = config['virt']['relativeTo']
     if not args['auto']:
         args_virt = ['portrait', 'hidpi']
         for prop in args_virt:
             if args[prop]:
                 config['virt'][prop] = True
+        position = ''
+        relative_to = args['relative_to'] or ''
         args_position = ['left', 'right', 'above', 'below']
         tmp_args = {k: args[k] for k in args_position}
-        if not any(tmp_args.values()):
-            error("Choose a position relative to the primary monitor. (e.g. --left)")
+        if args['auto_position'] or (relative_to and not any(tmp_args.values())):
+            position = 'auto'
+        elif not any(tmp_args.values()):
+            error("Choose a position relative to the primary monitor. (e.g. --left)\n"
+                  "Or use --auto-position")
             sys.exit(1)
         for key, value in tmp_args.items():
             if value:
@@ -206,7 +293,7 @@ def main_cli(args: argparse.Namespace):
     backend.onError.connect(handle_error)
     backend.createVirtScreen(config['virt']['device'], config['virt']['width'],
                         config['virt']['height'], config['virt']['portrait'],
-                        config['virt']['hidpi'], position)
+                        config['virt']['hidpi'], position, relative_to)
     def handle_vnc_changed(state):
         if state is backend.VNCState.OFF:
             sys.exit(0)
@@ -214,5 +301,42 @@ def main_cli(args: argparse.Namespace):
     backend.startVNC(config['vnc']['port'])
     loop.run_forever()
 
+def main_restore(args: argparse.Namespace):
+    loop = asyncio.get_event_loop()
+    check_env(args, print, check_programs=False)
+    session = load_session()
+    if session is None:
+        error("No session to restore.\n"
+              "Start a VNC server once using GUI or --auto first.")
+        sys.exit(1)
+    # Independent checks run concurrently
+    preflight = Preflight().run(session)
+    if preflight.errors:
+        error('\n'.join(preflight.errors))
+        sys.exit(1)
+    backend = Backend(logger=print, xrandr=preflight.xrandr, config=preflight.config)
+    def handle_error(msg):
+        error(msg)
+        sys.exit(1)
+    backend.onError.connect(handle_error)
+    if not backend.restoreVirtScreen(session):
+        sys.exit(1)
+    reported = []  # Report the time only once
+    def handle_vnc_changed(state):
+        if state is backend.VNCState.WAITING and not reported:
+            # Time from login (process start) to a VNC server waiting for clients
+            age = process_age()
+            waiting = round(age * 1000) if age is not None else None
+            print(f"Session restored. VNC waiting {waiting} ms after start "
+                  f"(preflight {preflight.duration} ms).")
+            metrics.record('session_restore', waiting=waiting, preflight=preflight.duration)
+            reported.append(state)
+        if state is backend.VNCState.OFF:
+            sys.exit(0)
+    backend.onVncStateChanged.connect(handle_vnc_changed)
+    port = preflight.port if preflight.port is not None else session['vnc']['port']
+    backend.startVNC(port)
+    loop.run_forever()
+
 if __name__ == '__main__':
     main()
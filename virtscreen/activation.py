@@ -0,0 +1,56 @@
+"""Socket activation for on-demand VNC servers"""
+
+import socket
+import asyncio
+import logging
+from typing import Callable
+
+
+class SocketActivator:
+    """Listen on a TCP port and hand accepted connections to a callback.
+
+    The VNC server is then spawned per connection (e.g. x11vnc -inetd), so
+    nothing polls the framebuffer while no client is connected.
+    """
+
+    def __init__(self, port: int, accepted: Callable[[socket.socket], None]):
+        self.port: int = port
+        self.accepted: Callable[[socket.socket], None] = accepted
+        self.sock: socket.socket = None
+        self.loop: asyncio.AbstractEventLoop = None
+
+    def start(self) -> None:
+        """Start listening. Raises OSError when the port cannot be bound."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('', self.port))
+            sock.listen(5)
+        except OSError:
+            sock.close()
+            raise
+        sock.setblocking(False)
+        self.sock = sock
+        self.loop = asyncio.get_event_loop()
+        self.loop.add_reader(sock.fileno(), self._accept)
+        logging.info(f"Listening on port {self.port} for on-demand VNC.")
+
+    def _accept(self) -> None:
+        try:
+            conn, addr = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        logging.info(f"Accepted a connection from {addr[0]}:{addr[1]}")
+        # The child uses the socket as plain blocking stdio
+        conn.setblocking(True)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.accepted(conn)
+
+    def close(self) -> None:
+        """Stop listening. Already spawned servers are not affected."""
+        if self.sock is None:
+            return
+        if not self.loop.is_closed():  # e.g. called from atexit
+            self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
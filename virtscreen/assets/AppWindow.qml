@@ -5,6 +5,7 @@ import QtQuick.Layouts 1.3
 import QtQuick.Window 2.2
 
 import VirtScreen.Backend 1.0
+import VirtScreen.Cursor 1.0
 
 ApplicationWindow {
     id: window
@@ -12,6 +13,9 @@ ApplicationWindow {
     flags: Qt.FramelessWindowHint
     title: "VirtScreen"
 
+    // virtscreen.py Cursor class.
+    property Cursor cursor: Cursor {}
+
     property int theme_color: settings.theme_color
     Material.theme: Material.Light
     Material.primary: theme_color
@@ -213,6 +217,11 @@ ApplicationWindow {
                 placeholderText: "New Password";
                 echoMode: TextInput.Password;
             }
+            CheckBox {
+                id: viewOnlyCheckBox
+                text: "View only (x11vnc)"
+                enabled: backend.vncUsePassword
+            }
             Keys.onPressed: {
                 event.accepted = true;
                 if (event.key == Qt.Key_Return || event.key == Qt.Key_Enter) {
@@ -221,10 +230,14 @@ ApplicationWindow {
             }
         }
         onAccepted: {
-            backend.createVNCPassword(passwordFIeld.text);
+            backend.addVNCPassword(passwordFIeld.text, viewOnlyCheckBox.checked);
+            passwordFIeld.text = "";
+            viewOnlyCheckBox.checked = false;
+        }
+        onRejected: {
             passwordFIeld.text = "";
+            viewOnlyCheckBox.checked = false;
         }
-        onRejected: passwordFIeld.text = ""
     }
 
     Dialog {
@@ -315,9 +328,17 @@ ApplicationWindow {
         clip: true
 
         currentIndex: tabBar.currentIndex
+        // Pages are loaded when first shown
+        onCurrentIndexChanged: itemAt(currentIndex).active = true
 
         // in the same "qml" folder
-        DisplayPage {}
-        VncPage {}
+        Loader {
+            active: true
+            source: "DisplayPage.qml"
+        }
+        Loader {
+            active: false
+            source: "VncPage.qml"
+        }
     }
 }
@@ -12,7 +12,7 @@ Dialog {
     x: (window.width - width) / 2
     y: (window.width - height) / 2 
     width: popupWidth
-    height: 250
+    height: 350
 
     ColumnLayout {
         anchors.fill: parent
@@ -51,6 +51,69 @@ Dialog {
             }
         }
 
+        RowLayout {
+            anchors.left: parent.left
+            anchors.right: parent.right
+            Label { id: positionLabel; text: "Position"; }
+            ComboBox {
+                id: positionComboBox
+                anchors.left: positionLabel.right
+                anchors.right: parent.right
+                anchors.leftMargin: 88
+                textRole: "name"
+                model: [{"value": "", "name": "Preferred"},
+                        {"value": "auto", "name": "Automatic"},
+                        {"value": "left", "name": "Left"},
+                        {"value": "right", "name": "Right"},
+                        {"value": "above", "name": "Above"},
+                        {"value": "below", "name": "Below"}]
+                currentIndex: {
+                    for (var i = 0; i < model.length; i++) {
+                        if (model[i].value == settings.virt.position) {
+                            return i;
+                        }
+                    }
+                    return 0;
+                }
+                onActivated: function(index) {
+                    settings.virt.position = model[index].value;
+                }
+            }
+        }
+
+        RowLayout {
+            anchors.left: parent.left
+            anchors.right: parent.right
+            enabled: positionComboBox.currentIndex > 0
+            Label { id: relativeToLabel; text: "Next to"; }
+            ComboBox {
+                id: relativeToComboBox
+                anchors.left: relativeToLabel.right
+                anchors.right: parent.right
+                anchors.leftMargin: 93
+                displayText: currentIndex < 0 ? "Primary monitor" : currentText
+                textRole: "name"
+                model: backend.screens
+                currentIndex: {
+                    for (var i = 0; i < model.length; i++) {
+                        if (model[i].name == settings.virt.relativeTo) {
+                            return i;
+                        }
+                    }
+                    return -1;
+                }
+                onActivated: function(index) {
+                    settings.virt.relativeTo = model[index].primary ? "" : model[index].name;
+                }
+                delegate: ItemDelegate {
+                    width: relativeToComboBox.width
+                    text: modelData.name
+                    font.weight: relativeToComboBox.currentIndex === index ? Font.Bold : Font.Normal
+                    enabled: modelData.active && modelData.name != settings.virt.device
+                }
+            }
+        }
+
         Text {
             Layout.fillWidth: true
             font { pixelSize: 14 }
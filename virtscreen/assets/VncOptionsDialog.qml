@@ -12,7 +12,7 @@ Dialog {
     x: (window.width - width) / 2
     y: (window.width - height) / 2 
     width: popupWidth
-    height: 350
+    height: 450
 
     Component.onCompleted: {
         var request = new XMLHttpRequest();
@@ -31,49 +31,246 @@ Dialog {
         request.send();
     }
 
-    ColumnLayout {
+    ScrollView {
+        id: vncOptionsScrollView
         anchors.fill: parent
-        RowLayout {
-            TextField {
-                id: vncCustomArgsTextField
-                enabled: vncCustomArgsCheckbox.checked
-                Layout.fillWidth: true
-                placeholderText: "Custom x11vnc arguments"
-                onTextEdited: {
-                    settings.customX11vncArgs.value = text;
+        clip: true
+        contentWidth: availableWidth
+
+        ColumnLayout {
+            width: vncOptionsScrollView.availableWidth
+            RowLayout {
+                Label { text: "Server"; Layout.fillWidth: true }
+                ComboBox {
+                    id: vncServerComboBox
+                    Layout.minimumWidth: 200
+                    model: backend.vncServers
+                    currentIndex: model.indexOf(settings.vnc.server)
+                    onActivated: function(index) {
+                        settings.vnc.server = model[index];
+                    }
                 }
-                text: vncCustomArgsCheckbox.checked ? settings.customX11vncArgs.value : ""
             }
-            CheckBox {
-                id: vncCustomArgsCheckbox
-                checked: settings.customX11vncArgs.enabled
-                onToggled: {
-                    settings.customX11vncArgs.enabled = checked;
+            RowLayout {
+                enabled: settings.vnc.server == "x11vnc"
+                TextField {
+                    id: vncCustomArgsTextField
+                    enabled: vncCustomArgsCheckbox.checked
+                    Layout.fillWidth: true
+                    placeholderText: "Custom x11vnc arguments"
+                    onTextEdited: {
+                        settings.customX11vncArgs.value = text;
+                    }
+                    text: vncCustomArgsCheckbox.checked ? settings.customX11vncArgs.value : ""
+                }
+                CheckBox {
+                    id: vncCustomArgsCheckbox
+                    checked: settings.customX11vncArgs.enabled
+                    onToggled: {
+                        settings.customX11vncArgs.enabled = checked;
+                    }
                 }
             }
-        }
-        ColumnLayout {
-            enabled: !vncCustomArgsCheckbox.checked
-            Repeater {
-                id: vncOptionsRepeater
-                RowLayout {
-                    enabled: modelData.available
-                    Label {
-                        Layout.fillWidth: true
-                        text: modelData.description + ' (' + modelData.value + ')' 
-                    }
-                    Switch {
-                        checked: modelData.available ? modelData.enabled : false
-                        onCheckedChanged: {
-                            settings.x11vncOptions[modelData.value].enabled = checked;
+            ColumnLayout {
+                enabled: !vncCustomArgsCheckbox.checked && settings.vnc.server == "x11vnc"
+                Repeater {
+                    id: vncOptionsRepeater
+                    RowLayout {
+                        enabled: modelData.available
+                        Label {
+                            Layout.fillWidth: true
+                            text: modelData.description + ' (' + modelData.value + ')' 
+                        }
+                        Switch {
+                            checked: modelData.available ? modelData.enabled : false
+                            onCheckedChanged: {
+                                settings.x11vncOptions[modelData.value].enabled = checked;
+                            }
                         }
                     }
                 }
             }
-        }
-        RowLayout {
-            // Empty layout
-            Layout.fillHeight: true
+            RowLayout {
+                Label {
+                    Layout.fillWidth: true
+                    text: "Adapt quality to the network"
+                }
+                Switch {
+                    checked: settings.vnc.adaptiveQuality.enabled
+                    onCheckedChanged: {
+                        settings.vnc.adaptiveQuality.enabled = checked;
+                    }
+                }
+            }
+            RowLayout {
+                enabled: settings.vnc.adaptiveQuality.enabled
+                Label {
+                    Layout.fillWidth: true
+                    text: "Allow scaling down on slow networks"
+                }
+                Switch {
+                    checked: settings.vnc.adaptiveQuality.scaling
+                    onCheckedChanged: {
+                        settings.vnc.adaptiveQuality.scaling = checked;
+                    }
+                }
+            }
+            RowLayout {
+                Label {
+                    Layout.fillWidth: true
+                    text: "Slow down polling on a static screen"
+                }
+                Switch {
+                    checked: settings.vnc.activitySampling
+                    onCheckedChanged: {
+                        settings.vnc.activitySampling = checked;
+                    }
+                }
+            }
+            RowLayout {
+                Label {
+                    Layout.fillWidth: true
+                    text: "Scale HiDPI screens down on slow networks"
+                }
+                Switch {
+                    checked: settings.vnc.hidpiScaling
+                    onCheckedChanged: {
+                        settings.vnc.hidpiScaling = checked;
+                    }
+                }
+            }
+            RowLayout {
+                Label {
+                    Layout.fillWidth: true
+                    text: "Slow down when the client is idle"
+                }
+                Switch {
+                    checked: settings.vnc.idle.enabled
+                    onCheckedChanged: {
+                        settings.vnc.idle.enabled = checked;
+                    }
+                }
+            }
+            RowLayout {
+                enabled: settings.vnc.idle.enabled
+                Label {
+                    Layout.fillWidth: true
+                    text: "Idle after (minutes)"
+                }
+                SpinBox {
+                    value: Math.round(settings.vnc.idle.timeout / 60)
+                    from: 1
+                    to: 120
+                    stepSize: 1
+                    editable: true
+                    onValueModified: {
+                        settings.vnc.idle.timeout = value * 60;
+                    }
+                }
+            }
+            RowLayout {
+                Label {
+                    Layout.fillWidth: true
+                    text: "Restart the server when it hangs"
+                }
+                Switch {
+                    checked: settings.vnc.watchdog.enabled
+                    onCheckedChanged: {
+                        settings.vnc.watchdog.enabled = checked;
+                    }
+                }
+            }
+            RowLayout {
+                enabled: settings.vnc.watchdog.enabled
+                Label {
+                    Layout.fillWidth: true
+                    text: "Recovery"
+                }
+                ComboBox {
+                    textRole: "name"
+                    model: [{"value": "restart", "name": "Restart server"},
+                            {"value": "recreate", "name": "Also recreate screen"}]
+                    currentIndex: settings.vnc.watchdog.recovery == "recreate" ? 1 : 0
+                    onActivated: function(index) {
+                        settings.vnc.watchdog.recovery = model[index].value;
+                    }
+                }
+            }
+            GroupBox {
+                title: "Resource limits"
+                Layout.fillWidth: true
+                ColumnLayout {
+                    anchors.left: parent.left
+                    anchors.right: parent.right
+                    RowLayout {
+                        Label { text: "CPU cores"; Layout.fillWidth: true }
+                        TextField {
+                            placeholderText: "All (e.g. 0-1)"
+                            text: settings.vnc.resources.cpuAffinity
+                            onTextEdited: {
+                                settings.vnc.resources.cpuAffinity = text;
+                            }
+                        }
+                    }
+                    RowLayout {
+                        Label { text: "Nice level"; Layout.fillWidth: true }
+                        SpinBox {
+                            value: settings.vnc.resources.nice
+                            from: 0
+                            to: 19
+                            stepSize: 1
+                            editable: true
+                            onValueModified: {
+                                settings.vnc.resources.nice = value;
+                            }
+                        }
+                    }
+                    RowLayout {
+                        Label { text: "I/O priority"; Layout.fillWidth: true }
+                        ComboBox {
+                            textRole: "name"
+                            model: [{"value": "", "name": "Default"},
+                                    {"value": "best-effort:7", "name": "Low"},
+                                    {"value": "idle", "name": "Idle"}]
+                            currentIndex: {
+                                for (var i = 0; i < model.length; i++) {
+                                    if (model[i].value == settings.vnc.resources.ionice) {
+                                        return i;
+                                    }
+                                }
+                                return 0;
+                            }
+                            onActivated: function(index) {
+                                settings.vnc.resources.ionice = model[index].value;
+                            }
+                        }
+                    }
+                    RowLayout {
+                        Label { text: "CPU quota"; Layout.fillWidth: true }
+                        TextField {
+                            placeholderText: "None (e.g. 50%)"
+                            text: settings.vnc.resources.cpuQuota
+                            onTextEdited: {
+                                settings.vnc.resources.cpuQuota = text;
+                            }
+                        }
+                    }
+                    RowLayout {
+                        Label { text: "Memory limit"; Layout.fillWidth: true }
+                        TextField {
+                            placeholderText: "None (e.g. 512M)"
+                            text: settings.vnc.resources.memoryMax
+                            onTextEdited: {
+                                settings.vnc.resources.memoryMax = text;
+                            }
+                        }
+                    }
+                }
+            }
+            RowLayout {
+                // Empty layout
+                Layout.fillHeight: true
+            }
         }
     }
     onAccepted: {}
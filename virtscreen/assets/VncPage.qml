@@ -33,20 +33,25 @@ ColumnLayout {
                 }
             }
             RowLayout {
-                Label { text: "Password"; Layout.fillWidth: true }
-                Button {
-                    text: "Delete"
-                    font.capitalization: Font.MixedCase
-                    highlighted: false
-                    enabled: backend.vncUsePassword
-                    onClicked: backend.deleteVNCPassword()
+                Label { text: "Alternative ports"; Layout.fillWidth: true }
+                SpinBox {
+                    value: settings.vnc.portRange
+                    from: 0
+                    to: 100
+                    stepSize: 1
+                    editable: true
+                    onValueModified: {
+                        settings.vnc.portRange = value;
+                    }
                 }
-                Button {
-                    text: "New"
-                    font.capitalization: Font.MixedCase
-                    highlighted: true
-                    enabled: !backend.vncUsePassword
-                    onClicked: passwordDialog.open()
+            }
+            RowLayout {
+                Label { text: "Start server on connection"; Layout.fillWidth: true }
+                Switch {
+                    checked: settings.vnc.onDemand
+                    onCheckedChanged: {
+                        settings.vnc.onDemand = checked;
+                    }
                 }
             }
             RowLayout {
@@ -62,6 +67,35 @@ ColumnLayout {
             }
         }
     }
+    GroupBox {
+        // Outside of the server settings: x11vnc takes changes while running
+        title: "Passwords"
+        Layout.fillWidth: true
+        RowLayout {
+            anchors.left: parent.left
+            anchors.right: parent.right
+            ComboBox {
+                id: passwordList
+                Layout.fillWidth: true
+                model: backend.vncPasswords
+                enabled: count > 0
+                displayText: count > 0 ? currentText : "No password"
+            }
+            Button {
+                text: "Delete"
+                font.capitalization: Font.MixedCase
+                highlighted: false
+                enabled: passwordList.count > 0
+                onClicked: backend.removeVNCPassword(passwordList.currentIndex)
+            }
+            Button {
+                text: "New"
+                font.capitalization: Font.MixedCase
+                highlighted: true
+                onClicked: passwordDialog.open()
+            }
+        }
+    }
     RowLayout {
         Layout.fillWidth: true
         Layout.margins: margin / 2
@@ -2,9 +2,7 @@ import QtQuick 2.10
 
 import Qt.labs.platform 1.0
 
-import VirtScreen.DisplayProperty 1.0
 import VirtScreen.Backend 1.0
-import VirtScreen.Cursor 1.0
 
 Item {
     property alias window: mainLoader.item
@@ -19,7 +17,8 @@ Item {
     function createVirtScreen () {
         backend.createVirtScreen(settings.virt.device, settings.virt.width,
                                 settings.virt.height, settings.virt.portrait,
-                                settings.virt.hidpi);
+                                settings.virt.hidpi, settings.virt.position,
+                                settings.virt.relativeTo);
     }
 
     function startVNC () {
@@ -50,6 +49,7 @@ Item {
     // virtscreen.py backend.
     Backend {
         id: backend
+        objectName: "backend"
         onVncStateChanged: {
             if (backend.vncState == Backend.ERROR) {
                 autostart = false;
@@ -57,11 +57,6 @@ Item {
         }
     }
 
-    // virtscreen.py Cursor class.
-    Cursor {
-        id: cursor
-    }
-
     // Timer object and function
     Timer {
         id: timer
@@ -96,9 +91,9 @@ Item {
         onStatusChanged: {
             console.log("Loader Status Changed.", status);
             if (status == Loader.Null) {
+                // Free the JS objects and the cached components of the window
                 gc();
-                // This cause memory leak at this moment.
-                // backend.clearCache();
+                Qt.callLater(backend.clearCache);
             }
         }
 
@@ -109,26 +104,31 @@ Item {
                     mainLoader.active = false;
                 }
             });
-            // Move window to the corner of the primary display
-            var cursor_x = (cursor.x / window.screen.devicePixelRatio) - window.screen.virtualX;
-            var cursor_y = (cursor.y / window.screen.devicePixelRatio) - window.screen.virtualY;
-            var x_mid = window.screen.width / 2;
-            var y_mid = window.screen.height / 2;
-            var x = window.screen.width - window.width; //(cursor_x > x_mid)? width - window.width : 0;
-            var y = (cursor_y > y_mid)? window.screen.height - window.height : 0;
-            x += window.screen.virtualX;
-            y += window.screen.virtualY;
-            window.x = x;
-            window.y = y;
-            window.show();
-            window.raise();
-            window.requestActivate();
+            showWindow();
         }
     }
 
+    function showWindow () {
+        // Move window to the corner of the primary display. Read the screen
+        // and the cursor once, since each read allocates in the JS engine.
+        var screen = window.screen;
+        var cursor_y = (window.cursor.y / screen.devicePixelRatio) - screen.virtualY;
+        var y_mid = screen.height / 2;
+        window.x = screen.virtualX + screen.width - window.width;
+        window.y = screen.virtualY + ((cursor_y > y_mid)? screen.height - window.height : 0);
+        window.show();
+        window.raise();
+        window.requestActivate();
+    }
+
+    function openWindow () {
+        mainLoader.active = true;
+    }
+
     // Sytray Icon
     SystemTrayIcon {
         id: sysTrayIcon
+        objectName: "sysTrayIcon"
         iconSource: backend.vncState == Backend.CONNECTED ? "../icon/systray_tablet_on.png" :
                     backend.virtScreenCreated ? "../icon/systray_tablet_off.png" :
                     "../icon/systray_no_tablet.png"
@@ -153,7 +153,7 @@ Item {
             timer.setTimeout (function() {
                 sysTrayIcon.clicked = false;
             }, 200);
-            mainLoader.active = true;
+            openWindow();
         }
 
         menu: Menu {
@@ -162,8 +162,9 @@ Item {
                 text: !backend.virtScreenCreated ? "Enable Virtual Screen first" :
                       backend.vncState == Backend.OFF ? "Turn on VNC Server in the VNC tab" :
                       backend.vncState == Backend.ERROR ? "Error occurred" :
-                      backend.vncState == Backend.WAITING ? "VNC Server is waiting for a client..." :
-                      backend.vncState == Backend.CONNECTED ? "Connected" :
+                      backend.vncState == Backend.WAITING ? "VNC Server is waiting on port " + backend.vncPort + "..." :
+                      backend.vncState == Backend.CONNECTED ? (backend.vncClientIdle ? "Connected, idle" : "Connected")
+                                                              + " (port " + backend.vncPort + ")" :
                       "Server state error!"
             }
             MenuItem {
@@ -0,0 +1,1033 @@
+"""Benchmark scenarios
+
+Run all scenarios, or some of them by name:
+
+    python -m virtscreen.bench [scenario ...]
+
+`virtscreen bench` runs the standard scenarios several times, compares them
+with previous runs of the same machine and keeps the history in
+~/.config/virtscreen/bench_history.jsonl.
+
+Each scenario returns a flat dict of measurements, e.g. bytes per frame or
+milliseconds, and works offline: scenarios run inside a Simulator, so
+xrandr, cvt and x11vnc are simulated and no X server is needed. The xvfb
+scenario is the exception: it compares the real servers on Xvfb, and is
+skipped unless Xvfb is installed.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import ctypes
+import shutil
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from ctypes.util import find_library
+from typing import Callable, Dict, List, Tuple
+
+from .simulate import Simulator
+
+# Registered scenarios: name -> function(simulator) returning {measurement: value}
+SCENARIOS: Dict[str, Callable[[Simulator], Dict[str, float]]] = {}
+
+
+def scenario(name: str):
+    """Register a benchmark scenario"""
+    def decorator(func: Callable[[Simulator], Dict[str, float]]):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+class Regression(Exception):
+    """Raised by a scenario whose measurements exceed its limits"""
+
+    def __init__(self, message: str, results: Dict[str, float]):
+        super(Regression, self).__init__(message)
+        self.results: Dict[str, float] = results
+
+
+class Unavailable(Exception):
+    """Raised by a scenario whose programs are not installed"""
+
+
+def run(names: List[str] = None, failures: Dict[str, str] = None) -> Dict[str, Dict[str, float]]:
+    """Run scenarios and return their measurements by scenario name.
+    Raises KeyError for an unknown scenario.
+
+    Arguments:
+        names {List[str]} -- scenarios to run (default: all)
+        failures {Dict[str, str]} -- filled with regressions by scenario name
+    """
+    samples = collect(names, 1, failures)
+    return {name: {key: values[0] for key, values in results.items()}
+            for name, results in samples.items()}
+
+
+def collect(names: List[str] = None, repeat: int = 1,
+            failures: Dict[str, str] = None) -> Dict[str, Dict[str, List[float]]]:
+    """Run scenarios several times and return all samples of each
+    measurement. Scenarios missing an optional dependency or program are
+    skipped.
+    Raises KeyError for an unknown scenario.
+
+    Arguments:
+        names {List[str]} -- scenarios to run (default: all)
+        repeat {int} -- number of runs of each scenario
+        failures {Dict[str, str]} -- filled with regressions by scenario name
+    """
+    names = names or list(SCENARIOS)
+    funcs = [SCENARIOS[name] for name in names]
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    # virtscreen.path reads $XDG_CONFIG_HOME on import, so a single
+    # simulator is used for all scenarios
+    with Simulator() as sim:
+        for name, func in zip(names, funcs):
+            for _ in range(repeat):
+                sim.configure(topology='laptop', latency={}, failures={},
+                              x11vnc_log='connect_disconnect', sleep_scale=0)
+                try:
+                    results = func(sim)
+                except (ImportError, Unavailable) as e:
+                    logging.warning(f"Skipping {name}: {e}")
+                    break
+                except Regression as e:
+                    results = e.results
+                    if failures is not None:
+                        failures[name] = str(e)
+                for key, value in results.items():
+                    samples.setdefault(name, {}).setdefault(key, []).append(value)
+    return samples
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _run_until(loop: asyncio.AbstractEventLoop, done: Callable[[], bool],
+               timeout: float = 10) -> None:
+    """Run the event loop until done() is true. Raises TimeoutError."""
+    async def wait():
+        deadline = time.monotonic() + timeout
+        while not done():
+            if time.monotonic() > deadline:
+                raise TimeoutError("Scenario timed out")
+            await asyncio.sleep(0.001)
+    loop.run_until_complete(wait())
+
+
+# Screen parsing and create/delete flows
+PARSE_ROUNDS = 200
+FLOW_ROUNDS = 3
+
+
+@scenario('xrandr_parse')
+def bench_xrandr_parse(sim: Simulator) -> Dict[str, float]:
+    """Time of parsing the xrandr output alone, and of a query including
+    running xrandr, on a desktop with many outputs"""
+    from .xrandr import XRandR
+    sim.configure(topology='desktop')
+    xrandr = XRandR()
+    output = xrandr.run('xrandr')
+    start = time.perf_counter()
+    for _ in range(PARSE_ROUNDS):
+        xrandr._parse_screens(output)
+    parse = (time.perf_counter() - start) / PARSE_ROUNDS
+    start = time.perf_counter()
+    for _ in range(FLOW_ROUNDS):
+        xrandr._update_screens()
+    query = (time.perf_counter() - start) / FLOW_ROUNDS
+    return {'parse_ms': _ms(parse), 'query_ms': _ms(query)}
+
+
+@scenario('create_delete')
+def bench_create_delete(sim: Simulator) -> Dict[str, float]:
+    """Creating and deleting the virtual screen, without the settle delay"""
+    from .xrandr import XRandR
+    results = {}
+    for pos in ('right', 'auto'):
+        create = delete = 0
+        calls = len(sim.calls())
+        for _ in range(FLOW_ROUNDS):
+            xrandr = XRandR()
+            xrandr.virt_name = 'VIRTUAL1'
+            start = time.perf_counter()
+            xrandr.create_virtual_screen(1368, 1024, pos=pos)
+            create += time.perf_counter() - start
+            start = time.perf_counter()
+            xrandr.delete_virtual_screen()
+            delete += time.perf_counter() - start
+        results[f"{pos}_create_ms"] = _ms(create / FLOW_ROUNDS)
+        results[f"{pos}_delete_ms"] = _ms(delete / FLOW_ROUNDS)
+        results[f"{pos}_commands"] = (len(sim.calls()) - calls) / FLOW_ROUNDS
+    return results
+
+
+# Lines of the simulated servers at which a client connects and leaves
+VNC_STATE_LINES = {'x11vnc': ('Got connection', 'client_count: 0'),
+                   'x0vncserver': ('Connections: accepted', 'Connections: closed')}
+
+
+_qt_app = None  # Kept alive for the Qt event loops of the scenarios
+
+
+def _qt_loop() -> asyncio.AbstractEventLoop:
+    """A new qasync event loop driving offscreen Qt, like the loop of
+    main_gui. Raises ImportError without PyQt5 or qasync."""
+    global _qt_app
+    _offscreen_qt()
+    from PyQt5.QtWidgets import QApplication
+    from qasync import QEventLoop
+    _qt_app = QApplication.instance() or QApplication([sys.argv[0]])
+    return QEventLoop(_qt_app)
+
+
+@scenario('vnc_state')
+def bench_vnc_state(sim: Simulator) -> Dict[str, float]:
+    """VNC state transitions of the backend with each simulated VNC server:
+    time to start, latency from a server log line to onVncStateChanged, and
+    time to shut down. Keys of x11vnc, the default server, are unprefixed.
+    x11vnc runs again on the Qt event loop of the GUI (keys prefixed with
+    qt_), when PyQt5 and qasync are installed."""
+    from .config import load_config, save_config
+    config, _ = load_config()
+    saved = config['vnc']['server']
+    runs = [(server, f"{server}_" if server != 'x11vnc' else '', asyncio.new_event_loop)
+            for server in VNC_STATE_LINES]
+    try:
+        _qt_loop().close()
+        runs.append(('x11vnc', 'qt_', _qt_loop))
+    except ImportError as e:
+        logging.warning(f"Skipping vnc_state on the Qt event loop: {e}")
+    results = {}
+    try:
+        for server, prefix, new_loop in runs:
+            config['vnc']['server'] = server
+            save_config(config)
+            for key, value in _vnc_state(sim, *VNC_STATE_LINES[server], new_loop).items():
+                results[prefix + key] = value
+    finally:
+        config['vnc']['server'] = saved
+        save_config(config)
+    return results
+
+
+def _vnc_state(sim: Simulator, connection_line: str, disconnection_line: str,
+               new_loop: Callable[[], asyncio.AbstractEventLoop]) -> Dict[str, float]:
+    from .qt_backend import Backend
+    from .port import find_free_port
+    loop = new_loop()
+    asyncio.set_event_loop(loop)
+    backend = Backend(logger=logging.info)
+    changes = []
+    backend.onVncStateChanged.connect(lambda state: changes.append((time.time(), state)))
+    backend.createVirtScreen('VIRTUAL1', 1368, 1024, False, False, '', '')
+    try:
+        start = time.time()
+        backend.startVNC(find_free_port(5900, 100))
+        states = lambda: [state for _, state in changes]
+        _run_until(loop, lambda: states()[-2:] == [Backend.VNCState.CONNECTED,
+                                                   Backend.VNCState.WAITING])
+        # Lines of this run only, when the scenario is repeated
+        emitted = [(t, line) for t, line in sim.emitted() if t >= start]
+        connection = next(t for t, line in emitted if connection_line in line)
+        disconnection = next(t for t, line in emitted if disconnection_line in line)
+        waiting, connected, disconnected = (t for t, _ in changes[-3:])
+        stop = time.time()
+        backend.stopVNC()
+        _run_until(loop, lambda: states()[-1] == Backend.VNCState.OFF)
+        stopped = changes[-1][0]
+    finally:
+        if backend.vncState is not Backend.VNCState.OFF:
+            backend.stopVNC(force=True)
+        backend.deleteVirtScreen()
+        backend._reconcileHandle.cancel()
+        loop.close()
+    return {'start_ms': _ms(waiting - start),
+            'connected_latency_ms': _ms(connected - connection),
+            'disconnected_latency_ms': _ms(disconnected - disconnection),
+            'shutdown_ms': _ms(stopped - stop)}
+
+
+WATCHDOG_TIMEOUT = 2  # seconds
+
+
+@scenario('watchdog')
+def bench_watchdog(sim: Simulator) -> Dict[str, float]:
+    """A simulated x11vnc hangs after a client connects: time from the hang
+    to killing it, including the watchdog timeout, and time to restart it"""
+    from .qt_backend import Backend
+    from .port import find_free_port
+    from .config import load_config, save_config
+    sim.configure(x11vnc_log='connect_hang')
+    config, _ = load_config()
+    saved = json.loads(json.dumps(config['vnc']['watchdog']))
+    config['vnc']['watchdog'].update(enabled=True, timeout=WATCHDOG_TIMEOUT, probe=True,
+                                     recovery='restart')
+    save_config(config)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    backend = Backend(logger=logging.info)
+    changes = []
+    backend.onVncStateChanged.connect(lambda state: changes.append((time.time(), state)))
+    backend.createVirtScreen('VIRTUAL1', 1368, 1024, False, False, '', '')
+    try:
+        start = time.time()
+        backend.startVNC(find_free_port(5900, 100))
+        states = lambda: [state for _, state in changes]
+        _run_until(loop, lambda: states()[-3:] == [Backend.VNCState.OFF,
+                                                   Backend.VNCState.WAITING,
+                                                   Backend.VNCState.CONNECTED],
+                   timeout=WATCHDOG_TIMEOUT + 10)
+        hang = next(t for t, line in sim.emitted() if t >= start and 'client_count: 1' in line)
+        killed, restarted = changes[-3][0], changes[-2][0]
+        backend.stopVNC()
+        _run_until(loop, lambda: states()[-1] == Backend.VNCState.OFF)
+    finally:
+        if backend.vncState is not Backend.VNCState.OFF:
+            backend.stopVNC(force=True)
+        backend.deleteVirtScreen()
+        backend._reconcileHandle.cancel()
+        loop.close()
+        config['vnc']['watchdog'] = saved
+        save_config(config)
+    return {'detect_ms': _ms(killed - hang), 'restart_ms': _ms(restarted - killed)}
+
+
+# Resource limits of the VNC server
+RESOURCES_DURATION = 1.0  # seconds of each configuration
+RESOURCES_TIMER = 0.001  # seconds slept by the desktop between frames
+
+
+def _busy_server(duration: float) -> None:
+    """Stand-in of a VNC server encoding frames as fast as it can. Prints
+    the number of frames. Run by the resources scenario in child processes."""
+    frame = bytes(range(256)) * 4096  # 1 MB
+    frames = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        zlib.compress(frame, 1)
+        frames += 1
+    print(frames)
+
+
+@scenario('resources')
+def bench_resources(sim: Simulator) -> Dict[str, float]:
+    """A server busy on every CPU next to a desktop drawing frames on a 1 ms
+    timer, with the resource limits of vnc.resources: frame rate of the
+    server, and frame rate and timer overshoot (p99) of the desktop.
+    cgroup limits are left out, since they need a systemd user session."""
+    from .resources import ResourceLimits
+    cpus = sorted(os.sched_getaffinity(0))
+    configurations = {'default': ResourceLimits(), 'nice': ResourceLimits(nice=19)}
+    if len(cpus) > 1:
+        # Keep the server off the CPU of the desktop
+        configurations['affinity'] = ResourceLimits(cpu_affinity=','.join(map(str, cpus[1:])))
+        configurations['nice_affinity'] = ResourceLimits(
+            cpu_affinity=','.join(map(str, cpus[1:])), nice=19)
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join(filter(None, [package, os.environ.get('PYTHONPATH')])))
+    results = {}
+    affinity = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, {cpus[0]})
+    try:
+        for name, limits in configurations.items():
+            servers = [subprocess.Popen(
+                [sys.executable, '-c', 'from virtscreen.bench import _busy_server; '
+                 f"_busy_server({RESOURCES_DURATION})"],
+                env=env, stdout=subprocess.PIPE, preexec_fn=limits.preexec_fn)
+                for _ in cpus]
+            time.sleep(0.1)  # Let the servers start
+            overshoots = []
+            end = time.monotonic() + RESOURCES_DURATION - 0.2
+            while time.monotonic() < end:
+                start = time.perf_counter()
+                time.sleep(RESOURCES_TIMER)
+                overshoots.append(time.perf_counter() - start - RESOURCES_TIMER)
+            frames = sum(int(server.communicate()[0]) for server in servers)
+            overshoots.sort()
+            results[f"{name}_server_fps"] = round(frames / RESOURCES_DURATION, 1)
+            results[f"{name}_desktop_fps"] = round(
+                len(overshoots) / (RESOURCES_DURATION - 0.2), 1)
+            results[f"{name}_desktop_p99_ms"] = _ms(overshoots[int(len(overshoots) * 0.99)])
+    finally:
+        os.sched_setaffinity(0, affinity)
+    return results
+
+
+# HiDPI transport
+HIDPI_LOGICAL_SIZE = (1368, 1024)  # Virtual screen size before doubling
+HIDPI_FRAMES = 20
+HIDPI_DIRTY = 0.25  # Fraction of the screen height updated in each frame
+
+
+def _text_frame(np, rng, width: int, height: int, glyph: int):
+    """A synthetic desktop: dark glyphs of glyph x 2*glyph pixels on a light
+    background, as in a text editor or terminal."""
+    cols, rows = width // glyph, height // (2 * glyph)
+    cells = rng.random((rows, cols)) < 0.5
+    pattern = rng.random((rows, cols, 2 * glyph, glyph)) < 0.3
+    ink = (pattern & cells[:, :, None, None]).transpose(0, 2, 1, 3)
+    ink = ink.reshape(rows * 2 * glyph, cols * glyph)
+    frame = np.full((height, width, 4), 0xf0, dtype=np.uint8)
+    frame[:ink.shape[0], :ink.shape[1]][ink] = (0x20, 0x20, 0x20, 0)
+    return frame
+
+
+def _scale(np, frame, factor: float):
+    """Box filter scaling like x11vnc -scale with pixel blending.
+    Sums fit in uint16 for factors down to 1/16."""
+    if factor == 1:
+        return frame
+    height, width = frame.shape[:2]
+    rows = (np.arange(int(height * factor)) / factor).astype(np.intp)
+    cols = (np.arange(int(width * factor)) / factor).astype(np.intp)
+    summed = np.add.reduceat(np.add.reduceat(frame.astype(np.uint16), rows, axis=0),
+                             cols, axis=1)
+    counts = (np.diff(np.append(rows, height))[:, None]
+              * np.diff(np.append(cols, width))[None, :])
+    return (summed // counts[:, :, None]).astype(np.uint8)
+
+
+@scenario('hidpi_synthetic')
+def bench_hidpi_synthetic(sim: Simulator) -> Dict[str, float]:
+    """Synthetic estimate of bytes per frame and CPU time of sending a HiDPI
+    screen at full size and scaled down. No VNC server is involved: updated
+    regions are scaled with a box filter like x11vnc -scale and compressed
+    with zlib, a stand-in for the ZRLE and Tight encodings. The xvfb
+    scenario measures x11vnc -scale itself."""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    width, height = HIDPI_LOGICAL_SIZE[0] * 2, HIDPI_LOGICAL_SIZE[1] * 2
+    dirty = int(height * HIDPI_DIRTY)
+    # The same sequence of updates for every scale
+    updates = [_text_frame(np, rng, width, dirty, 16) for _ in range(HIDPI_FRAMES)]
+    results = {}
+    for factor in (1, 0.75, 0.5):
+        sent = 0
+        start = time.process_time()
+        for update in updates:
+            sent += len(zlib.compress(_scale(np, update, factor).tobytes(), 1))
+        cpu = (time.process_time() - start) * 1000
+        key = f"synthetic_scale_{factor}"
+        results[f"{key}_bytes_per_frame"] = round(sent / HIDPI_FRAMES)
+        results[f"{key}_cpu_ms_per_frame"] = round(cpu / HIDPI_FRAMES, 3)
+    return results
+
+
+# Window lifecycle
+WINDOW_CYCLES = 300
+WINDOW_WARMUP = 30  # Cycles before the baseline, filling caches
+WINDOW_RSS_LIMIT = 1024  # KB of growth allowed over all cycles after the warmup
+
+
+def _offscreen_qt() -> None:
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    os.environ['QT_QUICK_BACKEND'] = 'software'  # No OpenGL needed
+    os.environ['QT_QUICK_CONTROLS_STYLE'] = 'Material'
+
+
+def _rss() -> int:
+    """Resident set size of this process in KB"""
+    with open('/proc/self/statm', 'r') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+@scenario('window_rss')
+def bench_window_rss(sim: Simulator) -> Dict[str, float]:
+    """Open and close the main window repeatedly under offscreen Qt and
+    check that the RSS stays flat"""
+    _offscreen_qt()
+    from PyQt5.QtCore import QObject, QMetaObject
+    from PyQt5.QtWidgets import QApplication
+    from qasync import QEventLoop
+    from .__main__ import create_engine
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    engine = create_engine()
+    root = engine.rootObjects()[0]
+
+    def cycle():
+        QMetaObject.invokeMethod(root, 'openWindow')
+        loop.run_until_complete(asyncio.sleep(0.005))
+        QMetaObject.invokeMethod(root.property('window'), 'hide')
+        loop.run_until_complete(asyncio.sleep(0.005))
+
+    backend = root.findChild(QObject, 'backend')
+    try:
+        start = time.perf_counter()
+        for _ in range(WINDOW_WARMUP):
+            cycle()
+        baseline = _rss()
+        for _ in range(WINDOW_CYCLES - WINDOW_WARMUP):
+            cycle()
+        end = _rss()
+        duration = time.perf_counter() - start
+    finally:
+        if backend is not None:
+            backend._reconcileHandle.cancel()
+        del root
+        del engine
+        loop.close()
+    results = {'rss_baseline_kb': baseline, 'rss_end_kb': end,
+               'rss_growth_kb': end - baseline,
+               'cycle_ms': _ms(duration / WINDOW_CYCLES)}
+    if end - baseline > WINDOW_RSS_LIMIT:
+        raise Regression(f"RSS grew by {end - baseline} KB over "
+                         f"{WINDOW_CYCLES - WINDOW_WARMUP} window cycles", results)
+    return results
+
+
+# Startup
+STARTUP_ROUNDS = 4  # The first one is cold, without the QML disk cache
+
+
+def _startup_probe() -> None:
+    """Start the GUI like main_gui and print the times of the startup
+    steps as JSON. Run by the startup scenario in a fresh interpreter."""
+    times = {'start': time.time()}
+    _offscreen_qt()
+    from PyQt5.QtCore import Qt, QObject, QMetaObject
+    from PyQt5.QtWidgets import QApplication
+    from qasync import QEventLoop
+    from .__main__ import create_engine
+    times['imported'] = time.time()
+    QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
+    app = QApplication([sys.argv[0]])
+    app.setApplicationName("VirtScreen")
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    engine = create_engine()
+    root = engine.rootObjects()[0]
+    tray = root.findChild(QObject, 'sysTrayIcon')
+    if not tray.property('visible'):
+        _run_until(loop, lambda: tray.property('visible'))
+    times['tray_visible'] = time.time()
+    # Work deferred until the tray icon is shown
+    loop.run_until_complete(asyncio.sleep(0.1))
+    times['window_requested'] = time.time()
+    QMetaObject.invokeMethod(root, 'openWindow')
+    _run_until(loop, lambda: (root.property('window') is not None
+                              and root.property('window').property('visible')))
+    times['window_visible'] = time.time()
+    print(json.dumps(times))
+
+
+@scenario('startup')
+def bench_startup(sim: Simulator) -> Dict[str, float]:
+    """Time from spawning the GUI to a visible tray icon under offscreen Qt,
+    and from the first click to a visible window. The first round starts
+    without the QML disk cache, like the first run after installation."""
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, XDG_CACHE_HOME=os.path.join(sim.path, 'cache'),
+               PYTHONPATH=os.pathsep.join(filter(None, [package, os.environ.get('PYTHONPATH')])))
+    rounds = []
+    for _ in range(STARTUP_ROUNDS):
+        spawned = time.time()
+        output = subprocess.run([sys.executable, '-c', 'from virtscreen.bench import '
+                                 '_startup_probe; _startup_probe()'], env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        times = json.loads(output.stdout.decode('utf-8').splitlines()[-1])
+        rounds.append({'tray_visible_ms': _ms(times['tray_visible'] - spawned),
+                       'import_ms': _ms(times['imported'] - times['start']),
+                       'qml_ms': _ms(times['tray_visible'] - times['imported']),
+                       'window_open_ms': _ms(times['window_visible'] - times['window_requested'])})
+    results = {f"cold_{key}": value for key, value in rounds[0].items()}
+    for key in rounds[0]:
+        results[f"warm_{key}"] = round(sum(r[key] for r in rounds[1:]) / (len(rounds) - 1), 3)
+    return results
+
+
+# Built-in RFB server
+RFB_FRAMES = 30
+RFB_ENCODINGS = {'raw': 0, 'zlib': 6, 'zrle': 16}
+RFB_PASSWORD = 'bench'
+
+
+class _FrameSource:
+    """Stand-in of ScreenCapture replaying frames into a reused buffer"""
+
+    def __init__(self, frames: list):
+        self.frames = frames
+        self.index: int = 0
+        self.height, self.width = frames[0].shape[:2]
+        self.buffer = frames[0].copy()
+
+    def grab(self):
+        self.buffer[...] = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return self.buffer
+
+    def close(self) -> None:
+        pass
+
+
+async def _rfb_session(port: int, encoding: int, frames: int,
+                       change: Callable[[int], None] = None) -> List[Tuple[int, float]]:
+    """Connect, authenticate and request updates like a VNC client.
+    Returns bytes and seconds of each framebuffer update, from the request
+    to the end of the update. change(i) updates the screen before the
+    request of each incremental update i, when the server does not replay
+    frames itself."""
+    from .vncauth import challenge_response
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    await reader.readexactly(12)
+    writer.write(b"RFB 003.008\n")
+    await reader.readexactly((await reader.readexactly(1))[0])
+    writer.write(b'\x02')  # VNC authentication
+    writer.write(challenge_response(RFB_PASSWORD, await reader.readexactly(16)))
+    if struct.unpack('>I', await reader.readexactly(4))[0] != 0:
+        raise RuntimeError("RFB authentication failed")
+    writer.write(b'\x01')  # Shared
+    width, height = struct.unpack('>HH', await reader.readexactly(4))
+    await reader.readexactly(16)  # Pixel format
+    await reader.readexactly(struct.unpack('>I', await reader.readexactly(4))[0])
+    writer.write(struct.pack('>BxHi', 2, 1, encoding))
+    updates = []
+    for i in range(frames):
+        if change is not None and i > 0:
+            change(i)
+        start = time.perf_counter()
+        writer.write(struct.pack('>BBHHHH', 3, i > 0, 0, 0, width, height))
+        count, = struct.unpack('>xxH', await reader.readexactly(4))
+        received = 4
+        for _ in range(count):
+            _, _, w, h, _ = struct.unpack('>HHHHi', await reader.readexactly(12))
+            received += 12
+            if encoding == 0:
+                length = w * h * 4
+            else:
+                length, = struct.unpack('>I', await reader.readexactly(4))
+                received += 4
+            await reader.readexactly(length)
+            received += length
+        updates.append((received, time.perf_counter() - start))
+    writer.close()
+    return updates
+
+
+@scenario('rfb')
+def bench_rfb(sim: Simulator) -> Dict[str, float]:
+    """Built-in RFB server over loopback with a replayed HiDPI desktop:
+    time of finding dirty tiles, time to the first (full) frame, and time
+    and bytes per update of each encoding while typing (one glyph per frame)
+    and scrolling (one line of text per frame)"""
+    import numpy as np
+    from .rfb import RFBServer, dirty_tiles
+    from .port import find_free_port
+    rng = np.random.default_rng(0)
+    width, height = HIDPI_LOGICAL_SIZE[0] * 2, HIDPI_LOGICAL_SIZE[1] * 2
+    base = _text_frame(np, rng, width, height, 16)
+    typing = []
+    for i in range(RFB_FRAMES):
+        frame = base.copy()
+        col, row = (i * 16) % width, 32 * (i * 16 // width)
+        frame[row:row + 32, col:col + 16] = (0x20, 0x20, 0x20, 0)
+        typing.append(frame)
+    scrolling = [np.roll(base, -32 * i, axis=0) for i in range(RFB_FRAMES)]
+    results = {}
+    previous = typing[0].view(np.uint32)[..., 0]
+    current = typing[1].view(np.uint32)[..., 0]
+    start = time.perf_counter()
+    for _ in range(RFB_FRAMES):
+        dirty_tiles(previous, current)
+    results['diff_ms'] = _ms((time.perf_counter() - start) / RFB_FRAMES)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        for workload, frames in (('typing', typing), ('scrolling', scrolling)):
+            for name, encoding in RFB_ENCODINGS.items():
+                server = RFBServer(_FrameSource(frames), password=RFB_PASSWORD, fps=1000)
+                port = find_free_port(5900, 100)
+                listener = loop.run_until_complete(asyncio.start_server(
+                    server.handle, '127.0.0.1', port))
+                try:
+                    updates = loop.run_until_complete(_rfb_session(port, encoding,
+                                                                   RFB_FRAMES + 1))
+                finally:
+                    server.close()
+                    listener.close()
+                    loop.run_until_complete(listener.wait_closed())
+                # The first update is the whole screen
+                key = f"{name}_{workload}"
+                results[f"{key}_full_bytes"] = updates[0][0]
+                results[f"{key}_first_frame_ms"] = _ms(updates[0][1])
+                results[f"{key}_bytes_per_frame"] = round(
+                    sum(sent for sent, _ in updates[1:]) / RFB_FRAMES)
+                results[f"{key}_ms_per_frame"] = _ms(
+                    sum(seconds for _, seconds in updates[1:]) / RFB_FRAMES)
+    finally:
+        loop.close()
+    return results
+
+
+# Built-in RFB server against x11vnc, both serving a whole Xvfb screen
+XVFB_SIZE = (1368, 1024)
+XVFB_FRAMES = 30
+XVFB_TIMEOUT = 10  # seconds to wait for Xvfb and the servers
+XVFB_X11VNC_SCALES = ('0.75', '0.5')  # x11vnc -scale, compared with full size
+
+
+def _installed(sim: Simulator, program: str) -> str:
+    """Path of the real program, not of its simulated stand-in, or None"""
+    bin_path = os.path.join(sim.path, 'bin')
+    path = os.pathsep.join(p for p in os.environ.get('PATH', '').split(os.pathsep)
+                           if p != bin_path)
+    return shutil.which(program, path=path)
+
+
+def _start_xvfb(xvfb: str) -> Tuple[subprocess.Popen, str]:
+    """Start Xvfb on a free display. Returns the process and the display."""
+    read, write = os.pipe()
+    try:
+        process = subprocess.Popen([xvfb, '-displayfd', str(write), '-br', '-nolisten', 'tcp',
+                                    '-screen', '0', f"{XVFB_SIZE[0]}x{XVFB_SIZE[1]}x24"],
+                                   pass_fds=(write,), stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+    finally:
+        os.close(write)
+    # Xvfb writes the display number once it accepts connections
+    with os.fdopen(read) as f:
+        number = f.readline().strip()
+    if not number:
+        process.kill()
+        process.wait()
+        raise RuntimeError("Xvfb failed to start")
+    return process, f":{number}"
+
+
+def _wait_for_port(process: subprocess.Popen, port: int) -> None:
+    """Wait until a server listens on the port. Raises RuntimeError."""
+    import socket
+    deadline = time.monotonic() + XVFB_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{process.args[0]} is not listening on port {port}")
+
+
+class _XPainter:
+    """Draws a glyph-sized block per frame on the root window, like typing"""
+
+    def __init__(self, display: str):
+        library = find_library('X11')
+        if library is None:
+            raise Unavailable("libX11 is not installed")
+        xlib = self.xlib = ctypes.CDLL(library)
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultGC.restype = ctypes.c_void_p
+        xlib.XDefaultGC.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSetForeground.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ulong]
+        xlib.XFillRectangle.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_void_p,
+                                        ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.display = xlib.XOpenDisplay(display.encode())
+        if not self.display:
+            raise RuntimeError(f"Cannot open the X display {display}.")
+        screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XRootWindow(self.display, screen)
+        self.gc = xlib.XDefaultGC(self.display, screen)
+        self.xlib.XSetForeground(self.display, self.gc, 0xe0e0e0)
+
+    def paint(self, i: int) -> None:
+        col, row = (i * 16) % XVFB_SIZE[0], 32 * (i * 16 // XVFB_SIZE[0])
+        self.xlib.XFillRectangle(self.display, self.root, self.gc, col, row, 16, 32)
+        self.xlib.XSync(self.display, 0)
+
+    def close(self) -> None:
+        self.xlib.XCloseDisplay(self.display)
+
+
+@scenario('xvfb')
+def bench_xvfb(sim: Simulator) -> Dict[str, float]:
+    """The built-in RFB server and x11vnc serving the same Xvfb screen with
+    ZRLE: time to the first (full) frame, and time, bytes and server CPU
+    time per update while typing (one glyph per frame). x11vnc also serves
+    it scaled down with -scale, like the HiDPI transport. A server is left
+    out when it is not installed."""
+    from .vncserver import BuiltinVNCServer
+    from .watchdog import ProcessSample
+    from .vncauth import write_password_file
+    from .port import find_free_port
+    xvfb = _installed(sim, 'Xvfb')
+    if xvfb is None:
+        raise Unavailable("Xvfb is not installed")
+    password_path = os.path.join(sim.path, 'xvfb_passwd')
+    write_password_file(RFB_PASSWORD, password_path)
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    servers = {}
+    if BuiltinVNCServer.available():
+        servers['builtin'] = lambda port: [
+            sys.executable, '-m', 'virtscreen.rfb', '--port', str(port), '--rfbauth',
+            password_path, '--clip', f"{XVFB_SIZE[0]}x{XVFB_SIZE[1]}+0+0", '--view-only']
+    x11vnc = _installed(sim, 'x11vnc')
+    if x11vnc is not None:
+        for scale in (None,) + XVFB_X11VNC_SCALES:
+            servers['x11vnc' if scale is None else f"x11vnc_scale_{scale}"] = (
+                lambda port, scale=scale: [
+                    x11vnc, '-rfbport', str(port), '-rfbauth', password_path, '-localhost',
+                    '-forever', '-shared', '-viewonly', '-quiet']
+                + (['-scale', scale] if scale else []))
+    if not servers:
+        raise Unavailable("Neither the built-in server (numpy) nor x11vnc is installed")
+    xvfb_process, display = _start_xvfb(xvfb)
+    env = dict(os.environ, DISPLAY=display,
+               PYTHONPATH=os.pathsep.join(filter(None, [package, os.environ.get('PYTHONPATH')])))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    painter = None
+    results = {}
+    try:
+        painter = _XPainter(display)
+        for name, args in servers.items():
+            port = find_free_port(5900, 100)
+            server = subprocess.Popen(args(port), env=env, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            cpu = []
+
+            def change(i: int) -> None:
+                if i == 1:  # CPU time of the server after the first frame
+                    cpu.append(ProcessSample.read(server.pid).cpu)
+                painter.paint(i)
+            try:
+                _wait_for_port(server, port)
+                updates = loop.run_until_complete(asyncio.wait_for(
+                    _rfb_session(port, RFB_ENCODINGS['zrle'], XVFB_FRAMES + 1, change),
+                    XVFB_TIMEOUT))
+                cpu.append(ProcessSample.read(server.pid).cpu)
+            finally:
+                server.terminate()
+                server.wait()
+            results[f"{name}_full_bytes"] = updates[0][0]
+            results[f"{name}_first_frame_ms"] = _ms(updates[0][1])
+            results[f"{name}_bytes_per_frame"] = round(
+                sum(sent for sent, _ in updates[1:]) / XVFB_FRAMES)
+            results[f"{name}_ms_per_frame"] = _ms(
+                sum(seconds for _, seconds in updates[1:]) / XVFB_FRAMES)
+            results[f"{name}_cpu_ms_per_frame"] = _ms((cpu[1] - cpu[0]) / XVFB_FRAMES)
+    finally:
+        if painter is not None:
+            painter.close()
+        loop.close()
+        xvfb_process.terminate()
+        xvfb_process.wait()
+    return results
+
+
+# History of runs, compared on the same machine
+# Scenarios of `virtscreen bench`: screen query, create/delete, VNC start,
+# shutdown and state latency, and first frame latency of the built-in server
+# and, on Xvfb when it is installed, of x11vnc. The simulated x11vnc does not
+# serve RFB, so x11vnc frames are not measured offline.
+STANDARD_SCENARIOS = ['xrandr_parse', 'create_delete', 'vnc_state', 'rfb', 'xvfb']
+HISTORY_REPEAT = 5
+BASELINE_RUNS = 5  # Latest runs of the same machine pooled into the baseline
+# A change is noise unless it exceeds NOISE_MADS scaled median absolute
+# deviations of the baseline or current samples, and NOISE_RELATIVE of the
+# baseline median
+NOISE_MADS = 3
+NOISE_RELATIVE = 0.05
+# Suffixes of measurements where higher is better, e.g. frame rates.
+# Lower is better for all others (times, bytes, commands, memory).
+HIGHER_IS_BETTER = ('_fps',)
+
+
+def _version() -> Dict[str, str]:
+    """VirtScreen version, and the git commit when run from a checkout"""
+    base = os.path.dirname(__file__)
+    with open(os.path.join(base, 'assets', 'data.json')) as f:
+        version = {'version': json.load(f)['version']}
+    try:
+        commit = subprocess.run(['git', '-C', base, 'rev-parse', '--short', 'HEAD'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        return version
+    if commit.returncode == 0:
+        version['commit'] = commit.stdout.strip()
+    return version
+
+
+def fingerprint() -> Dict[str, object]:
+    """Hardware and Python of this machine, with a short id of them.
+    Measurements are only compared between runs with the same id."""
+    cpu, memory = '', 0
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f
+                        if line.startswith('model name')), '')
+        with open('/proc/meminfo') as f:
+            memory = next((int(line.split()[1]) for line in f
+                           if line.startswith('MemTotal:')), 0)
+    except OSError:
+        pass
+    info = {
+        'machine': platform.machine(),
+        'cpu': cpu,
+        'cores': os.cpu_count(),
+        'memory_gb': round(memory / 1024 ** 2),
+        'python': '.'.join(platform.python_version_tuple()[:2]),
+    }
+    info['id'] = hashlib.sha1(json.dumps(info, sort_keys=True).encode()).hexdigest()[:12]
+    return info
+
+
+def load_history(path: str) -> List[dict]:
+    """Runs saved in a history file, oldest first. Corrupt lines are skipped."""
+    runs = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    logging.warning(f"Skipping a corrupt line of {path}")
+    except FileNotFoundError:
+        pass
+    return runs
+
+
+def save_run(path: str, run: dict) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(run, sort_keys=True) + '\n')
+
+
+def _mad(values: List[float]) -> float:
+    middle = statistics.median(values)
+    return statistics.median(abs(value - middle) for value in values)
+
+
+def compare(baseline: List[float], current: List[float],
+            higher_is_better: bool = False) -> Tuple[float, float, str]:
+    """Compare samples of a measurement, where lower is better unless
+    higher_is_better.
+
+    Returns:
+        Tuple -- baseline median, current median, and 'worse', 'better' or
+                 '~' when the difference is within the noise threshold
+    """
+    before, after = statistics.median(baseline), statistics.median(current)
+    spread = max(_mad(baseline), _mad(current))
+    noise = max(NOISE_MADS * 1.4826 * spread, NOISE_RELATIVE * abs(before))
+    if abs(after - before) <= noise:
+        return before, after, '~'
+    return before, after, 'worse' if (after > before) != higher_is_better else 'better'
+
+
+def _number(value: float) -> str:
+    return f"{value:.3f}".rstrip('0').rstrip('.')
+
+
+def report(samples: Dict[str, Dict[str, List[float]]], runs: List[dict]) -> int:
+    """Print current medians next to the baseline pooled from previous runs.
+
+    Returns:
+        int -- number of measurements worse than the baseline beyond noise
+    """
+    worse = 0
+    print(f"{'scenario':<14} {'measurement':<34} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, results in samples.items():
+        for key, values in results.items():
+            pooled = [value for run in runs
+                      for value in run['results'].get(name, {}).get(key, [])]
+            if not pooled:
+                print(f"{name:<14} {key:<34} {'-':>12} {_number(statistics.median(values)):>12}")
+                continue
+            before, after, verdict = compare(pooled, values, key.endswith(HIGHER_IS_BETTER))
+            change = f"{(after - before) / before:+.1%}" if before else ''
+            print(f"{name:<14} {key:<34} {_number(before):>12} {_number(after):>12} "
+                  f"{change:>8} {verdict}")
+            worse += verdict == 'worse'
+    return worse
+
+
+def main_history(names: List[str], path: str, repeat: int, baseline: str,
+                 check: bool) -> int:
+    """Run scenarios, compare them with previous runs of this machine and
+    append them to the history file"""
+    failures = {}
+    machine = fingerprint()
+    run = {'time': round(time.time(), 3), 'machine': machine, **_version()}
+    samples = collect(names or STANDARD_SCENARIOS, repeat, failures)
+    runs = [previous for previous in load_history(path)
+            if previous.get('machine', {}).get('id') == machine['id']
+            and (not baseline or previous.get('version') == baseline
+                 or previous.get('commit') == baseline)]
+    runs = runs[-BASELINE_RUNS:]
+    print(f"Machine {machine['id']}: {machine['cpu'] or machine['machine']}, "
+          f"{machine['cores']} cores, {machine['memory_gb']} GB, Python {machine['python']}")
+    if runs:
+        versions = sorted(set(previous.get('commit') or previous['version'] for previous in runs))
+        print(f"Baseline: {len(runs)} previous run{'s' if len(runs) > 1 else ''} "
+              f"({', '.join(versions)}), "
+              f"medians of {repeat} samples now")
+    else:
+        print("No previous runs to compare with. This run is the new baseline.")
+    worse = report(samples, runs)
+    run['results'] = samples
+    save_run(path, run)
+    for name, message in failures.items():
+        print(f"{name}: {message}", file=sys.stderr)
+    if failures or (check and worse):
+        return 1
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog='virtscreen bench',
+        description='Run benchmark scenarios offline, with simulated xrandr and x11vnc.')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+        help=f"scenarios to run: {', '.join(SCENARIOS)}")
+    parser.add_argument('--history', metavar='FILE',
+        help='compare with previous runs saved in FILE and append this run. '
+             f"Runs {', '.join(STANDARD_SCENARIOS)} by default")
+    parser.add_argument('--repeat', type=int, metavar='N',
+        help=f"samples of each scenario (default: 1, or {HISTORY_REPEAT} with --history)")
+    parser.add_argument('--baseline', metavar='VERSION',
+        help='compare only with runs of this version or git commit')
+    parser.add_argument('--check', action='store_true',
+        help='exit with 1 if a measurement got worse beyond noise')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenario: {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}",
+              file=sys.stderr)
+        return 1
+    if args.history:
+        return main_history(args.scenarios, args.history, args.repeat or HISTORY_REPEAT,
+                            args.baseline, args.check)
+    failures = {}
+    samples = collect(args.scenarios, args.repeat or 1, failures)
+    results = {name: {key: statistics.median(values) for key, values in results.items()}
+               for name, results in samples.items()}
+    print(json.dumps(results, indent=4))
+    for name, message in failures.items():
+        print(f"{name}: {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,248 @@
+"""Screen capture of a region of the X screen"""
+
+import ctypes
+import logging
+from ctypes.util import find_library
+
+import numpy as np
+
+
+class _XImageFuncs(ctypes.Structure):
+    _fields_ = [('create_image', ctypes.c_void_p),
+                ('destroy_image', ctypes.c_void_p),
+                ('get_pixel', ctypes.c_void_p),
+                ('put_pixel', ctypes.c_void_p),
+                ('sub_image', ctypes.c_void_p),
+                ('add_pixel', ctypes.c_void_p)]
+
+
+class _XImage(ctypes.Structure):
+    _fields_ = [('width', ctypes.c_int),
+                ('height', ctypes.c_int),
+                ('xoffset', ctypes.c_int),
+                ('format', ctypes.c_int),
+                ('data', ctypes.c_void_p),
+                ('byte_order', ctypes.c_int),
+                ('bitmap_unit', ctypes.c_int),
+                ('bitmap_bit_order', ctypes.c_int),
+                ('bitmap_pad', ctypes.c_int),
+                ('depth', ctypes.c_int),
+                ('bytes_per_line', ctypes.c_int),
+                ('bits_per_pixel', ctypes.c_int),
+                ('red_mask', ctypes.c_ulong),
+                ('green_mask', ctypes.c_ulong),
+                ('blue_mask', ctypes.c_ulong),
+                ('obdata', ctypes.c_void_p),
+                ('f', _XImageFuncs)]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [('shmseg', ctypes.c_ulong),
+                ('shmid', ctypes.c_int),
+                ('shmaddr', ctypes.c_void_p),
+                ('readOnly', ctypes.c_int)]
+
+
+_XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+_DestroyImage = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(_XImage))
+
+ZPIXMAP = 2
+ALL_PLANES = ctypes.c_ulong(-1).value
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+def _load(name: str) -> ctypes.CDLL:
+    path = find_library(name)
+    if path is None:
+        raise RuntimeError(f"lib{name} is not found.")
+    return ctypes.CDLL(path)
+
+
+# The Xlib error handler is process-wide. It is installed while any capture
+# is open and the previous one is restored after the last is closed. Errors
+# of other displays are passed on to the previous handler.
+_displays: set = set()  # Displays of open captures
+_xerrors: int = 0  # Errors of these displays so far
+_previous_handler: int = None
+
+
+def _on_xerror(display, event) -> int:
+    global _xerrors
+    if display in _displays or not _previous_handler:
+        _xerrors += 1
+        return 0
+    return _XErrorHandler(_previous_handler)(display, event)
+
+
+# Xlib keeps a pointer to the handler, so it lives as long as the module
+_ERROR_HANDLER = _XErrorHandler(_on_xerror)
+
+
+def _install_error_handler(xlib: ctypes.CDLL, display: int) -> None:
+    """Count errors of the display. The default Xlib error handler
+    terminates the process."""
+    global _previous_handler
+    if not _displays:
+        _previous_handler = xlib.XSetErrorHandler(_ERROR_HANDLER)
+    _displays.add(display)
+
+
+def _restore_error_handler(xlib: ctypes.CDLL, display: int) -> None:
+    global _previous_handler
+    _displays.discard(display)
+    if not _displays:
+        xlib.XSetErrorHandler(_previous_handler)
+        _previous_handler = None
+
+
+class ScreenCapture:
+    """Capture a rectangle of the root window into a reusable buffer.
+
+    MIT-SHM is used when the X server supports it, so a capture is a
+    single round trip without copying pixels through the socket.
+    Otherwise it falls back to XGetImage.
+    """
+
+    def __init__(self, x: int, y: int, width: int, height: int, display: str = None):
+        self.x: int = x
+        self.y: int = y
+        self.width: int = width
+        self.height: int = height
+        self.shm: bool = False
+        self._image = None
+        self._shminfo = _XShmSegmentInfo()
+        self.xlib = _load('X11')
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        self.xlib.XRootWindow.restype = ctypes.c_ulong
+        self.xlib.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XDefaultVisual.restype = ctypes.c_void_p
+        self.xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XGetImage.restype = ctypes.POINTER(_XImage)
+        self.xlib.XGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int,
+                                        ctypes.c_int, ctypes.c_uint, ctypes.c_uint,
+                                        ctypes.c_ulong, ctypes.c_int]
+        self.xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XFree.argtypes = [ctypes.c_void_p]
+        self.xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        self.xlib.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        self.display = self.xlib.XOpenDisplay(display.encode() if display else None)
+        if not self.display:
+            raise RuntimeError("Cannot open the X display.")
+        _install_error_handler(self.xlib, self.display)
+        screen = self.xlib.XDefaultScreen(self.display)
+        self.root = self.xlib.XRootWindow(self.display, screen)
+        visual = self.xlib.XDefaultVisual(self.display, screen)
+        depth = self.xlib.XDefaultDepth(self.display, screen)
+        self.buffer: np.ndarray = np.zeros((height, width, 4), dtype=np.uint8)
+        try:
+            self._init_shm(visual, depth)
+        except (OSError, RuntimeError) as e:
+            logging.info(f"MIT-SHM is not available, using XGetImage: {e}")
+            self._release_shm()
+
+    def _init_shm(self, visual, depth) -> None:
+        self.xext = _load('Xext')
+        self.libc = ctypes.CDLL(find_library('c'), use_errno=True)
+        self.xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        self.xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        self.xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint,
+                                              ctypes.c_int, ctypes.c_void_p,
+                                              ctypes.POINTER(_XShmSegmentInfo),
+                                              ctypes.c_uint, ctypes.c_uint]
+        self.xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        self.xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        self.xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                           ctypes.POINTER(_XImage), ctypes.c_int,
+                                           ctypes.c_int, ctypes.c_ulong]
+        self.libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        self.libc.shmat.restype = ctypes.c_void_p
+        self.libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        self.libc.shmdt.argtypes = [ctypes.c_void_p]
+        self.libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+        if not self.xext.XShmQueryExtension(self.display):
+            raise RuntimeError("The X server has no MIT-SHM extension.")
+        image = self.xext.XShmCreateImage(self.display, visual, depth, ZPIXMAP, None,
+                                          ctypes.byref(self._shminfo),
+                                          self.width, self.height)
+        if not image:
+            raise RuntimeError("XShmCreateImage failed.")
+        self._image = image
+        if image.contents.bits_per_pixel != 32:
+            raise RuntimeError(f"Unsupported pixel size: {image.contents.bits_per_pixel}")
+        size = image.contents.bytes_per_line * image.contents.height
+        shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        self._shminfo.shmid = shmid
+        addr = self.libc.shmat(shmid, None, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(shmid, IPC_RMID, None)
+            self._shminfo.shmid = -1
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self._shminfo.shmaddr = addr
+        self._shminfo.readOnly = 0
+        image.contents.data = addr
+        errors = _xerrors
+        self.xext.XShmAttach(self.display, ctypes.byref(self._shminfo))
+        self.xlib.XSync(self.display, 0)
+        # The segment is freed automatically once both sides detach
+        self.libc.shmctl(shmid, IPC_RMID, None)
+        if _xerrors != errors:
+            raise RuntimeError("XShmAttach failed (remote X server?)")
+        self.shm = True
+        # Capture straight into the shared segment, without a copy
+        pitch = image.contents.bytes_per_line
+        raw = (ctypes.c_uint8 * size).from_address(addr)
+        self.buffer = np.frombuffer(raw, dtype=np.uint8).reshape(
+            self.height, pitch // 4, 4)[:, :self.width]
+
+    def _release_shm(self) -> None:
+        if self._shminfo.shmaddr:
+            if self.shm:
+                self.xext.XShmDetach(self.display, ctypes.byref(self._shminfo))
+                self.xlib.XSync(self.display, 0)
+            self.libc.shmdt(self._shminfo.shmaddr)
+            self._shminfo.shmaddr = None
+        if self._image:
+            self._image.contents.data = None
+            self.xlib.XFree(self._image)
+            self._image = None
+        self.shm = False
+        self.buffer = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+
+    def grab(self) -> np.ndarray:
+        """Capture the region and return the (height, width, 4) BGRX buffer.
+        The buffer is reused by the next capture."""
+        if self.shm:
+            if not self.xext.XShmGetImage(self.display, self.root, self._image,
+                                          self.x, self.y, ALL_PLANES):
+                raise RuntimeError("XShmGetImage failed.")
+            return self.buffer
+        image = self.xlib.XGetImage(self.display, self.root, self.x, self.y,
+                                    self.width, self.height, ALL_PLANES, ZPIXMAP)
+        if not image:
+            raise RuntimeError("XGetImage failed.")
+        try:
+            if image.contents.bits_per_pixel != 32:
+                raise RuntimeError(f"Unsupported pixel size: {image.contents.bits_per_pixel}")
+            pitch = image.contents.bytes_per_line
+            raw = (ctypes.c_uint8 * (pitch * self.height)).from_address(image.contents.data)
+            frame = np.frombuffer(raw, dtype=np.uint8).reshape(self.height, pitch // 4, 4)
+            np.copyto(self.buffer, frame[:, :self.width])
+        finally:
+            _DestroyImage(image.contents.f.destroy_image)(image)
+        return self.buffer
+
+    def close(self) -> None:
+        if not self.display:
+            return
+        self._release_shm()
+        self.xlib.XCloseDisplay(self.display)
+        _restore_error_handler(self.xlib, self.display)
+        self.display = None
@@ -0,0 +1,236 @@
+"""Configuration file loading and migration"""
+
+import os
+import copy
+import json
+import shutil
+import logging
+from typing import Any, List, Tuple
+
+from .path import CONFIG_PATH, DEFAULT_CONFIG_PATH, DATA_PATH
+
+
+# Current schema version of config.json. Bump it together with a new
+# entry in MIGRATIONS whenever settings are added, renamed or removed.
+SCHEMA_VERSION = 5
+
+# MIGRATIONS[n] migrates a config from schema version n to n + 1.
+# Operations:
+#   ('add', path, value)      -- add the value if missing
+#   ('rename', path, new)     -- move a value, if present
+#   ('remove', path)          -- delete a value, if present
+# Added values are spelled out rather than read from config.default.json,
+# so a migration keeps doing the same when later defaults change.
+# Keys not mentioned are never touched, so unknown keys are preserved.
+MIGRATIONS: Tuple[Tuple[tuple, ...], ...] = (
+    # 0 -> 1: Settings added after 0.3.1
+    (
+        ('add', 'virt.position', ''),
+        ('add', 'virt.relativeTo', ''),
+        ('add', 'vnc.portRange', 0),
+        ('add', 'vnc.onDemand', False),
+        ('add', 'vnc.adaptiveQuality', {'enabled': False, 'scaling': False}),
+        ('add', 'vnc.activitySampling', False),
+        ('add', 'vnc.resources', {'cpuAffinity': '', 'nice': 0, 'ionice': '',
+                                  'cpuQuota': '', 'memoryMax': ''}),
+        ('add', 'x11vncOptions.-threads', {'available': None, 'enabled': False, 'arg': None}),
+    ),
+    # 1 -> 2: Pluggable VNC servers
+    (
+        ('add', 'vnc.server', 'x11vnc'),
+    ),
+    # 2 -> 3: Scaled transport of HiDPI screens
+    (
+        ('add', 'vnc.hidpiScaling', False),
+    ),
+    # 3 -> 4: Idle client throttling
+    (
+        ('add', 'vnc.idle', {'enabled': False, 'timeout': 300, 'wait': 1000}),
+    ),
+    # 4 -> 5: Stall watchdog
+    (
+        ('add', 'vnc.watchdog', {'enabled': False, 'timeout': 10, 'probe': True,
+                                 'recovery': 'restart'}),
+    ),
+)
+
+# Expected types of settings, checked once after loading and migrating.
+# A tuple lists the allowed values instead.
+SCHEMA = {
+    'version': str,
+    'theme_color': int,
+    'virt.device': str,
+    'virt.width': int,
+    'virt.height': int,
+    'virt.portrait': bool,
+    'virt.hidpi': bool,
+    'virt.position': str,
+    'virt.relativeTo': str,
+    'vnc.server': str,
+    'vnc.port': int,
+    'vnc.portRange': int,
+    'vnc.autostart': bool,
+    'vnc.onDemand': bool,
+    'vnc.adaptiveQuality.enabled': bool,
+    'vnc.adaptiveQuality.scaling': bool,
+    'vnc.activitySampling': bool,
+    'vnc.hidpiScaling': bool,
+    'vnc.idle.enabled': bool,
+    'vnc.idle.timeout': int,
+    'vnc.idle.wait': int,
+    'vnc.watchdog.enabled': bool,
+    'vnc.watchdog.timeout': int,
+    'vnc.watchdog.probe': bool,
+    'vnc.watchdog.recovery': ('restart', 'recreate'),
+    'vnc.resources.cpuAffinity': str,
+    'vnc.resources.nice': int,
+    'vnc.resources.ionice': str,
+    'vnc.resources.cpuQuota': str,
+    'vnc.resources.memoryMax': str,
+    'displaySettingApp': str,
+    'x11vncOptions': dict,
+    'customX11vncArgs.enabled': bool,
+    'customX11vncArgs.value': str,
+    'presets': list,
+}
+
+_MISSING = object()
+
+
+def _split(path: str) -> List[str]:
+    return path.split('.')
+
+
+def _get(config: dict, keys: List[str]) -> Any:
+    for key in keys:
+        if not isinstance(config, dict) or key not in config:
+            return _MISSING
+        config = config[key]
+    return config
+
+
+def _set(config: dict, keys: List[str], value: Any) -> None:
+    for key in keys[:-1]:
+        if not isinstance(config.get(key), dict):
+            config[key] = {}
+        config = config[key]
+    config[keys[-1]] = value
+
+
+def _pop(config: dict, keys: List[str]) -> Any:
+    parent = _get(config, keys[:-1]) if len(keys) > 1 else config
+    if not isinstance(parent, dict):
+        return _MISSING
+    return parent.pop(keys[-1], _MISSING)
+
+
+# Compiled once at import: (keys, type or allowed values, path)
+_COMPILED_SCHEMA = tuple((_split(path), kind, path) for path, kind in SCHEMA.items())
+
+
+def migrate(config: dict) -> bool:
+    """Migrate a config in place to SCHEMA_VERSION.
+
+    Returns:
+        bool -- True if the config has been changed
+    """
+    version = config.get('schemaVersion', 0)
+    if version >= SCHEMA_VERSION:
+        return False
+    for operations in MIGRATIONS[version:]:
+        for operation in operations:
+            action, path = operation[0], _split(operation[1])
+            if action == 'add':
+                if _get(config, path) is _MISSING:
+                    _set(config, path, copy.deepcopy(operation[2]))
+            elif action == 'rename':
+                value = _pop(config, path)
+                if value is not _MISSING:
+                    _set(config, _split(operation[2]), value)
+            elif action == 'remove':
+                _pop(config, path)
+            else:
+                raise ValueError(f"Unknown migration operation: {action}")
+    logging.info(f"Config migrated from schema {version} to {SCHEMA_VERSION}")
+    config['schemaVersion'] = SCHEMA_VERSION
+    return True
+
+
+def validate(config: dict, default: dict) -> bool:
+    """Replace settings having a wrong type or value with the default value.
+
+    Returns:
+        bool -- True if the config has been changed
+    """
+    changed = False
+    for keys, kind, path in _COMPILED_SCHEMA:
+        value = _get(config, keys)
+        if isinstance(kind, tuple):
+            if isinstance(value, str) and value in kind:
+                continue
+        # bool is a subclass of int, so check it strictly
+        elif isinstance(value, kind) and (kind is bool or not isinstance(value, bool)):
+            continue
+        default_value = _get(default, keys)
+        logging.warning(f"Invalid setting {path}: {value!r}. Using the default.")
+        _set(config, keys, copy.deepcopy(default_value))
+        changed = True
+    # Entries of x11vncOptions, indexed by Backend
+    options = config['x11vncOptions']
+    for key, value in list(options.items()):
+        if _valid_x11vnc_option(value):
+            continue
+        logging.warning(f"Invalid setting x11vncOptions.{key}: {value!r}.")
+        if key in default['x11vncOptions']:
+            options[key] = copy.deepcopy(default['x11vncOptions'][key])
+        else:
+            del options[key]
+        changed = True
+    return changed
+
+
+def _valid_x11vnc_option(value: Any) -> bool:
+    """An x11vncOptions entry like {"available": null, "enabled": true, "arg": 10}"""
+    if not isinstance(value, dict):
+        return False
+    available, enabled, arg = (value.get(key, _MISSING) for key in ('available', 'enabled', 'arg'))
+    return (available is None or isinstance(available, bool)) and isinstance(enabled, bool) \
+        and (arg is None or isinstance(arg, str)
+             or (isinstance(arg, (int, float)) and not isinstance(arg, bool)))
+
+
+def save_config(config: dict) -> None:
+    with open(CONFIG_PATH, 'w') as f:
+        f.write(json.dumps(config, indent=4, sort_keys=True))
+
+
+def load_config() -> Tuple[dict, bool]:
+    """Load config.json, creating it or migrating it if needed.
+
+    Returns:
+        Tuple[dict, bool] -- the config, and True if it has just been created
+    """
+    created = False
+    if not os.path.exists(CONFIG_PATH):
+        shutil.copy(DEFAULT_CONFIG_PATH, CONFIG_PATH)
+        created = True
+    with open(CONFIG_PATH, 'r') as f_config, open(DEFAULT_CONFIG_PATH, 'r') as f_default, \
+            open(DATA_PATH, 'r') as f_data:
+        try:
+            config = json.load(f_config)
+        except ValueError as e:
+            logging.error(f"Broken config file, using the default: {e}")
+            config = None
+        default = json.load(f_default)
+        data = json.load(f_data)
+    if not isinstance(config, dict):
+        config = copy.deepcopy(default)
+        created = True
+    changed = migrate(config)
+    changed = validate(config, default) or changed
+    if config['version'] != data['version']:
+        config['version'] = data['version']
+        changed = True
+    if changed or created:
+        save_config(config)
+    return config, created
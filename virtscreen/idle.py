@@ -0,0 +1,83 @@
+"""Idle client throttling"""
+
+import re
+import asyncio
+import logging
+from typing import Callable
+
+from .remote import X11VNCRemote
+from . import metrics
+
+
+class IdleController:
+    """Slow x11vnc polling down sharply while the connected client sends no
+    input, e.g. a tablet left on the desk with its screen off, and restore
+    the full rate on the next input.
+
+    Input is taken from the pointer events x11vnc logs with -debug_pointer.
+    Logging is only turned on (through remote control) during the second
+    half of the timeout and while idle, so the log does not grow with every
+    touch. Keyboard events are not watched: -debug_keyboard logs keystrokes."""
+
+    SOURCE = 'idle'
+
+    pattern_input = re.compile(r"# pointer\(mask:")
+
+    def __init__(self, remote: X11VNCRemote, timeout: float = 300, wait: int = 1000,
+                 on_change: Callable[[bool], None] = lambda idle: None):
+        self.remote: X11VNCRemote = remote
+        self.timeout: float = timeout
+        self.wait: int = wait
+        self.on_change: Callable[[bool], None] = on_change
+        self.idle: bool = False
+        self.watching: bool = False
+        self.since: float = 0.0
+        self.handle: asyncio.Handle = None
+
+    def start(self) -> None:
+        self.idle = False
+        self._watch_later()
+
+    def stop(self) -> None:
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.watching:
+            self.watching = False
+            self.remote.send('nodebug_pointer')
+        self.remote.release(self.SOURCE)
+        if self.idle:
+            self.idle = False
+            self.on_change(False)
+
+    def _watch_later(self) -> None:
+        self.watching = False
+        self.handle = asyncio.get_event_loop().call_later(self.timeout / 2, self._watch)
+
+    def _watch(self) -> None:
+        self.watching = True
+        self.remote.send('debug_pointer')
+        self.handle = asyncio.get_event_loop().call_later(self.timeout / 2, self._set_idle)
+
+    def _set_idle(self) -> None:
+        self.idle = True
+        self.since = asyncio.get_event_loop().time()
+        logging.info(f"VNC client idle for {self.timeout} s. Polling every {self.wait} ms.")
+        self.remote.request(self.SOURCE, wait=self.wait, defer=self.wait)
+        metrics.record('idle', state='idle', timeout=self.timeout, wait=self.wait)
+        self.on_change(True)
+
+    def feed_output(self, data: str) -> None:
+        """Restart the timeout, or wake up, on client input in x11vnc output."""
+        if not self.watching or self.pattern_input.search(data) is None:
+            return
+        self.handle.cancel()
+        self.remote.send('nodebug_pointer')
+        if self.idle:
+            self.idle = False
+            idle_for = asyncio.get_event_loop().time() - self.since
+            logging.info("VNC client active again. Polling at full rate.")
+            self.remote.release(self.SOURCE)
+            metrics.record('idle', state='active', idle_for=round(idle_for, 1))
+            self.on_change(False)
+        self._watch_later()
@@ -0,0 +1,83 @@
+"""Placement solver for the virtual screen"""
+
+from typing import Dict, List, Tuple
+
+from .display import Display
+
+
+SIDES = ('right', 'left', 'below', 'above')
+
+
+def _overlaps(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> bool:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def _candidates(screen: Display, width: int, height: int, side: str) -> List[Tuple[int, int]]:
+    """Positions touching a side of the screen, aligned to its start, end and center"""
+    x, y, w, h = screen.x_offset, screen.y_offset, screen.width, screen.height
+    if side in ('right', 'left'):
+        pos_x = x + w if side == 'right' else x - width
+        return [(pos_x, pos_y) for pos_y in (y, y + h - height, y + (h - height) // 2)]
+    pos_y = y + h if side == 'below' else y - height
+    return [(pos_x, pos_y) for pos_x in (x, x + w - width, x + (w - width) // 2)]
+
+
+def solve_position(screens: List[Display], virt_name: str, width: int, height: int,
+                   relative_to: str = '', side: str = '') -> Dict[str, Tuple[int, int]]:
+    """Find a position of the virtual screen next to the active outputs.
+
+    The virtual screen must not overlap any active output. Among the free
+    positions, the one with the smallest root window (i.e. the smallest
+    framebuffer x11vnc has to poll) is chosen, preferring the output given
+    by relative_to and the given side.
+
+    Arguments:
+        screens {List[Display]} -- all screens from XRandR
+        virt_name {str} -- name of the virtual output
+        width, height {int} -- size of the virtual screen
+        relative_to {str} -- name of the preferred neighbor output (default: any)
+        side {str} -- one of SIDES (default: any)
+
+    Returns:
+        Dict[str, Tuple[int, int]] -- new (x, y) of the virtual output and of
+        every active output that has to move so no coordinate is negative.
+    """
+    outputs = [s for s in screens if s.active and s.name != virt_name]
+    if not outputs:
+        raise RuntimeError("There is no active screen to place the virtual screen next to.")
+    if relative_to and relative_to not in (s.name for s in outputs):
+        raise RuntimeError(f"{relative_to} is not an active screen.")
+    if side and side not in SIDES:
+        raise RuntimeError("Incorrect position option selected.")
+    rects = [(s.x_offset, s.y_offset, s.width, s.height) for s in outputs]
+    best = None
+    for screen in outputs:
+        if relative_to and screen.name != relative_to:
+            continue
+        for side_idx, cand_side in enumerate(SIDES):
+            if side and cand_side != side:
+                continue
+            for align_idx, (x, y) in enumerate(_candidates(screen, width, height, cand_side)):
+                virt = (x, y, width, height)
+                if any(_overlaps(virt, rect) for rect in rects):
+                    continue
+                left = min(x, *(r[0] for r in rects))
+                top = min(y, *(r[1] for r in rects))
+                right = max(x + width, *(r[0] + r[2] for r in rects))
+                bottom = max(y + height, *(r[1] + r[3] for r in rects))
+                score = ((right - left) * (bottom - top), not screen.primary,
+                         side_idx, align_idx)
+                if best is None or score < best[0]:
+                    best = (score, x, y, left, top)
+    if best is None:
+        raise RuntimeError("There is no free position for the virtual screen.")
+    _, x, y, left, top = best
+    # X screen coordinates start at 0; shift the other outputs if needed
+    positions = {virt_name: (x - left, y - top)}
+    for screen in outputs:
+        pos = (screen.x_offset - left, screen.y_offset - top)
+        if pos != (screen.x_offset, screen.y_offset):
+            positions[screen.name] = pos
+    return positions
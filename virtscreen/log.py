@@ -0,0 +1,115 @@
+"""Application logging"""
+
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import itertools
+import contextlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 2
+FORMAT = "[%(levelname)s:%(filename)s:%(lineno)s:%(funcName)s()] %(message)s"
+
+_operation_ids = itertools.count(1)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as JSON lines for machine analysis"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'file': record.filename,
+            'line': record.lineno,
+            'func': record.funcName,
+            'message': record.getMessage(),
+        }
+        for key in ('op', 'duration'):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+class _QueueHandler(QueueHandler):
+    """Queue records with the exception kept apart from the message"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the arguments into the message like QueueHandler, so they
+        cannot change while queued. QueueHandler also appends the traceback
+        to the message. Instead, it is formatted into exc_text, which the
+        formatter of the listener (e.g. JSONFormatter) outputs on its own."""
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None  # Frames are not kept alive in the queue
+        return record
+
+
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+
+def setup_logging(level: int, filename: str = None, json_format: bool = False) -> QueueListener:
+    """Configure the root logger.
+
+    Records are only put into a queue by the calling (Qt) thread, and a
+    background thread formats and writes them, to the terminal or to a
+    size-rotated file.
+
+    Arguments:
+        level {int} -- logging level
+        filename {str} -- log file, or None to log to stderr (default: None)
+        json_format {bool} -- write JSON lines instead of text (default: False)
+    """
+    if filename:
+        handler = RotatingFileHandler(filename, mode='a', maxBytes=LOG_MAX_BYTES,
+                                      backupCount=LOG_BACKUP_COUNT)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(JSONFormatter() if json_format else logging.Formatter(FORMAT))
+    records = queue.Queue(-1)
+    listener = QueueListener(records, handler)
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(_QueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    # Flush the remaining records on exit
+    atexit.register(listener.stop)
+    return listener
+
+
+@contextlib.contextmanager
+def operation(name: str):
+    """Log the end and the duration of an operation under a unique id.
+
+    Usage:
+        with operation('createVirtScreen'):
+            ...
+    """
+    op_id = f"{name}-{next(_operation_ids)}"
+    start = time.monotonic()
+    logging.debug(f"{name} started", extra={'op': op_id})
+    try:
+        yield op_id
+    except BaseException:
+        duration = round((time.monotonic() - start) * 1000, 3)
+        logging.info(f"{name} failed after {duration} ms",
+                     extra={'op': op_id, 'duration': duration})
+        raise
+    duration = round((time.monotonic() - start) * 1000, 3)
+    logging.info(f"{name} finished in {duration} ms",
+                 extra={'op': op_id, 'duration': duration})
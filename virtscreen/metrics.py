@@ -0,0 +1,30 @@
+"""Metrics recording"""
+
+import os
+import json
+import time
+import logging
+
+from .path import METRICS_PATH
+
+
+METRICS_MAX_BYTES = 1024 * 1024
+
+
+def record(event: str, **fields) -> None:
+    """Append a metrics entry to the metrics file as a JSON line.
+
+    Arguments:
+        event {str} -- name of the event, e.g. 'quality' or 'vnc_port'
+        fields -- JSON serializable values describing the event
+    """
+    entry = {'time': round(time.time(), 3), 'event': event, **fields}
+    line = json.dumps(entry, sort_keys=True)
+    logging.info(f"metrics: {line}")
+    try:
+        if os.path.exists(METRICS_PATH) and os.path.getsize(METRICS_PATH) > METRICS_MAX_BYTES:
+            os.replace(METRICS_PATH, METRICS_PATH + '.1')
+        with open(METRICS_PATH, 'a') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        logging.warning(f"Failed to write metrics: {e}")
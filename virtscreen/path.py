@@ -28,8 +28,14 @@ BASE_PATH = os.path.dirname(__file__) # Location of this script
 # Path in ~/.virtscreen
 X11VNC_LOG_PATH = HOME_PATH + "/x11vnc_log.txt"
 X11VNC_PASSWORD_PATH = HOME_PATH + "/x11vnc_passwd"
+X11VNC_PASSWORDS_PATH = HOME_PATH + "/x11vnc_passwords"
 CONFIG_PATH = HOME_PATH + "/config.json"
 LOGGING_PATH = HOME_PATH + "/log.txt"
+METRICS_PATH = HOME_PATH + "/metrics.jsonl"
+SESSION_PATH = HOME_PATH + "/session.json"
+BENCH_HISTORY_PATH = HOME_PATH + "/bench_history.jsonl"
+PID_PATH = HOME_PATH + "/virtscreen.pid"
+VIRT_MODES_PATH = HOME_PATH + "/virt_modes.json"
 # Path in the program path
 ICON_PATH = BASE_PATH + "/icon/full_256x256.png"
 ASSETS_PATH = BASE_PATH + "/assets"
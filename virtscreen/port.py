@@ -0,0 +1,37 @@
+"""TCP port preflight"""
+
+import errno
+import socket
+import logging
+
+
+def is_port_free(port: int) -> bool:
+    """Check if a VNC server can listen on the port, by binding it the same
+    way servers do (SO_REUSEADDR, all interfaces, IPv4 and IPv6)."""
+    for family, address in ((socket.AF_INET, ''), (socket.AF_INET6, '::')):
+        try:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+        except OSError:
+            continue  # e.g. IPv6 is disabled
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if family == socket.AF_INET6:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            sock.bind((address, port))
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE or e.errno == errno.EACCES:
+                return False
+            logging.info(f"Ignoring port check error on {address}:{port}: {e}")
+        finally:
+            sock.close()
+    return True
+
+
+def find_free_port(port: int, count: int = 1) -> int:
+    """Return the first free port among port, port + 1, ..., port + count - 1,
+    or None if all of them are used."""
+    for candidate in range(port, min(port + count, 65536)):
+        if is_port_free(candidate):
+            return candidate
+        logging.info(f"Port {candidate} is already used.")
+    return None
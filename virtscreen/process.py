@@ -4,8 +4,28 @@ import subprocess
 import asyncio
 import signal
 import shlex
+import socket
 import os
 import logging
+from typing import Callable
+
+
+def is_virtscreen(pid: int) -> bool:
+    """Check if a process is a running VirtScreen
+
+    Only the entry point counts, either the virtscreen script, run directly
+    or by an interpreter, or `python -m virtscreen`. A pid reused by a
+    process merely mentioning virtscreen in its arguments does not match.
+    """
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            argv = f.read().split(b'\0')
+    except OSError:
+        return False
+    if any(os.path.basename(arg) == b'virtscreen' for arg in argv[:2]):
+        return True
+    return len(argv) > 2 and argv[1] == b'-m' and \
+        argv[2] in (b'virtscreen', b'virtscreen.__main__')
 
 
 class SubprocessWrapper:
@@ -34,7 +54,9 @@ class _Protocol(asyncio.SubprocessProtocol):
         logging.info("connectionMade!")
         self.outer.connected()
         self.transport = transport
-        transport.get_pipe_transport(0).close()  # No more input
+        stdin = transport.get_pipe_transport(0)
+        if stdin is not None:  # None when stdin is a socket handed to the child
+            stdin.close()  # No more input
 
     def pipe_data_received(self, fd, data):
         if fd == 1: # stdout
@@ -82,19 +104,42 @@ class AsyncSubprocess():
         self.transport: asyncio.SubprocessTransport
         self.protocol: _Protocol
 
-    async def _run(self, arg: str, loop: asyncio.AbstractEventLoop):
-        self.transport, self.protocol = await loop.subprocess_exec(
-            lambda: _Protocol(self), *shlex.split(arg), env=os.environ)
-
-    def run(self, arg: str):
+    async def _run(self, arg: str, loop: asyncio.AbstractEventLoop, stdio: socket.socket = None,
+                   preexec_fn: Callable[[], None] = None):
+        kwargs = {}
+        if stdio is not None:
+            kwargs = {'stdin': stdio, 'stdout': stdio}
+        if preexec_fn is not None:
+            kwargs['preexec_fn'] = preexec_fn
+        try:
+            self.transport, self.protocol = await loop.subprocess_exec(
+                lambda: _Protocol(self), *shlex.split(arg), env=os.environ, **kwargs)
+        except (OSError, subprocess.SubprocessError) as e:
+            # e.g. the program is not found, or preexec_fn failed
+            logging.error(f"Failed to start {arg}: {e}")
+            if self.logfile is not None:
+                self.logfile.close()
+            self.ended(1)
+        finally:
+            if stdio is not None:
+                stdio.close()  # The child owns its copy now
+
+    def run(self, arg: str, stdio: socket.socket = None, preexec_fn: Callable[[], None] = None):
         """Spawn a process.
         
         Arguments:
             arg {str} -- arguments in string
+            stdio {socket.socket} -- connected socket used as the child's stdin
+                                     and stdout, e.g. for inetd mode (default: None)
+            preexec_fn {Callable} -- called in the child before exec (default: None)
         """
         loop = asyncio.get_event_loop()
-        loop.create_task(self._run(arg, loop))
+        loop.create_task(self._run(arg, loop, stdio, preexec_fn))
 
     def close(self):
         """Kill a spawned process."""
         self.transport.send_signal(signal.SIGINT)
+
+    def kill(self):
+        """Kill a spawned process not responding to SIGINT."""
+        self.transport.kill()
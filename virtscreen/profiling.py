@@ -0,0 +1,147 @@
+"""On-demand profiling of a running VirtScreen
+
+SIGUSR1, e.g. sent by `virtscreen profile`, turns profiling on and off.
+Nothing is hooked while it is off. While on, cProfile counts calls and time
+of every Python function on the main thread, where Qt and asyncio dispatch
+everything, and a thread samples the main thread's stack. When turned off,
+three files are written to the config directory:
+
+    profile-<time>.pstats  -- cProfile statistics, for pstats or snakeviz
+    profile-<time>.folded  -- collapsed stacks, for flamegraph.pl or speedscope
+    profile-<time>.txt     -- calls and time of XRandR, subprocesses and Backend
+"""
+
+import io
+import os
+import sys
+import time
+import atexit
+import signal
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from typing import List, Optional
+
+from .process import is_virtscreen
+from . import metrics
+
+PROFILE_SIGNAL = signal.SIGUSR1
+
+
+class Profiler:
+    """cProfile and a stack sampler of the main thread, switched on and off"""
+
+    SAMPLE_INTERVAL = 0.005  # seconds
+    # Modules of XRandR, SubprocessWrapper (and the VNC server backends) and Backend
+    SUMMARY_FILTER = r"virtscreen/(xrandr|process|vncserver|qt_backend)\.py"
+    SUMMARY_LINES = 40
+
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self.profile: cProfile.Profile = None
+        self.stacks: Counter = Counter()
+        self.sampler: threading.Thread = None
+        self.stopping: threading.Event = threading.Event()
+        self.started: float = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.profile is not None
+
+    def toggle(self) -> None:
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self) -> None:
+        logging.info("Profiling started")
+        self.started = time.time()
+        self.stacks = Counter()
+        self.stopping.clear()
+        self.sampler = threading.Thread(target=self._sample, args=(threading.get_ident(),),
+                                        name='profile-sampler', daemon=True)
+        self.sampler.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self) -> List[str]:
+        """Stop and write the profile.
+
+        Returns:
+            List[str] -- paths of the written files
+        """
+        self.profile.disable()
+        self.stopping.set()
+        self.sampler.join()
+        profile, self.profile = self.profile, None
+        seconds = round(time.time() - self.started, 3)
+        base = os.path.join(self.directory,
+                            time.strftime('profile-%Y%m%d-%H%M%S', time.localtime(self.started)))
+        paths = [base + '.pstats', base + '.folded', base + '.txt']
+        profile.dump_stats(paths[0])
+        with open(paths[1], 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.SUMMARY_FILTER, self.SUMMARY_LINES)
+        with open(paths[2], 'w') as f:
+            f.write(summary.getvalue())
+        samples = sum(self.stacks.values())
+        logging.info(f"Profiling stopped after {seconds} s, {samples} samples: {base}.*")
+        metrics.record('profile', seconds=seconds, samples=samples, path=base)
+        return paths
+
+    def _sample(self, thread_id: int) -> None:
+        """Count the stacks of a thread until stopped"""
+        while not self.stopping.wait(self.SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get('__name__', '?')
+                names.append(f"{module}.{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            del frame
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+
+def install(pid_path: str, directory: str) -> Profiler:
+    """Profile this process on PROFILE_SIGNAL. The pid is written to
+    pid_path, so `virtscreen profile` can find it, unless another running
+    VirtScreen has written its own."""
+    profiler = Profiler(directory)
+    signal.signal(PROFILE_SIGNAL, lambda signum, frame: profiler.toggle())
+    pid = str(os.getpid())
+    running = read_pid(pid_path)
+    if running is not None and running != int(pid):
+        logging.warning(f"VirtScreen is already running (pid {running}). "
+                        "`virtscreen profile` profiles that one.")
+        return profiler
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(pid_path, 'w') as f:
+            f.write(pid)
+    except OSError as e:
+        logging.warning(f"Cannot write {pid_path}: {e}")
+        return profiler
+
+    def _remove():
+        if read_pid(pid_path) == int(pid):
+            os.remove(pid_path)
+    atexit.register(_remove)
+    return profiler
+
+
+def read_pid(pid_path: str) -> Optional[int]:
+    """Pid of a running VirtScreen, or None"""
+    try:
+        with open(pid_path) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if is_virtscreen(pid) else None
@@ -1,26 +1,41 @@
 """GUI backend"""
 
 import json
-import re
 import subprocess
 import os
 import shutil
 import atexit
 import time
+import asyncio
 import logging
-from typing import Callable
+from typing import Callable, List, Tuple
 
 from PyQt5.QtCore import QObject, pyqtProperty, pyqtSlot, pyqtSignal, Q_ENUMS
 from PyQt5.QtGui import QCursor
-from PyQt5.QtQml import QQmlListProperty
+from PyQt5.QtQml import QQmlListProperty, QQmlEngine
 from PyQt5.QtWidgets import QApplication
 from netifaces import interfaces, ifaddresses, AF_INET
 
 from .display import DisplayProperty
 from .xrandr import XRandR
-from .process import AsyncSubprocess, SubprocessWrapper
-from .path import (DATA_PATH, CONFIG_PATH, DEFAULT_CONFIG_PATH,
-                  X11VNC_PASSWORD_PATH, X11VNC_LOG_PATH)
+from .process import AsyncSubprocess
+from .activation import SocketActivator
+from .remote import X11VNCRemote
+from .quality import QualityController, HiDPIScaler
+from .idle import IdleController
+from .watchdog import StallWatchdog
+from .resources import ResourceLimits
+from .port import find_free_port
+from .log import operation
+from .vncserver import get_server, available_servers, VNCServer, X11VNCServer
+from .vncauth import (write_password_file, read_password_file, write_password_list,
+                      read_password_list, PASSWORD_LENGTH)
+from . import metrics
+from .config import load_config, save_config
+from .session import (SESSION_VIRT_KEYS, snapshot, save_session, layout_matches,
+                      saved_positions)
+from .path import (DATA_PATH, CONFIG_PATH, X11VNC_PASSWORD_PATH, X11VNC_PASSWORDS_PATH,
+                   X11VNC_LOG_PATH)
 
 
 class Backend(QObject):
@@ -38,65 +53,92 @@ class Backend(QObject):
     # Signals
     onVirtScreenCreatedChanged = pyqtSignal(bool)
     onVncUsePasswordChanged = pyqtSignal(bool)
+    onVncPasswordsChanged = pyqtSignal()
     onVncStateChanged = pyqtSignal(VNCState)
+    onVncPortChanged = pyqtSignal(int)
+    onVncClientIdleChanged = pyqtSignal(bool)
     onDisplaySettingClosed = pyqtSignal()
     onError = pyqtSignal(str)
 
-    def __init__(self, parent=None, logger=logging.info, error_logger=logging.error):
+    def __init__(self, parent=None, logger=logging.info, error_logger=logging.error,
+                 xrandr: XRandR = None, config: dict = None):
         super(Backend, self).__init__(parent)
         # Virtual screen properties
-        self.xrandr: XRandR = XRandR()
+        self.xrandr: XRandR = xrandr if xrandr is not None else XRandR()
+        # Leftovers are cleaned up once the event loop runs, so the tray icon
+        # shows up first, or before creating the virtual screen.
+        self._reconciled: bool = False
+        self._reconcileHandle: asyncio.Handle = asyncio.get_event_loop().call_soon(
+            self.reconcileScreens)
         self._virtScreenCreated: bool = False
+        # Settings the virtual screen was created with, saved in session snapshots
+        self._virtSettings: dict = None
         # VNC server properties
         self._vncUsePassword: bool = False
+        # x11vnc reads passwords again for every connection, if started with any
+        self._vncStartedWithPassword: bool = False
         self._vncState: self.VNCState = self.VNCState.OFF
+        self._vncPort: int = 0
+        # Recovery of a stalled server, run when it has exited
+        self._vncRecovery: str = None
+        self._vncRecoveries: List[float] = []
+        self._vncClientIdle: bool = False
         # Primary screen and mouse posistion
-        self.vncServer: AsyncSubprocess
+        self.vncServer: AsyncSubprocess = None
+        self.vncServerBackend: VNCServer = None
+        # On-demand mode: listening socket and one server per connected client
+        self.vncActivator: SocketActivator = None
+        self.vncClients: List[AsyncSubprocess] = []
+        # Runtime adjustment of the running x11vnc
+        self.vncRemote: X11VNCRemote = X11VNCRemote()
+        self.runtimeControllers: list = []
         # Info/error logger
         self.log: Callable[[str], None] = logger
         self.log_error: Callable[[str], None] = error_logger
-        # Check config file 
-        # and initialize if needed
-        need_init = False
-        if not os.path.exists(CONFIG_PATH):
-            shutil.copy(DEFAULT_CONFIG_PATH, CONFIG_PATH)
-            need_init = True
-        # Version check
-        file_match = True
-        with open(CONFIG_PATH, 'r') as f_config, open(DATA_PATH, 'r') as f_data:
-            config = json.load(f_config)
-            data = json.load(f_data)
-            if config['version'] != data['version']:
-                file_match = False
-        # Override config with default when version doesn't match
-        if not file_match:
-            shutil.copy(DEFAULT_CONFIG_PATH, CONFIG_PATH)
-            need_init = True
-        # initialize config file
-        if need_init:
-            # 1. Available x11vnc options
+        # Check config file, and create or migrate it if needed.
+        # It may be already loaded, e.g. by the session restore preflight.
+        if config is None:
+            config, created = load_config()
+        else:
+            created = False
+        changed = False
+        # 1. Available x11vnc options, for new options or a new config file
+        if (any(value['available'] is None for value in config['x11vncOptions'].values())
+                and X11VNCServer.available()):
             # Get available x11vnc options from x11vnc first
-            p = SubprocessWrapper()
-            arg = 'x11vnc -opts'
-            ret = p.run(arg)
-            options = tuple(m.group(1) for m in re.finditer(r"\s*(-\w+)\s+", ret))
+            options = X11VNCServer().discover_options()
             # Set/unset available x11vnc options flags in config
-            with open(CONFIG_PATH, 'r') as f, open(DATA_PATH, 'r') as f_data:
-                config = json.load(f)
+            for key, value in config["x11vncOptions"].items():
+                if value['available'] is None:
+                    value["available"] = key in options
+            changed = True
+        # 2. Default Display settings app for a Desktop Environment
+        if created:
+            with open(DATA_PATH, 'r') as f_data:
                 data = json.load(f_data)
-                for key, value in config["x11vncOptions"].items():
-                    if key in options:
-                        value["available"] = True
-                    else:
-                        value["available"] = False
-                # Default Display settings app for a Desktop Environment
-                desktop_environ = os.environ.get('XDG_CURRENT_DESKTOP', '').lower()
-                for key, value in data['displaySettingApps'].items():
-                    if desktop_environ in value['XDG_CURRENT_DESKTOP']:
-                        config["displaySettingApp"] = key
-            # Save the new config
-            with open(CONFIG_PATH, 'w') as f:
-                f.write(json.dumps(config, indent=4, sort_keys=True))
+            desktop_environ = os.environ.get('XDG_CURRENT_DESKTOP', '').lower()
+            for key, value in data['displaySettingApps'].items():
+                if desktop_environ in value['XDG_CURRENT_DESKTOP']:
+                    config["displaySettingApp"] = key
+            changed = True
+        # Save the new config
+        if changed:
+            save_config(config)
+
+    RECONCILE_INTERVAL = 300  # seconds
+
+    def reconcileScreens(self):
+        """Clean up virtual screens leaked by a previous instance, now and
+        periodically while running."""
+        self._reconcileHandle.cancel()
+        try:
+            with operation('reconcileScreens'):
+                self.xrandr.reconcile()
+        except RuntimeError as e:
+            self.log_error(str(e))
+        self._reconciled = True
+        self._reconcileHandle = asyncio.get_event_loop().call_later(
+            self.RECONCILE_INTERVAL, self.reconcileScreens)
 
     def promptError(self, msg):
         self.log_error(msg)
@@ -130,9 +172,13 @@ class Backend(QObject):
             self.promptError(str(e))
             return QQmlListProperty(DisplayProperty, self, [])
 
+    @pyqtProperty('QStringList', constant=True)
+    def vncServers(self):
+        return available_servers()
+
     @pyqtProperty(bool, notify=onVncUsePasswordChanged)
     def vncUsePassword(self):
-        if os.path.isfile(X11VNC_PASSWORD_PATH):
+        if os.path.isfile(X11VNC_PASSWORDS_PATH) or os.path.isfile(X11VNC_PASSWORD_PATH):
             self._vncUsePassword = True
         else:
             if self._vncUsePassword:
@@ -144,31 +190,149 @@ class Backend(QObject):
         self._vncUsePassword = use
         self.onVncUsePasswordChanged.emit(use)
 
+    @pyqtProperty('QStringList', notify=onVncPasswordsChanged)
+    def vncPasswords(self):
+        full, view_only = self._loadPasswords()
+        labels = ["full access"] * len(full) + ["view only"] * len(view_only)
+        return [f"Password {i} ({label})" for i, label in enumerate(labels, 1)]
+
+    def _loadPasswords(self) -> Tuple[List[str], List[str]]:
+        """Full access and view-only passwords"""
+        try:
+            return read_password_list(X11VNC_PASSWORDS_PATH)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.log_error(f"Cannot read the VNC passwords: {e}")
+            return [], []
+        # Older versions kept a single password in the VNC password file only
+        try:
+            return [read_password_file(X11VNC_PASSWORD_PATH)], []
+        except (OSError, ValueError):
+            return [], []
+
+    def _savePasswords(self, full: List[str], view_only: List[str]) -> None:
+        """Write the password list for x11vnc, read again for every new
+        connection, and the first full access password as a VNC password
+        file for the other servers. Raises OSError or ValueError."""
+        if full:
+            write_password_list(full, view_only, X11VNC_PASSWORDS_PATH)
+            write_password_file(full[0], X11VNC_PASSWORD_PATH)
+        else:
+            for path in (X11VNC_PASSWORDS_PATH, X11VNC_PASSWORD_PATH):
+                if os.path.isfile(path):
+                    os.remove(path)
+        self.vncUsePassword = bool(full)
+        self.onVncPasswordsChanged.emit()
+        if self._vncState is self.VNCState.OFF:
+            return
+        if not self.vncServerBackend.supports_passwdfile:
+            self.log("Password changes apply when the VNC server restarts.")
+        elif not self._vncStartedWithPassword or not full:
+            self.log("Restart the VNC server to turn the password on or off.")
+
     @pyqtProperty(VNCState, notify=onVncStateChanged)
     def vncState(self):
         return self._vncState
 
     @vncState.setter
     def vncState(self, state):
+        started = state is self.VNCState.WAITING and self._vncState is self.VNCState.OFF
         self._vncState = state
+        self._updateRuntimeControl(state)
+        if started:
+            self._saveSession()
         self.onVncStateChanged.emit(self._vncState)
 
+    @pyqtProperty(int, notify=onVncPortChanged)
+    def vncPort(self):
+        return self._vncPort
+
+    @vncPort.setter
+    def vncPort(self, port):
+        self._vncPort = port
+        self.onVncPortChanged.emit(port)
+
+    @pyqtProperty(bool, notify=onVncClientIdleChanged)
+    def vncClientIdle(self):
+        return self._vncClientIdle
+
+    @vncClientIdle.setter
+    def vncClientIdle(self, idle):
+        self._vncClientIdle = idle
+        self.onVncClientIdleChanged.emit(idle)
+
+    def _saveSession(self):
+        """Snapshot the working state, so it can be restored at next login"""
+        if self._virtSettings is None or self.vncServerBackend is None:
+            return
+        save_session(snapshot(self.xrandr, self._virtSettings,
+                              self.vncServerBackend.name, self.vncPort))
+
+    def _updateRuntimeControl(self, state):
+        """Run the runtime controllers only while a client is connected"""
+        for controller in self.runtimeControllers:
+            if state is self.VNCState.CONNECTED and controller.handle is None:
+                controller.start()
+            elif state is not self.VNCState.CONNECTED:
+                controller.stop()
+
     # Qt Slots
-    @pyqtSlot(str, int, int, bool, bool)
-    def createVirtScreen(self, device, width, height, portrait, hidpi, pos=''):
+    @pyqtSlot(str, int, int, bool, bool, str, str)
+    def createVirtScreen(self, device, width, height, portrait, hidpi, pos='', relative_to=''):
+        if not self._reconciled:
+            self.reconcileScreens()
         self.xrandr.virt_name = device
         self.log("Creating a Virtual Screen...")
         try:
-            self.xrandr.create_virtual_screen(width, height, portrait, hidpi, pos)
+            with operation('createVirtScreen'):
+                self.xrandr.create_virtual_screen(width, height, portrait, hidpi, pos, relative_to)
         except subprocess.CalledProcessError as e:
             self.promptError(str(e.cmd) + '\n' + e.stdout.decode('utf-8'))
             return
         except RuntimeError as e:
             self.promptError(str(e))
             return
+        self._virtSettings = {'device': device, 'width': width, 'height': height,
+                              'portrait': portrait, 'hidpi': hidpi,
+                              'position': pos, 'relativeTo': relative_to}
         self.virtScreenCreated = True
         self.log("The Virtual Screen successfully created.")
 
+    def restoreVirtScreen(self, session: dict) -> bool:
+        """Create the virtual screen of a session snapshot. The saved layout
+        is applied in one step if the other outputs have not changed.
+
+        Returns:
+            bool -- True if the virtual screen has been created
+        """
+        if not self._reconciled:
+            self.reconcileScreens()
+        virt = session['virt']
+        if not layout_matches(session, self.xrandr.screens):
+            self.log("Outputs changed since the last session. Placing the screen again.")
+            self.createVirtScreen(virt['device'], virt['width'], virt['height'],
+                                  virt['portrait'], virt['hidpi'], virt['position'],
+                                  virt['relativeTo'])
+            return self.virtScreenCreated
+        self.xrandr.virt_name = virt['device']
+        self.log("Restoring the Virtual Screen...")
+        try:
+            with operation('restoreVirtScreen'):
+                self.xrandr.restore_virtual_screen(virt['width'], virt['height'],
+                                                   virt['portrait'], virt['hidpi'],
+                                                   saved_positions(session))
+        except subprocess.CalledProcessError as e:
+            self.promptError(str(e.cmd) + '\n' + e.stdout.decode('utf-8'))
+            return False
+        except RuntimeError as e:
+            self.promptError(str(e))
+            return False
+        self._virtSettings = {key: virt[key] for key in SESSION_VIRT_KEYS}
+        self.virtScreenCreated = True
+        self.log("The Virtual Screen successfully restored.")
+        return True
+
     @pyqtSlot()
     def deleteVirtScreen(self):
         self.log("Deleting the Virtual Screen...")
@@ -177,7 +341,8 @@ class Backend(QObject):
             self.virtScreenCreated = True
             return
         try:
-            self.xrandr.delete_virtual_screen()
+            with operation('deleteVirtScreen'):
+                self.xrandr.delete_virtual_screen()
         except RuntimeError as e:
             self.promptError(str(e))
             return
@@ -185,25 +350,57 @@ class Backend(QObject):
 
     @pyqtSlot(str)
     def createVNCPassword(self, password):
-        if password:
-            password += '\n' + password + '\n\n'  # verify + confirm
-            p = SubprocessWrapper()
-            try:
-                p.run(f"x11vnc -storepasswd {X11VNC_PASSWORD_PATH}", input=password, check=True)
-            except subprocess.CalledProcessError as e:
-                self.promptError(str(e.cmd) + '\n' + e.stdout.decode('utf-8'))
+        self.addVNCPassword(password, False)
+
+    @pyqtSlot(str, bool)
+    def addVNCPassword(self, password, view_only):
+        """Add a password. A running x11vnc accepts it from the next connection."""
+        if not password:
+            self.promptError("Empty password")
+            return
+        full, view_only_passwords = self._loadPasswords()
+        if view_only and not full:
+            self.promptError("Add a full access password first.")
+            return
+        (view_only_passwords if view_only else full).append(password)
+        try:
+            self._savePasswords(full, view_only_passwords)
+        except (OSError, ValueError) as e:
+            self.promptError(f"Failed saving the password: {e}")
+            return
+        if len(password) > PASSWORD_LENGTH:
+            self.log(f"Only the first {PASSWORD_LENGTH} characters of the password "
+                     "are used by VNC authentication.")
+
+    @pyqtSlot(int)
+    def removeVNCPassword(self, index):
+        """Remove a password by its index in vncPasswords"""
+        full, view_only = self._loadPasswords()
+        if not 0 <= index < len(full) + len(view_only):
+            self.promptError("No such password")
+            return
+        if index < len(full):
+            if len(full) == 1 and view_only:
+                self.promptError("Remove the view-only passwords first.")
                 return
-            self.vncUsePassword = True
+            del full[index]
         else:
-            self.promptError("Empty password")
+            del view_only[index - len(full)]
+        try:
+            self._savePasswords(full, view_only)
+        except (OSError, ValueError) as e:
+            self.promptError(f"Failed removing the password: {e}")
 
     @pyqtSlot()
     def deleteVNCPassword(self):
-        if os.path.isfile(X11VNC_PASSWORD_PATH):
-            os.remove(X11VNC_PASSWORD_PATH)
-            self.vncUsePassword = False
-        else:
+        """Remove all passwords"""
+        if not self.vncUsePassword:
             self.promptError("Failed deleting the password file")
+            return
+        try:
+            self._savePasswords([], [])
+        except OSError as e:
+            self.promptError(f"Failed deleting the password file: {e}")
 
     @pyqtSlot(int)
     def startVNC(self, port):
@@ -214,9 +411,15 @@ class Backend(QObject):
         if self.vncState is not self.VNCState.OFF:
             self.promptError("VNC Server is already running.")
             return
-        # regex used in callbacks
-        patter_connected = re.compile(r"^.*Got connection from client.*$", re.M)
-        patter_disconnected = re.compile(r"^.*client_count: 0*$", re.M)
+        # load settings
+        with open(CONFIG_PATH, 'r') as f:
+            config = json.load(f)
+        try:
+            server = get_server(config['vnc']['server'])
+        except RuntimeError as e:
+            self.promptError(str(e))
+            return
+        self.vncServerBackend = server
 
         # define callbacks
         def _connected():
@@ -225,28 +428,54 @@ class Backend(QObject):
 
         def _received(data):
             data = data.decode("utf-8")
-            if (self._vncState is not self.VNCState.CONNECTED) and patter_connected.search(data):
+            for controller in self.runtimeControllers:
+                if isinstance(controller, (QualityController, IdleController, StallWatchdog)):
+                    controller.feed_output(data)
+            clients = server.parse_output(data)
+            if clients is None:
+                return
+            if (self._vncState is not self.VNCState.CONNECTED) and clients > 0:
                 self.log("VNC connected.")
                 self.vncState = self.VNCState.CONNECTED
-            if (self._vncState is self.VNCState.CONNECTED) and patter_disconnected.search(data):
+            if (self._vncState is self.VNCState.CONNECTED) and clients == 0:
                 self.log("VNC disconnected.")
                 self.vncState = self.VNCState.WAITING
 
         def _ended(exitCode):
-            if exitCode is not 0:
+            self.vncRemote.close()
+            self.vncServer = None
+            recovery, self._vncRecovery = self._vncRecovery, None
+            if recovery is not None:
+                self.vncState = self.VNCState.OFF
+                if recovery:
+                    asyncio.get_event_loop().call_soon(self._recoverVNC, recovery, port)
+            elif exitCode != 0:
                 self.vncState = self.VNCState.ERROR
-                self.promptError('X11VNC: Error occurred.\n'
+                self.promptError(f'{server.title}: Error occurred.\n'
                                   'Double check if the port is already used.')
                 self.vncState = self.VNCState.OFF  # TODO: better handling error state
             else:
                 self.vncState = self.VNCState.OFF
             self.log("VNC Exited.")
             atexit.unregister(self.stopVNC)
-        # load settings
-        with open(CONFIG_PATH, 'r') as f:
-            config = json.load(f)
+        # Check the port before starting the server, so it fails fast
+        port_range = max(config['vnc']['portRange'], 0)
+        free_port = find_free_port(port, port_range + 1)
+        if free_port is None:
+            ports = f"Port {port}" if not port_range else f"Ports {port}-{port + port_range}"
+            self.promptError(f"{ports} already used.\n"
+                             "Choose another port or allow alternative ports.")
+            metrics.record('vnc_port', requested=port, port=None)
+            return
+        if free_port != port:
+            self.log(f"Port {port} is already used. Using port {free_port} instead.")
+        metrics.record('vnc_port', requested=port, port=free_port)
+        port = free_port
+        self.vncPort = port
         options = ''
-        if config['customX11vncArgs']['enabled']:
+        if not server.supports_options:
+            pass
+        elif config['customX11vncArgs']['enabled']:
             options = config['customX11vncArgs']['value']
         else:
             for key, value in config['x11vncOptions'].items():
@@ -254,19 +483,126 @@ class Backend(QObject):
                     options += key + ' '
                     if value['arg'] is not None:
                         options += str(value['arg']) + ' '
-        # Sart x11vnc, turn settings object into VNC arguments format
-        logfile = open(X11VNC_LOG_PATH, "wb")
-        self.vncServer = AsyncSubprocess(_connected, _received, _received, _ended, logfile)
         try:
             virt = self.xrandr.get_virtual_screen()
         except RuntimeError as e:
             self.promptError(str(e))
             return
-        clip = f"{virt.width}x{virt.height}+{virt.x_offset}+{virt.y_offset}"
-        arg = f"x11vnc -rfbport {port} -clip {clip} {options}"
-        if self.vncUsePassword:
-            arg += f" -rfbauth {X11VNC_PASSWORD_PATH}"
-        self.vncServer.run(arg)
+        # Runtime controllers adjusting x11vnc while a client is connected
+        self.vncRemote.reset()
+        self.runtimeControllers = []
+        adaptive = config['vnc']['adaptiveQuality']
+        if adaptive['enabled'] and server.supports_remote:
+            self.runtimeControllers.append(QualityController(self.vncRemote, port,
+                                                             adaptive['scaling']))
+        hidpi = self._virtSettings is not None and self._virtSettings['hidpi']
+        if config['vnc']['hidpiScaling'] and hidpi and server.supports_remote:
+            # Keep the doubled X output, but send a scaled framebuffer
+            options += f"-scale {HiDPIScaler.startup_scale()} "
+            self.vncRemote.reset(scale=HiDPIScaler.startup_scale())
+            self.runtimeControllers.append(HiDPIScaler(self.vncRemote, port))
+        if config['vnc']['activitySampling'] and server.supports_remote:
+            try:
+                from .sampler import ActivitySampler
+            except ImportError as e:
+                self.log_error(f"Screen activity sampling needs NumPy: {e}")
+            else:
+                self.runtimeControllers.append(ActivitySampler(self.vncRemote, virt))
+        idle = config['vnc']['idle']
+        if idle['enabled'] and server.supports_remote:
+            self.runtimeControllers.append(
+                IdleController(self.vncRemote, idle['timeout'], idle['wait'],
+                               lambda idle: setattr(self, 'vncClientIdle', idle)))
+        password_path = None
+        if self.vncUsePassword and server.supports_passwdfile:
+            if not os.path.isfile(X11VNC_PASSWORDS_PATH):
+                # Password of an older version
+                full, view_only = self._loadPasswords()
+                if not full:
+                    self.promptError("Cannot read the VNC password. Create a new one.")
+                    return
+                try:
+                    self._savePasswords(full, view_only)
+                except (OSError, ValueError) as e:
+                    self.promptError(f"Failed saving the password: {e}")
+                    return
+            password_path = X11VNC_PASSWORDS_PATH
+        elif self.vncUsePassword:
+            password_path = X11VNC_PASSWORD_PATH
+        self._vncStartedWithPassword = password_path is not None
+        try:
+            limits = ResourceLimits.from_config(config['vnc']['resources'])
+        except ValueError as e:
+            self.promptError(str(e))
+            return
+        if config['vnc']['onDemand']:
+            if server.supports_inetd:
+                arg = server.build_args(port, virt, options, password_path, inetd=True)
+                self._startOnDemandVNC(port, arg, limits)
+                return
+            self.log_error(f"{server.title} cannot be started on demand. Starting it now.")
+        watchdog = config['vnc']['watchdog']
+        if watchdog['enabled']:
+            self.runtimeControllers.append(StallWatchdog(
+                lambda: self.vncServer.transport.get_pid(), port,
+                lambda reason: self._vncStalled(reason, watchdog['recovery']),
+                watchdog['timeout'], watchdog['probe']))
+        # Start the server, turn settings object into its arguments format
+        arg = server.build_args(port, virt, options, password_path)
+        logfile = open(X11VNC_LOG_PATH, "wb")
+        self.vncServer = AsyncSubprocess(_connected, _received, _received, _ended, logfile)
+        self.vncServer.run(limits.wrap(arg), preexec_fn=limits.preexec_fn)
+        # auto stop on exit
+        atexit.register(self.stopVNC, force=True)
+
+    ON_DEMAND_LOG_MAX_BYTES = 1024 * 1024  # Rotated to X11VNC_LOG_PATH.1 above this
+
+    def _startOnDemandVNC(self, port, arg, limits):
+        """Listen on the port ourselves and spawn the server in inetd mode per
+        connection. It exits when its client leaves, so it uses no CPU while idle."""
+        def _accepted(conn):
+            # Connection state follows the lifetime of the spawned servers
+            def _received(data):
+                pass
+
+            def _connected():
+                if self._vncState is not self.VNCState.CONNECTED:
+                    self.log("VNC connected.")
+                    self.vncState = self.VNCState.CONNECTED
+
+            def _ended(exitCode):
+                self.vncClients.remove(server)
+                if exitCode != 0:
+                    self.log_error(f"VNC: client session exited with {exitCode}.")
+                if self.vncClients:
+                    return
+                if self.vncActivator is not None:
+                    self.log("VNC disconnected.")
+                    self.vncState = self.VNCState.WAITING
+                else:
+                    self.vncState = self.VNCState.OFF
+                    self.log("VNC Exited.")
+                    atexit.unregister(self.stopVNC)
+            # Sessions append to the log, kept below the size limit
+            if (os.path.exists(X11VNC_LOG_PATH)
+                    and os.path.getsize(X11VNC_LOG_PATH) > self.ON_DEMAND_LOG_MAX_BYTES):
+                os.replace(X11VNC_LOG_PATH, X11VNC_LOG_PATH + '.1')
+            logfile = open(X11VNC_LOG_PATH, "ab")
+            server = AsyncSubprocess(_connected, _received, _received, _ended, logfile)
+            self.vncClients.append(server)
+            server.run(limits.wrap(arg), stdio=conn, preexec_fn=limits.preexec_fn)
+
+        open(X11VNC_LOG_PATH, "wb").close()
+        self.vncActivator = SocketActivator(port, _accepted)
+        try:
+            self.vncActivator.start()
+        except OSError as e:
+            self.vncActivator = None
+            self.promptError(f"Failed to listen on port {port}.\n{e.strerror}\n"
+                             "Double check if the port is already used.")
+            return
+        self.log(f"VNC started on demand. Now connect a VNC client to port {port}.")
+        self.vncState = self.VNCState.WAITING
         # auto stop on exit
         atexit.register(self.stopVNC, force=True)
 
@@ -308,18 +644,77 @@ class Backend(QObject):
     @pyqtSlot()
     def stopVNC(self, force=False):
         if force:
-            # Usually called from atexit().
-            self.vncServer.close()
+            # Usually called from atexit(), when the event loop does not run
+            # any more, so the state is not updated.
+            self._closeVNC()
             time.sleep(3)  # Make sure X11VNC shutdown before execute next atexit().
+            return
         if self._vncState in (self.VNCState.WAITING, self.VNCState.CONNECTED):
-            self.vncServer.close()
+            self._closeVNC()
         else:
             self.promptError("stopVNC called while it is not running")
 
+    RECOVERY_WINDOW = 600  # seconds
+    MAX_RECOVERIES = 3  # in RECOVERY_WINDOW, then give up
+
+    def _vncStalled(self, reason, recovery):
+        """Kill the hung server. It is restarted, and the virtual screen is
+        recreated if recovery is 'recreate', once it has exited."""
+        now = time.monotonic()
+        self._vncRecoveries = [t for t in self._vncRecoveries if now - t < self.RECOVERY_WINDOW]
+        if len(self._vncRecoveries) >= self.MAX_RECOVERIES:
+            metrics.record('watchdog', state='gave_up', reason=reason)
+            self._vncRecovery = ''  # Exit without the usual error message
+            self.vncServer.kill()
+            self.promptError(f"The VNC server stopped responding ({reason}).\n"
+                             f"It stalled {self.MAX_RECOVERIES} times recently, so it is not "
+                             "restarted again.")
+            return
+        self._vncRecoveries.append(now)
+        self.log_error(f"The VNC server stopped responding ({reason}). Restarting it.")
+        self._vncRecovery = recovery
+        self.vncServer.kill()
+
+    def _recoverVNC(self, recovery, port):
+        if recovery == 'recreate' and self._virtSettings is not None:
+            settings = self._virtSettings
+            self.deleteVirtScreen()
+            self.createVirtScreen(settings['device'], settings['width'], settings['height'],
+                                  settings['portrait'], settings['hidpi'],
+                                  settings['position'], settings['relativeTo'])
+            if not self.virtScreenCreated:
+                metrics.record('watchdog', state='recovery_failed', recovery=recovery)
+                return
+        self.startVNC(port)
+        metrics.record('watchdog', state='recovered', recovery=recovery)
+
+    def _closeVNC(self):
+        """Stop the server. Safe to call again while it is stopping."""
+        if self.vncClients and self.vncActivator is None:
+            return  # On-demand sessions already closing
+        if self.vncActivator is None:
+            if self.vncServer is not None:
+                self.vncServer.close()
+            return
+        # On-demand mode: stop listening, then close connected sessions
+        self.vncActivator.close()
+        self.vncActivator = None
+        if not self.vncClients:
+            self.vncState = self.VNCState.OFF
+            self.log("VNC Exited.")
+            atexit.unregister(self.stopVNC)
+        for server in self.vncClients:
+            server.close()
+
     @pyqtSlot()
     def clearCache(self):
-        # engine.clearComponentCache()
-        pass
+        """Release components and JavaScript objects no longer in use"""
+        context = QQmlEngine.contextForObject(self)
+        if context is None:  # Not created by QML
+            return
+        engine = context.engine()
+        engine.trimComponentCache()
+        engine.collectGarbage()
 
     @pyqtSlot()
     def quitProgram(self):
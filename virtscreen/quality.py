@@ -0,0 +1,254 @@
+"""Adaptive quality controller for connected VNC clients"""
+
+import re
+import shutil
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+from .remote import X11VNCRemote
+from . import metrics
+
+
+class ClientStats(object):
+    """Network statistics of a connected VNC client"""
+    __slots__ = ['peer', 'rtt', 'rate', 'notsent', 'acked']
+
+    def __init__(self):
+        self.peer: str = None
+        self.rtt: float = None  # ms
+        self.rate: float = None  # KB/s, measured from acked bytes
+        self.notsent: int = 0  # bytes waiting in the send buffer
+        self.acked: int = None  # bytes acked in total
+
+    def __str__(self) -> str:
+        return f"{self.peer} rtt {self.rtt} ms, rate {self.rate} KB/s, notsent {self.notsent} B"
+
+
+class QualityController:
+    """Adjust x11vnc at runtime according to the throughput and latency
+    of connected clients, taken from socket statistics (ss) and x11vnc
+    output. A level is only changed after several consistent samples
+    so the settings do not oscillate."""
+
+    # Quality levels, from the best to the most bandwidth-saving
+    LEVELS: Tuple[Dict[str, float], ...] = (
+        {'wait': 20, 'defer': 20},
+        {'wait': 40, 'defer': 40},
+        {'wait': 80, 'defer': 60},
+        {'wait': 150, 'defer': 100},
+        {'wait': 300, 'defer': 200},
+    )
+    SCALES: Tuple[float, ...] = (1, 1, 1, 0.75, 0.5)
+    # Remote control source and metrics event name
+    SOURCE = 'quality'
+    # Thresholds of a congested or a good link
+    RTT_HIGH = 120  # ms
+    RTT_LOW = 40  # ms
+    NOTSENT_HIGH = 128 * 1024  # bytes
+    NOTSENT_LOW = 16 * 1024  # bytes
+    # Hysteresis: number of consecutive samples needed to change the level
+    DEGRADE_AFTER = 2
+    IMPROVE_AFTER = 5
+
+    pattern_rate = re.compile(r"network rate\s+([\d.]+)\s*KB/sec")
+    pattern_latency = re.compile(r"latency:\s+([\d.]+)\s*ms")
+
+    def __init__(self, remote: X11VNCRemote, port: int, scaling: bool = False,
+                 interval: float = 2.0):
+        self.remote: X11VNCRemote = remote
+        self.port: int = port
+        self.scaling: bool = scaling
+        self.interval: float = interval
+        self.level: int = 0
+        self.bad: int = 0
+        self.good: int = 0
+        self.hint: ClientStats = None
+        self.previous: Dict[str, ClientStats] = {}
+        self.handle: asyncio.Handle = None
+        self.sampling: asyncio.Task = None
+
+    def settings(self, level: int) -> Dict[str, float]:
+        settings = dict(self.LEVELS[level])
+        if self.scaling:
+            settings['scale'] = self.SCALES[level]
+        return settings
+
+    def start(self) -> None:
+        self.level = self.initial_level()
+        self.bad = 0
+        self.good = 0
+        self.previous = {}
+        self.remote.request(self.SOURCE, **self.settings(self.level))
+        self._schedule()
+
+    def initial_level(self) -> int:
+        return 0
+
+    def stop(self) -> None:
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.sampling is not None:
+            self.sampling.cancel()
+            self.sampling = None
+        # The next client may be on another link
+        self.hint = None
+        self.remote.release(self.SOURCE)
+
+    def _schedule(self) -> None:
+        self.handle = asyncio.get_event_loop().call_later(self.interval, self._tick)
+
+    def _tick(self) -> None:
+        self.sampling = asyncio.ensure_future(self._update())
+
+    async def _update(self) -> None:
+        try:
+            self.decide(await self.sample())
+        finally:
+            self.sampling = None
+            if self.handle is not None:  # Not stopped meanwhile
+                self._schedule()
+
+    def feed_output(self, data: str) -> None:
+        """Take the link rate and latency x11vnc measures when a client connects."""
+        rate = self.pattern_rate.search(data)
+        latency = self.pattern_latency.search(data)
+        if not (rate or latency):
+            return
+        if self.hint is None:
+            self.hint = ClientStats()
+            self.hint.peer = 'x11vnc'
+        if rate:
+            self.hint.rate = float(rate.group(1))
+        if latency:
+            self.hint.rtt = float(latency.group(1))
+
+    async def sample(self) -> List[ClientStats]:
+        """Socket statistics of clients connected to the port. ss runs
+        without blocking the event loop."""
+        if not shutil.which('ss'):
+            return [self.hint] if self.hint is not None else []
+        process = await asyncio.create_subprocess_exec(
+            'ss', '-tinH', 'state', 'established', f"( sport = :{self.port} )",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        output, _ = await process.communicate()
+        return self.parse(output.decode('utf-8'))
+
+    def parse(self, output: str) -> List[ClientStats]:
+        """Parse the output of ss -tinH, and compute the rates from the
+        previous sample"""
+        clients = []
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            if not line[0].isspace():
+                stats = ClientStats()
+                stats.peer = line.split()[-1]
+                clients.append(stats)
+                continue
+            if not clients:
+                continue
+            stats = clients[-1]
+            match = re.search(r"\brtt:([\d.]+)/", line)
+            if match:
+                stats.rtt = float(match.group(1))
+            match = re.search(r"\bnotsent:(\d+)", line)
+            if match:
+                stats.notsent = int(match.group(1))
+            match = re.search(r"\bbytes_acked:(\d+)", line)
+            if match:
+                stats.acked = int(match.group(1))
+        for stats in clients:
+            previous = self.previous.get(stats.peer)
+            if previous is not None and stats.acked is not None and previous.acked is not None:
+                stats.rate = (stats.acked - previous.acked) / 1024 / self.interval
+        self.previous = {stats.peer: stats for stats in clients}
+        return clients
+
+    def decide(self, clients: List[ClientStats]) -> None:
+        """Change the quality level based on the worst client"""
+        if not clients:
+            return
+        congested = any((c.rtt is not None and c.rtt > self.RTT_HIGH) or
+                        c.notsent > self.NOTSENT_HIGH for c in clients)
+        healthy = all((c.rtt is None or c.rtt < self.RTT_LOW) and
+                      c.notsent < self.NOTSENT_LOW for c in clients)
+        self.bad = self.bad + 1 if congested else 0
+        self.good = self.good + 1 if healthy else 0
+        level = self.level
+        if self.bad >= self.DEGRADE_AFTER and level < len(self.LEVELS) - 1:
+            level += 1
+            reason = 'congested'
+        elif self.good >= self.IMPROVE_AFTER and level > 0:
+            level -= 1
+            reason = 'healthy'
+        else:
+            return
+        self.change(level, reason, clients)
+
+    def change(self, level: int, reason: str, clients: List[ClientStats]) -> None:
+        self.bad = 0
+        self.good = 0
+        logging.info(f"{self.SOURCE} level {self.level} -> {level} ({reason}): "
+                     + '; '.join(str(c) for c in clients))
+        metrics.record(self.SOURCE, level=level, previous=self.level, reason=reason,
+                       clients=[{'peer': c.peer, 'rtt': c.rtt, 'rate': c.rate,
+                                 'notsent': c.notsent} for c in clients],
+                       **self.settings(level))
+        self.level = level
+        self.remote.request(self.SOURCE, **self.settings(level))
+
+
+class HiDPIScaler(QualityController):
+    """Serve a HiDPI virtual screen scaled down for slow links.
+
+    The X output keeps its doubled size for crisp rendering, while x11vnc
+    scans the full screen but sends a scaled framebuffer (x11vnc -scale).
+    Clients start at full scale. It is scaled down once the link rate x11vnc
+    measures when a client connects calls for it, then it follows congestion
+    like QualityController.
+    x11vnc has a single framebuffer, so all clients get the same scale.
+    """
+
+    LEVELS: Tuple[Dict[str, float], ...] = (
+        {'scale': 1},
+        {'scale': 0.75},
+        {'scale': 0.5},
+    )
+    # Minimum link rate for the first scale of each level
+    RATES: Tuple[float, ...] = (
+        20 * 1024,  # KB/s
+        5 * 1024,
+        0,
+    )
+    SOURCE = 'hidpi'
+
+    def __init__(self, remote: X11VNCRemote, port: int, interval: float = 2.0):
+        super(HiDPIScaler, self).__init__(remote, port, False, interval)
+
+    @classmethod
+    def startup_scale(cls) -> float:
+        """Scale x11vnc starts with, before the link rate is known"""
+        return cls.LEVELS[0]['scale']
+
+    def settings(self, level: int) -> Dict[str, float]:
+        return dict(self.LEVELS[level])
+
+    def feed_output(self, data: str) -> None:
+        known = self.hint is not None and self.hint.rate is not None
+        super(HiDPIScaler, self).feed_output(data)
+        if known or self.hint is None or self.hint.rate is None:
+            return
+        # x11vnc measures the link rate shortly after the client connects
+        level = self.initial_level()
+        if self.handle is not None and level != self.level:
+            self.change(level, 'link rate', [self.hint])
+
+    def initial_level(self) -> int:
+        if self.hint is None or self.hint.rate is None:
+            return 0
+        for level, rate in enumerate(self.RATES):
+            if self.hint.rate >= rate:
+                return level
+        return len(self.LEVELS) - 1
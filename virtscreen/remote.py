@@ -0,0 +1,84 @@
+"""x11vnc remote control"""
+
+import logging
+from typing import Any, Dict
+
+from .process import AsyncSubprocess
+
+
+class X11VNCRemote:
+    """Change settings of a running x11vnc through its remote control
+    interface (x11vnc -R). Several sources (e.g. the quality controller)
+    can request settings at the same time and the most conservative
+    request wins: the largest -wait/-defer and the smallest -scale."""
+
+    # How to merge values requested by different sources
+    MERGE = {
+        'scale': min,
+    }
+    # Values restored when no source requests a setting any more
+    DEFAULTS = {
+        'wait': 20,
+        'defer': 20,
+        'scale': 1,
+    }
+
+    def __init__(self):
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.applied: Dict[str, Any] = {}
+        self.base: Dict[str, Any] = dict(self.DEFAULTS)
+        self.closed: bool = False
+
+    def request(self, source: str, **settings) -> None:
+        """Request settings on behalf of a source, replacing its previous request."""
+        self.requests[source] = settings
+        self._apply()
+
+    def release(self, source: str) -> None:
+        """Withdraw all requests of a source."""
+        if self.requests.pop(source, None) is not None:
+            self._apply()
+
+    def reset(self, **applied) -> None:
+        """Forget everything. Call it when the server (re)starts, with the
+        settings given on its command line."""
+        self.requests = {}
+        self.applied = applied
+        self.base = dict(self.DEFAULTS, **applied)
+        self.closed = False
+
+    def close(self) -> None:
+        """The server exited: forget requests and send nothing until reset."""
+        self.requests = {}
+        self.closed = True
+
+    def _apply(self) -> None:
+        merged: Dict[str, Any] = {}
+        for settings in self.requests.values():
+            for key, value in settings.items():
+                if key in merged:
+                    merged[key] = self.MERGE.get(key, max)(merged[key], value)
+                else:
+                    merged[key] = value
+        for key in self.applied:
+            if key not in merged and key in self.base:
+                merged[key] = self.base[key]
+        for key, value in merged.items():
+            if self.applied.get(key) == value:
+                continue
+            self.applied[key] = value
+            self.send(f"{key}:{value}")
+
+    def send(self, command: str) -> None:
+        """Send a raw remote control command without blocking."""
+        if self.closed:
+            return
+
+        def _ended(exitCode):
+            if exitCode != 0:
+                logging.warning(f"x11vnc -R {command} failed with {exitCode}")
+
+        logging.info(f"x11vnc -R {command}")
+        program = AsyncSubprocess(lambda: None, lambda data: None,
+                                  lambda data: None, _ended)
+        program.run(f"x11vnc -R {command}")
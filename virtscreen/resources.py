@@ -0,0 +1,104 @@
+"""Resource isolation for spawned servers"""
+
+import os
+import shutil
+import logging
+from typing import Callable, Optional, Set
+
+
+class ResourceLimits:
+    """CPU affinity, scheduling priorities and cgroup limits of a spawned
+    server, so it does not compete with the compositor and foreground
+    applications.
+
+    Affinity and niceness are set in the child before exec. I/O priority
+    and cgroup v2 limits are applied by wrapping the command with
+    ionice(1) and systemd-run(1) --user --scope, which both exec the
+    command in the same process.
+    """
+
+    IONICE_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+    def __init__(self, cpu_affinity: str = '', nice: int = 0, ionice: str = '',
+                 cpu_quota: str = '', memory_max: str = ''):
+        """Raises ValueError for a setting the server could not start with"""
+        self.cpus: Set[int] = self.parse_cpus(cpu_affinity)
+        self.nice: int = int(nice)
+        self.ionice: str = ionice
+        self.ionice_level: Optional[int] = None
+        self.cpu_quota: str = cpu_quota
+        self.memory_max: str = memory_max
+        allowed = os.sched_getaffinity(0)
+        if not self.cpus <= allowed:
+            unavailable = ','.join(str(cpu) for cpu in sorted(self.cpus - allowed))
+            available = ','.join(str(cpu) for cpu in sorted(allowed))
+            raise ValueError(f"CPU {unavailable} is not available. Available CPUs: {available}")
+        if not 0 <= self.nice <= 19:
+            raise ValueError("Nice level must be between 0 and 19.")
+        io_class, _, level = ionice.partition(':')
+        if ionice and io_class not in self.IONICE_CLASSES:
+            raise ValueError(f"Unknown I/O scheduling class: {ionice}")
+        if level:
+            try:
+                self.ionice_level = int(level)
+            except ValueError:
+                raise ValueError(f"Invalid I/O priority level: {ionice}")
+            if not 0 <= self.ionice_level <= 7:
+                raise ValueError("I/O priority level must be between 0 and 7.")
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'ResourceLimits':
+        return cls(config.get('cpuAffinity', ''), config.get('nice', 0),
+                   config.get('ionice', ''), config.get('cpuQuota', ''),
+                   config.get('memoryMax', ''))
+
+    @staticmethod
+    def parse_cpus(cpus: str) -> Set[int]:
+        """Parse a CPU list like '0-2,5'"""
+        result: Set[int] = set()
+        for part in cpus.replace(' ', '').split(','):
+            if not part:
+                continue
+            try:
+                if '-' in part:
+                    start, end = part.split('-')
+                    result.update(range(int(start), int(end) + 1))
+                else:
+                    result.add(int(part))
+            except ValueError:
+                raise ValueError(f"Invalid CPU list: {cpus}")
+        return result
+
+    def wrap(self, arg: str) -> str:
+        """Prefix the command line with ionice and systemd-run if needed"""
+        if self.ionice:
+            io_class = self.ionice.partition(':')[0]
+            prefix = f"ionice -c {self.IONICE_CLASSES[io_class]}"
+            if self.ionice_level is not None:
+                prefix += f" -n {self.ionice_level}"
+            arg = f"{prefix} {arg}"
+        properties = ''
+        if self.cpu_quota:
+            properties += f" -p CPUQuota={self.cpu_quota}"
+        if self.memory_max:
+            properties += f" -p MemoryMax={self.memory_max}"
+        if properties:
+            if shutil.which('systemd-run'):
+                arg = f"systemd-run --user --scope --quiet{properties} {arg}"
+            else:
+                logging.warning("systemd-run is not found. cgroup limits are ignored.")
+        return arg
+
+    @property
+    def preexec_fn(self) -> Optional[Callable[[], None]]:
+        """preexec, or None if there is nothing to set in the child. Running
+        Python code between fork and exec is unsafe next to other threads
+        (e.g. the logging and profiling threads), so it is only done if needed."""
+        return self.preexec if self.cpus or self.nice else None
+
+    def preexec(self) -> None:
+        """Called in the child process before exec"""
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
+        if self.nice:
+            os.nice(self.nice)
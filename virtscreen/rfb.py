@@ -0,0 +1,545 @@
+"""Built-in RFB (VNC) server
+
+A minimal RFB 3.8 server serving only the virtual screen. Unlike x11vnc,
+which polls the whole root window and clips afterwards, it captures the
+virtual screen rectangle alone with MIT-SHM into a reused buffer and finds
+changed tiles with vectorized NumPy comparisons. Rectangles are sent with
+the ZRLE, Zlib or Raw encoding, whichever the client prefers.
+
+    python -m virtscreen.rfb --clip 1368x1024+1920+0 [--port 5900 | --inetd]
+                             [--rfbauth FILE] [--view-only]
+
+Client counts are logged to stderr as "client_count: N", like x11vnc.
+"""
+
+import os
+import re
+import sys
+import hmac
+import zlib
+import ctypes
+import socket
+import signal
+import struct
+import asyncio
+import logging
+import argparse
+from typing import List, Set, Tuple
+
+import numpy as np
+
+from .capture import ScreenCapture, _load
+from .vncauth import challenge_response, read_password_file, CHALLENGE_SIZE
+
+
+TILE = 64  # Size of dirty tiles, also the ZRLE tile size
+
+# Encodings
+RAW = 0
+ZLIB = 6
+ZRLE = 16
+ENCODINGS = (ZRLE, ZLIB, RAW)  # Supported, in the order of preference
+
+# Security types
+SECURITY_NONE = 1
+SECURITY_VNC = 2
+
+_UPDATE_HEADER = struct.Struct('>BxH')
+_RECT_HEADER = struct.Struct('>HHHHi')
+_LENGTH = struct.Struct('>I')
+
+
+class PixelFormat:
+    """RFB pixel format. The native format is the 32 bit BGRX layout of the
+    capture buffer, so it is sent without conversion."""
+
+    STRUCT = struct.Struct('>BBBBHHHBBBxxx')
+
+    def __init__(self, bpp: int = 32, depth: int = 24, big_endian: bool = False,
+                 true_colour: bool = True, red_max: int = 255, green_max: int = 255,
+                 blue_max: int = 255, red_shift: int = 16, green_shift: int = 8,
+                 blue_shift: int = 0):
+        self.bpp: int = bpp
+        self.depth: int = depth
+        self.big_endian: bool = bool(big_endian)
+        self.true_colour: bool = bool(true_colour)
+        self.red_max: int = red_max
+        self.green_max: int = green_max
+        self.blue_max: int = blue_max
+        self.red_shift: int = red_shift
+        self.green_shift: int = green_shift
+        self.blue_shift: int = blue_shift
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'PixelFormat':
+        """Raises ValueError for formats not supported"""
+        pixel_format = cls(*cls.STRUCT.unpack(data))
+        if pixel_format.bpp not in (8, 16, 32):
+            raise ValueError(f"Unsupported bits per pixel: {pixel_format.bpp}")
+        if not pixel_format.true_colour:
+            raise ValueError("Colour map pixel formats are not supported")
+        return pixel_format
+
+    def pack(self) -> bytes:
+        return self.STRUCT.pack(self.bpp, self.depth, self.big_endian, self.true_colour,
+                                self.red_max, self.green_max, self.blue_max,
+                                self.red_shift, self.green_shift, self.blue_shift)
+
+    @property
+    def native(self) -> bool:
+        return self.pack() == NATIVE_FORMAT.pack()
+
+    def convert(self, region: np.ndarray) -> np.ndarray:
+        """Pixels of a (height, width, 4) BGRX region in this format, as a
+        (height, width, bytes per pixel) uint8 array. The native format
+        returns the region itself."""
+        if self.native:
+            return region
+        height, width = region.shape[:2]
+        pixels = np.zeros((height, width), dtype=np.uint32)
+        for channel, maximum, shift in ((2, self.red_max, self.red_shift),
+                                        (1, self.green_max, self.green_shift),
+                                        (0, self.blue_max, self.blue_shift)):
+            pixels |= (region[..., channel].astype(np.uint32) * maximum // 255) << shift
+        order = '>' if self.big_endian else '<'
+        pixels = pixels.astype(f"{order}u{self.bpp // 8}")
+        return pixels.view(np.uint8).reshape(height, width, self.bpp // 8)
+
+    def cpixel(self) -> slice:
+        """Bytes of a pixel used as a compressed pixel (CPIXEL) of ZRLE"""
+        if not (self.bpp == 32 and self.depth <= 24):
+            return slice(0, self.bpp // 8)
+        masks = [maximum << shift for maximum, shift in ((self.red_max, self.red_shift),
+                                                         (self.green_max, self.green_shift),
+                                                         (self.blue_max, self.blue_shift))]
+        if all(mask < 1 << 24 for mask in masks):  # Fits in the least significant bytes
+            return slice(1, 4) if self.big_endian else slice(0, 3)
+        if all(mask & 0xff == 0 for mask in masks):  # Fits in the most significant bytes
+            return slice(0, 3) if self.big_endian else slice(1, 4)
+        return slice(0, 4)
+
+
+NATIVE_FORMAT = PixelFormat()
+
+
+def dirty_tiles(previous: np.ndarray, current: np.ndarray, tile: int = TILE,
+                changed: np.ndarray = None) -> np.ndarray:
+    """Tiles having any changed pixel.
+
+    Arguments:
+        previous, current {np.ndarray} -- (height, width) uint32 frames
+        changed {np.ndarray} -- bool buffer of whole tiles covering the frame,
+                                reused between calls (default: None)
+
+    Returns:
+        np.ndarray -- (rows, columns) bool array of tiles, the last row and
+                      column may cover less pixels
+    """
+    height, width = current.shape
+    rows, cols = -(-height // tile), -(-width // tile)
+    if changed is None:
+        changed = np.zeros((rows * tile, cols * tile), dtype=bool)
+    # Pixels out of the frame are never written, so they stay unchanged
+    np.not_equal(previous, current, out=changed[:height, :width])
+    # Reduce rows first: any() over the contiguous axis is the slowest
+    return changed.reshape(rows, tile, -1).any(axis=1).reshape(rows, cols, tile).any(axis=2)
+
+
+def dirty_rects(tiles: np.ndarray, width: int, height: int,
+                tile: int = TILE) -> List[Tuple[int, int, int, int]]:
+    """Cover the dirty tiles with a few (x, y, width, height) rectangles.
+    Runs of dirty tiles in a row make a rectangle, extended downwards while
+    the next rows have the same run."""
+    rects: List[List[int]] = []
+    extending = {}  # (first, last column) -> index in rects
+    for row, line in enumerate(tiles):
+        edges = np.diff(np.concatenate(([0], line.astype(np.int8), [0])))
+        runs = zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+        current = {}
+        for run in runs:
+            if run in extending:
+                rects[extending[run]][3] += 1
+                current[run] = extending[run]
+            else:
+                current[run] = len(rects)
+                rects.append([run[0], row, run[1] - run[0], 1])
+        extending = current
+    result = []
+    for col, row, cols, rows in rects:
+        x, y = int(col) * tile, row * tile
+        result.append((x, y, min(x + int(cols) * tile, width) - x,
+                       min(y + rows * tile, height) - y))
+    return result
+
+
+class XTestInput:
+    """Inject pointer and key events of clients with the XTEST extension"""
+
+    def __init__(self, x_offset: int, y_offset: int, display: str = None):
+        self.x_offset: int = x_offset
+        self.y_offset: int = y_offset
+        self.buttons: int = 0
+        self.position: Tuple[int, int] = None
+        self.xlib = _load('X11')
+        self.xtst = _load('Xtst')
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.xlib.XKeysymToKeycode.restype = ctypes.c_ubyte
+        self.xlib.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        self.xlib.XFlush.argtypes = [ctypes.c_void_p]
+        self.xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.xtst.XTestQueryExtension.argtypes = [ctypes.c_void_p] + [ctypes.c_void_p] * 4
+        self.xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint,
+                                                ctypes.c_int, ctypes.c_ulong]
+        self.xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint,
+                                                   ctypes.c_int, ctypes.c_ulong]
+        self.xtst.XTestFakeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int,
+                                                   ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        self.display = self.xlib.XOpenDisplay(display.encode() if display else None)
+        if not self.display:
+            raise RuntimeError("Cannot open the X display.")
+        version = [ctypes.c_int() for _ in range(4)]
+        if not self.xtst.XTestQueryExtension(self.display,
+                                             *(ctypes.byref(v) for v in version)):
+            self.close()
+            raise RuntimeError("The X server has no XTEST extension.")
+
+    def key(self, down: bool, keysym: int) -> None:
+        keycode = self.xlib.XKeysymToKeycode(self.display, keysym)
+        if not keycode:
+            logging.debug(f"No keycode for keysym {keysym:#x}")
+            return
+        self.xtst.XTestFakeKeyEvent(self.display, keycode, down, 0)
+        self.xlib.XFlush(self.display)
+
+    def pointer(self, buttons: int, x: int, y: int) -> None:
+        if (x, y) != self.position:
+            self.xtst.XTestFakeMotionEvent(self.display, -1, x + self.x_offset,
+                                           y + self.y_offset, 0)
+            self.position = (x, y)
+        changed = buttons ^ self.buttons
+        for bit in range(8):
+            if changed & (1 << bit):
+                self.xtst.XTestFakeButtonEvent(self.display, bit + 1,
+                                               bool(buttons & (1 << bit)), 0)
+        self.buttons = buttons
+        self.xlib.XFlush(self.display)
+
+    def close(self) -> None:
+        if self.display:
+            self.xlib.XCloseDisplay(self.display)
+            self.display = None
+
+
+class RFBClient:
+    """A connected client: handshake, client messages and framebuffer updates"""
+
+    def __init__(self, server: 'RFBServer', reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.server: RFBServer = server
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.pixel_format: PixelFormat = NATIVE_FORMAT
+        self.encoding: int = RAW
+        self.pending: bool = False  # A framebuffer update is requested
+        self.region: np.ndarray = np.ones(server.tiles, dtype=bool)  # Requested tiles
+        self.dirty: np.ndarray = np.ones(server.tiles, dtype=bool)  # Tiles not sent yet
+        self.sent: int = 0  # Bytes of framebuffer updates
+        self.updates: int = 0
+        self._zlib = zlib.compressobj(1)
+        self._zrle = zlib.compressobj(1)
+
+    async def handshake(self) -> bool:
+        """Version, security and initialization messages.
+
+        Returns:
+            bool -- True if the client is authenticated
+        """
+        reader, writer = self.reader, self.writer
+        writer.write(b"RFB 003.008\n")
+        match = re.match(rb"RFB (\d{3})\.(\d{3})\n", await reader.readexactly(12))
+        if not match or int(match.group(1)) != 3:
+            raise ValueError("Unsupported protocol version")
+        minor = min(max(int(match.group(2)), 3), 8)
+        if minor not in (3, 7, 8):
+            minor = 3  # Unknown versions must be treated as 3.3
+        security = SECURITY_VNC if self.server.password is not None else SECURITY_NONE
+        if minor == 3:
+            writer.write(_LENGTH.pack(security))
+        else:
+            writer.write(bytes([1, security]))
+            if (await reader.readexactly(1))[0] != security:
+                return self._fail(minor, "Unsupported security type")
+        if security == SECURITY_VNC:
+            challenge = os.urandom(CHALLENGE_SIZE)
+            writer.write(challenge)
+            response = await reader.readexactly(CHALLENGE_SIZE)
+            expected = challenge_response(self.server.password, challenge)
+            if not hmac.compare_digest(response, expected):
+                return self._fail(minor, "Authentication failed")
+        if security == SECURITY_VNC or minor == 8:
+            writer.write(_LENGTH.pack(0))
+        await reader.readexactly(1)  # Shared flag, the server is always shared
+        name = self.server.name.encode('utf-8')
+        writer.write(struct.pack('>HH', self.server.width, self.server.height)
+                     + NATIVE_FORMAT.pack() + _LENGTH.pack(len(name)) + name)
+        return True
+
+    def _fail(self, minor: int, reason: str) -> bool:
+        logging.info(f"Client rejected: {reason}")
+        self.writer.write(_LENGTH.pack(1))
+        if minor == 8:
+            reason = reason.encode('utf-8')
+            self.writer.write(_LENGTH.pack(len(reason)) + reason)
+        return False
+
+    async def serve(self) -> None:
+        """Handle client messages until the client leaves.
+        Raises asyncio.IncompleteReadError, ConnectionError or ValueError."""
+        reader = self.reader
+        while True:
+            kind = (await reader.readexactly(1))[0]
+            if kind == 0:  # SetPixelFormat
+                self.pixel_format = PixelFormat.unpack((await reader.readexactly(19))[3:])
+                self.dirty[:] = True
+            elif kind == 2:  # SetEncodings
+                count, = struct.unpack('>xH', await reader.readexactly(3))
+                encodings = struct.unpack(f">{count}i", await reader.readexactly(4 * count))
+                self.encoding = next((e for e in encodings if e in ENCODINGS), RAW)
+            elif kind == 3:  # FramebufferUpdateRequest
+                incremental, x, y, width, height = struct.unpack(
+                    '>BHHHH', await reader.readexactly(9))
+                self.region[:] = False
+                self.region[y // TILE:-(-(y + height) // TILE),
+                            x // TILE:-(-(x + width) // TILE)] = True
+                if not incremental:
+                    self.dirty |= self.region
+                self.pending = True
+            elif kind == 4:  # KeyEvent
+                down, keysym = struct.unpack('>BxxI', await reader.readexactly(7))
+                if self.server.input is not None:
+                    self.server.input.key(bool(down), keysym)
+            elif kind == 5:  # PointerEvent
+                buttons, x, y = struct.unpack('>BHH', await reader.readexactly(5))
+                if self.server.input is not None:
+                    self.server.input.pointer(buttons, x, y)
+            elif kind == 6:  # ClientCutText, ignored
+                length, = struct.unpack('>xxxI', await reader.readexactly(7))
+                await reader.readexactly(length)
+            else:
+                raise ValueError(f"Unknown message type {kind}")
+
+    def send_update(self, frame: np.ndarray) -> None:
+        """Send the requested tiles changed since the last update, if any"""
+        tiles = self.dirty & self.region
+        if not tiles.any():
+            return
+        self.dirty &= ~tiles
+        self.pending = False
+        rects = dirty_rects(tiles, self.server.width, self.server.height)
+        chunks = [_UPDATE_HEADER.pack(0, len(rects))]
+        for x, y, width, height in rects:
+            chunks.append(_RECT_HEADER.pack(x, y, width, height, self.encoding))
+            chunks.append(self.encode(frame[y:y + height, x:x + width]))
+        # The capture buffer is reused, so encoded data must not refer to it
+        self.writer.writelines(chunks)
+        self.sent += sum(len(chunk) for chunk in chunks)
+        self.updates += 1
+
+    def encode(self, region: np.ndarray) -> bytes:
+        pixels = self.pixel_format.convert(region)
+        if self.encoding == ZRLE:
+            return self._encode_zrle(pixels)
+        if self.encoding == ZLIB:
+            data = self._zlib.compress(pixels.tobytes()) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+            return _LENGTH.pack(len(data)) + data
+        return pixels.tobytes()
+
+    def _encode_zrle(self, pixels: np.ndarray) -> bytes:
+        """ZRLE with raw (0) and solid (1) tiles"""
+        cpixel = self.pixel_format.cpixel()
+        height, width, size = pixels.shape
+        full = width - width % TILE
+        chunks = []
+        for y in range(0, height, TILE):
+            band = pixels[y:y + TILE]
+            tiles = []
+            if full:
+                # Tiles of the band in a single copy, each one contiguous
+                tiles.extend(np.ascontiguousarray(band[:, :full].reshape(
+                    band.shape[0], full // TILE, TILE, size).swapaxes(0, 1)))
+            if full < width:
+                tiles.append(band[:, full:])
+            for tile in tiles:
+                first = tile[0, 0]
+                if (tile == first).all():
+                    chunks.append(b'\x01' + first[cpixel].tobytes())
+                else:
+                    chunks.append(b'\x00' + tile[..., cpixel].tobytes())
+        data = self._zrle.compress(b''.join(chunks)) + self._zrle.flush(zlib.Z_SYNC_FLUSH)
+        return _LENGTH.pack(len(data)) + data
+
+
+class RFBServer:
+    """Serve frames of a capture to RFB clients.
+
+    Arguments:
+        capture -- ScreenCapture or an object with width, height, grab() and close()
+        input {XTestInput} -- input of clients, or None for view only
+        password {str} -- password of VNC authentication, or None
+        fps {float} -- maximum frames captured per second
+    """
+
+    def __init__(self, capture: ScreenCapture, input: XTestInput = None,
+                 password: str = None, fps: float = 30, name: str = 'VirtScreen'):
+        self.capture: ScreenCapture = capture
+        self.input: XTestInput = input
+        self.password: str = password
+        self.interval: float = 1 / fps
+        self.name: str = name
+        self.width: int = capture.width
+        self.height: int = capture.height
+        self.tiles: Tuple[int, int] = (-(-self.height // TILE), -(-self.width // TILE))
+        self.clients: Set[RFBClient] = set()
+        self.previous: np.ndarray = None
+        self.frame: np.ndarray = None
+        self._changed = np.zeros((self.tiles[0] * TILE, self.tiles[1] * TILE), dtype=bool)
+        self._updates: asyncio.Task = None
+
+    def refresh(self) -> None:
+        """Capture a frame and mark changed tiles dirty for all clients"""
+        self.frame = self.capture.grab()
+        current = self.frame.view(np.uint32)[..., 0]
+        if self.previous is None:
+            self.previous = current.copy()
+            tiles = np.ones(self.tiles, dtype=bool)
+        else:
+            tiles = dirty_tiles(self.previous, current, changed=self._changed)
+            for x, y, width, height in dirty_rects(tiles, self.width, self.height):
+                self.previous[y:y + height, x:x + width] = current[y:y + height, x:x + width]
+        for client in self.clients:
+            client.dirty |= tiles
+
+    async def _update_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            while self.clients:
+                start = loop.time()
+                waiting = [client for client in self.clients if client.pending]
+                if waiting:
+                    self.refresh()
+                    for client in waiting:
+                        client.send_update(self.frame)
+                await asyncio.sleep(max(self.interval - (loop.time() - start), 0))
+        except (RuntimeError, OSError) as e:
+            # Without frames, clients would wait forever. Closing them ends
+            # their sessions in handle().
+            logging.error(f"Screen capture failed: {e}")
+            for client in self.clients:
+                client.writer.close()
+        finally:
+            self._updates = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info('peername')
+        peer = peer[0] if isinstance(peer, tuple) else 'stdio'
+        logging.info(f"Got connection from client {peer}")
+        client = RFBClient(self, reader, writer)
+        try:
+            if await client.handshake():
+                self.clients.add(client)
+                logging.info(f"client_count: {len(self.clients)}")
+                if self._updates is None:
+                    self._updates = asyncio.ensure_future(self._update_loop())
+                await client.serve()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            logging.info(f"Client {peer} left: {e}")
+        finally:
+            if client in self.clients:
+                self.clients.remove(client)
+                logging.info(f"client_count: {len(self.clients)}")
+            writer.close()
+
+    async def serve_inetd(self, sock: socket.socket) -> None:
+        """Serve a single client connected to the socket"""
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self.handle(reader, writer)
+
+    def close(self) -> None:
+        if self._updates is not None:
+            self._updates.cancel()
+            self._updates = None
+        for client in self.clients:
+            client.writer.close()
+        self.clients.clear()
+
+
+def parse_clip(clip: str) -> Tuple[int, int, int, int]:
+    """Parse WxH+X+Y into (x, y, width, height). Raises ValueError."""
+    match = re.fullmatch(r"(\d+)x(\d+)\+(\d+)\+(\d+)", clip)
+    if not match:
+        raise ValueError(f"Invalid clip geometry: {clip}")
+    width, height, x, y = (int(group) for group in match.groups())
+    return x, y, width, height
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m virtscreen.rfb',
+                                     description="Built-in VNC server of VirtScreen")
+    parser.add_argument('--clip', required=True, help="region of the screen, WxH+X+Y")
+    parser.add_argument('--port', type=int, default=5900, help="port to listen on")
+    parser.add_argument('--inetd', action='store_true',
+                        help="serve a single client connected to stdin")
+    parser.add_argument('--rfbauth', help="VNC password file")
+    parser.add_argument('--display', help="X display (default: $DISPLAY)")
+    parser.add_argument('--fps', type=float, default=30, help="maximum frame rate")
+    parser.add_argument('--view-only', action='store_true', help="ignore client input")
+    args = parser.parse_args(argv)
+    # stdout is the client socket in inetd mode
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+    try:
+        x, y, width, height = parse_clip(args.clip)
+        password = read_password_file(args.rfbauth) if args.rfbauth else None
+        capture = ScreenCapture(x, y, width, height, args.display)
+    except (ValueError, OSError, RuntimeError) as e:
+        logging.error(str(e))
+        return 1
+    logging.info(f"Capturing {args.clip} (MIT-SHM: {capture.shm})")
+    input = None
+    if not args.view_only:
+        try:
+            input = XTestInput(x, y, args.display)
+        except RuntimeError as e:
+            logging.warning(f"Client input disabled: {e}")
+    server = RFBServer(capture, input, password, args.fps)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stopped = loop.create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, lambda: stopped.done() or stopped.set_result(None))
+    try:
+        if args.inetd:
+            serving = asyncio.ensure_future(server.serve_inetd(socket.socket(fileno=0)))
+            loop.run_until_complete(asyncio.wait([serving, stopped],
+                                                 return_when=asyncio.FIRST_COMPLETED))
+            serving.cancel()
+        else:
+            listener = loop.run_until_complete(asyncio.start_server(server.handle,
+                                                                    port=args.port))
+            logging.info(f"Listening for VNC connections on port {args.port}")
+            loop.run_until_complete(stopped)
+            listener.close()
+    except OSError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        server.close()
+        capture.close()
+        if input is not None:
+            input.close()
+        loop.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
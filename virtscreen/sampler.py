@@ -0,0 +1,107 @@
+"""Screen activity sampler"""
+
+import asyncio
+import logging
+
+import numpy as np
+
+from .capture import ScreenCapture
+from .display import Display
+from .remote import X11VNCRemote
+from . import metrics
+
+
+class ActivitySampler:
+    """Measure how much of the virtual screen changes and tune x11vnc
+    polling (-wait/-defer) accordingly. A static screen backs off
+    exponentially, a busy one polls at full rate."""
+
+    STEP = 4  # Sample every 4th pixel in both directions
+    TILE = 8  # Tile size of the sampled image, i.e. 32x32 pixels on the screen
+    # (changed tile ratio, wait, defer), checked in order
+    ACTIVITY_LEVELS = (
+        (0.10, 10, 10),  # Video or scrolling
+        (0.01, 20, 20),  # Typing or small animations
+        (0.0, 50, 50),   # Tiny changes, e.g. a blinking cursor
+    )
+    IDLE_WAIT = 50
+    MAX_WAIT = 1000
+
+    def __init__(self, remote: X11VNCRemote, virt: Display, interval: float = 1.0):
+        self.remote: X11VNCRemote = remote
+        self.virt: Display = virt
+        self.interval: float = interval
+        self.capture: ScreenCapture = None
+        self.previous: np.ndarray = None
+        self.idle: int = 0
+        self.ratio: float = 0.0
+        self.handle: asyncio.Handle = None
+
+    def start(self) -> None:
+        virt = self.virt
+        try:
+            self.capture = ScreenCapture(virt.x_offset, virt.y_offset, virt.width, virt.height)
+        except RuntimeError as e:
+            logging.error(f"Screen activity sampling disabled: {e}")
+            return
+        logging.info(f"Sampling screen activity (MIT-SHM: {self.capture.shm})")
+        self.previous = None
+        self.idle = 0
+        self._schedule()
+
+    def stop(self) -> None:
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        self.remote.release('activity')
+
+    def _schedule(self) -> None:
+        self.handle = asyncio.get_event_loop().call_later(self.interval, self._tick)
+
+    def _tick(self) -> None:
+        try:
+            frame = self.capture.grab()
+        except RuntimeError as e:
+            logging.error(f"Screen activity sampling stopped: {e}")
+            self.handle = None
+            self.stop()
+            return
+        # Copy only the low resolution samples; the capture buffer is reused.
+        sample = frame[::self.STEP, ::self.STEP, :3].copy()
+        if self.previous is not None:
+            self.update(self.changed_ratio(self.previous, sample))
+        self.previous = sample
+        self._schedule()
+
+    @classmethod
+    def changed_ratio(cls, previous: np.ndarray, current: np.ndarray) -> float:
+        """Ratio of tiles having any changed pixel"""
+        changed = np.any(previous != current, axis=2)
+        height = changed.shape[0] - changed.shape[0] % cls.TILE
+        width = changed.shape[1] - changed.shape[1] % cls.TILE
+        if not height or not width:
+            return float(changed.any())
+        tiles = changed[:height, :width].reshape(
+            height // cls.TILE, cls.TILE, width // cls.TILE, cls.TILE)
+        return float(tiles.any(axis=(1, 3)).mean())
+
+    def update(self, ratio: float) -> None:
+        """Request polling settings for the changed tile ratio"""
+        self.ratio = ratio
+        if ratio == 0:
+            self.idle += 1
+            wait = min(self.IDLE_WAIT * 2 ** (self.idle - 1), self.MAX_WAIT)
+            defer = wait
+        else:
+            if self.idle >= 3:
+                metrics.record('activity', state='active', idle_samples=self.idle)
+            self.idle = 0
+            for threshold, wait, defer in self.ACTIVITY_LEVELS:
+                if ratio > threshold:
+                    break
+        if self.idle == 3:
+            metrics.record('activity', state='idle')
+        self.remote.request('activity', wait=wait, defer=defer)
@@ -0,0 +1,152 @@
+"""Session snapshot and fast restore"""
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from .display import Display
+from .xrandr import XRandR
+from .port import find_free_port
+from .vncserver import get_server, VNCServer
+from .config import load_config
+from .path import SESSION_PATH
+
+
+# Settings the virtual screen is created with, saved in a snapshot
+SESSION_VIRT_KEYS = ('device', 'width', 'height', 'portrait', 'hidpi', 'position', 'relativeTo')
+
+
+def snapshot(xrandr: XRandR, virt: dict, server: str, port: int) -> dict:
+    """Describe the current working state.
+
+    Arguments:
+        xrandr {XRandR} -- XRandR with the virtual screen created
+        virt {dict} -- settings the virtual screen was created with
+                       (device, width, height, portrait, hidpi, position, relativeTo)
+        server {str} -- name of the VNC server backend
+        port {int} -- port the VNC server listens on
+    """
+    outputs = {screen.name: [screen.x_offset, screen.y_offset, screen.width, screen.height]
+               for screen in xrandr.screens if screen.active}
+    return {
+        'time': round(time.time(), 3),
+        'virt': dict(virt),
+        'mode': xrandr.mode_name,
+        'outputs': outputs,
+        'vnc': {'server': server, 'port': port},
+    }
+
+
+def save_session(session: dict) -> None:
+    # Write then rename, so a crash never leaves a broken snapshot
+    tmp_path = SESSION_PATH + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(session, indent=4, sort_keys=True))
+        os.replace(tmp_path, SESSION_PATH)
+    except OSError as e:
+        logging.warning(f"Failed to save the session: {e}")
+        return
+    logging.info(f"Session saved to {SESSION_PATH}")
+
+
+def load_session() -> dict:
+    """Load the last session, or None if there is no usable snapshot"""
+    try:
+        with open(SESSION_PATH, 'r') as f:
+            session = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.info(f"No session to restore: {e}")
+        return None
+    try:
+        valid = (all(key in session['virt'] for key in SESSION_VIRT_KEYS)
+                 and session['virt']['device'] in session['outputs']
+                 and isinstance(session['mode'], str)
+                 and isinstance(session['vnc']['server'], str)
+                 and isinstance(session['vnc']['port'], int))
+    except (KeyError, TypeError):
+        valid = False
+    if not valid:
+        logging.warning("Broken session snapshot, ignoring it.")
+        return None
+    return session
+
+
+def layout_matches(session: dict, screens: List[Display]) -> bool:
+    """Check if the outputs other than the virtual screen are still the
+    same as in the snapshot, so the saved positions can be reused as is."""
+    device = session['virt']['device']
+    saved = {name: geometry[2:] for name, geometry in session['outputs'].items()
+             if name != device}
+    current = {screen.name: [screen.width, screen.height]
+               for screen in screens if screen.active and screen.name != device}
+    if not any(screen.name == device for screen in screens):
+        return False
+    return saved == current
+
+
+def saved_positions(session: dict) -> Dict[str, Tuple[int, int]]:
+    return {name: (geometry[0], geometry[1]) for name, geometry in session['outputs'].items()}
+
+
+class Preflight:
+    """Results of the checks run before restoring a session.
+
+    Independent checks (VNC server lookup, port check, xrandr query and
+    config load) run concurrently, since most of their time is spent
+    waiting for subprocesses and files.
+    """
+
+    def __init__(self):
+        self.server: VNCServer = None
+        self.port: int = None
+        self.xrandr: XRandR = None
+        self.config: dict = None
+        self.errors: List[str] = []
+        self.duration: float = 0  # ms
+
+    def run(self, session: dict) -> 'Preflight':
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            server = executor.submit(get_server, session['vnc']['server'])
+            port = executor.submit(find_free_port, session['vnc']['port'])
+            xrandr = executor.submit(XRandR)
+            config = executor.submit(load_config)
+            for name, future in (('VNC server', server), ('port', port),
+                                 ('xrandr', xrandr), ('config', config)):
+                try:
+                    result = future.result()
+                except (RuntimeError, OSError, ValueError) as e:
+                    self.errors.append(f"{name}: {e}")
+                    continue
+                if name == 'VNC server':
+                    self.server = result
+                elif name == 'port':
+                    self.port = result
+                elif name == 'xrandr':
+                    self.xrandr = result
+                else:
+                    self.config = result[0]
+        if self.port is None:
+            # Not fatal: the VNC server falls back to the alternative ports
+            logging.warning(f"Port {session['vnc']['port']} of the last session is already used.")
+        self.duration = round((time.monotonic() - start) * 1000, 3)
+        logging.info(f"Preflight finished in {self.duration} ms")
+        return self
+
+
+def process_age() -> float:
+    """Seconds since this process was started, including the interpreter
+    startup, or None if unknown"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # Fields after the command name, which may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
@@ -0,0 +1,451 @@
+"""Simulated xrandr, cvt, x11vnc, x0vncserver and sleep for offline testing
+and benchmarks
+
+Simulator puts scriptable stand-ins of the programs VirtScreen runs in
+front of $PATH, and points $XDG_CONFIG_HOME to a temporary directory, so
+the real code paths run unchanged on a machine without an X server:
+
+    with Simulator('dual', latency={'xrandr': 0.02}) as sim:
+        xrandr = XRandR()
+        ...
+        sim.calls()  # [['xrandr'], ...]
+
+The stand-ins share a JSON state file: the output topology, the modes,
+per-program latencies, failures and the VNC server log stream to replay.
+Import virtscreen.path (or any module importing it) only after entering
+the simulator, since it reads $XDG_CONFIG_HOME on import.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import tempfile
+from typing import Dict, List
+
+PROGRAMS = ('xrandr', 'cvt', 'x11vnc', 'x0vncserver', 'sleep')
+
+# Output topologies, as xrandr reports them.
+# mode: current mode, or None if the output is off
+TOPOLOGIES: Dict[str, List[dict]] = {
+    # A laptop with the VIRTUAL output of the intel driver
+    'laptop': [
+        {'name': 'eDP1', 'connected': True, 'primary': True,
+         'mode': '1920x1080', 'pos': [0, 0]},
+        {'name': 'DP1', 'connected': False},
+        {'name': 'HDMI1', 'connected': False},
+        {'name': 'VIRTUAL1', 'connected': False},
+    ],
+    # A laptop with an external monitor on its right
+    'dual': [
+        {'name': 'eDP1', 'connected': True, 'primary': True,
+         'mode': '1920x1080', 'pos': [0, 0]},
+        {'name': 'DP1', 'connected': False},
+        {'name': 'HDMI1', 'connected': True, 'mode': '2560x1440', 'pos': [1920, 0]},
+        {'name': 'VIRTUAL1', 'connected': False},
+    ],
+    # Desktop GPU naming, using a disconnected port as the virtual screen
+    'desktop': [
+        {'name': 'DP-0', 'connected': True, 'primary': True,
+         'mode': '2560x1440', 'pos': [0, 0]},
+        {'name': 'DP-1', 'connected': False},
+        {'name': 'DP-2', 'connected': False},
+        {'name': 'DP-3', 'connected': False},
+        {'name': 'HDMI-0', 'connected': False},
+        {'name': 'HDMI-1', 'connected': False},
+        {'name': 'DVI-D-0', 'connected': False},
+    ],
+    # No primary output is set, which VirtScreen refuses
+    'no_primary': [
+        {'name': 'eDP1', 'connected': True, 'mode': '1920x1080', 'pos': [0, 0]},
+        {'name': 'VIRTUAL1', 'connected': False},
+    ],
+}
+
+# x11vnc log streams: (delay in seconds, line). {port} is replaced by -rfbport.
+X11VNC_LOGS: Dict[str, List[list]] = {
+    # Starts, a client connects and leaves, then waits for the next one
+    'connect_disconnect': [
+        [0.0, "19/10/2026 10:00:00 x11vnc version: 0.9.16 lastmod: 2019-01-05  pid: 1"],
+        [0.0, "19/10/2026 10:00:00 Using X display :0"],
+        [0.0, "The VNC desktop is:      localhost:0"],
+        [0.0, "PORT={port}"],
+        [0.1, "19/10/2026 10:00:01 Got connection from client 127.0.0.1"],
+        [0.0, "19/10/2026 10:00:01   other clients:"],
+        [0.0, "19/10/2026 10:00:01 Normal socket connection"],
+        [0.0, "19/10/2026 10:00:01 client_count: 1"],
+        [0.05, "19/10/2026 10:00:01 network rate 8000.0 KB/sec"],
+        [0.0, "19/10/2026 10:00:01 latency:  2.5 ms"],
+        [0.3, "19/10/2026 10:00:02 client 1 network rate 1200.5 KB/sec (2300.1 eff KB/sec)"],
+        [0.0, "19/10/2026 10:00:02 client_count: 0"],
+    ],
+    # A client connects, then the server hangs without any I/O
+    'connect_hang': [
+        [0.0, "19/10/2026 10:00:00 x11vnc version: 0.9.16 lastmod: 2019-01-05  pid: 1"],
+        [0.0, "PORT={port}"],
+        [0.1, "19/10/2026 10:00:01 Got connection from client 127.0.0.1"],
+        [0.0, "19/10/2026 10:00:01 client_count: 1"],
+    ],
+    # Starts and waits for clients
+    'startup': [
+        [0.0, "19/10/2026 10:00:00 x11vnc version: 0.9.16 lastmod: 2019-01-05  pid: 1"],
+        [0.0, "The VNC desktop is:      localhost:0"],
+        [0.0, "PORT={port}"],
+    ],
+    # The port is already used
+    'port_in_use': [
+        [0.0, "19/10/2026 10:00:00 x11vnc version: 0.9.16 lastmod: 2019-01-05  pid: 1"],
+        [0.0, "19/10/2026 10:00:00 ListenOnTCPPort: Address already in use"],
+        [0.0, "19/10/2026 10:00:00 Error: could not obtain listening port."],
+    ],
+}
+# Exit codes of the servers after replaying a stream. Others wait to be stopped.
+EXIT_CODES = {'port_in_use': 1}
+
+# The same streams, as TigerVNC x0vncserver prints them
+X0VNCSERVER_LOGS: Dict[str, List[list]] = {
+    'connect_disconnect': [
+        [0.0, ""],
+        [0.0, "Mon Oct 19 10:00:00 2026"],
+        [0.0, " Geometry:    Desktop geometry is set to 1368x1024+1920+0"],
+        [0.0, " Main:        XTest extension present - version 2.2"],
+        [0.0, " Main:        Listening on port {port}"],
+        [0.1, " Connections: accepted: 127.0.0.1::51234"],
+        [0.0, " SConnection: Client needs protocol version 3.8"],
+        [0.0, " VNCSConnST:  Client pixel format depth 24 (32bpp) little-endian rgb888"],
+        [0.35, " Connections: closed: 127.0.0.1::51234 (Clean disconnection)"],
+        [0.0, " EncodeManager: Framebuffer updates: 12"],
+    ],
+    'connect_hang': [
+        [0.0, "Mon Oct 19 10:00:00 2026"],
+        [0.0, " Main:        Listening on port {port}"],
+        [0.1, " Connections: accepted: 127.0.0.1::51234"],
+    ],
+    'startup': [
+        [0.0, "Mon Oct 19 10:00:00 2026"],
+        [0.0, " Geometry:    Desktop geometry is set to 1368x1024+1920+0"],
+        [0.0, " Main:        Listening on port {port}"],
+    ],
+    'port_in_use': [
+        [0.0, "Mon Oct 19 10:00:00 2026"],
+        [0.0, " Main:        unable to create listening socket: Address already in use (98)"],
+    ],
+}
+
+X11VNC_OPTIONS = ('-ncache', '-multiptr', '-repeat', '-threads', '-scale', '-wait',
+                  '-defer', '-clip', '-rfbport', '-rfbauth', '-inetd')
+
+
+class Simulator:
+    """Context manager installing simulated programs.
+
+    Arguments:
+        topology {str} -- name in TOPOLOGIES (default: 'laptop')
+        latency {dict} -- seconds each program takes, e.g. {'xrandr': 0.02}
+        failures {dict} -- command prefix -> error message. Matching commands
+                           fail with exit code 1, e.g. {'xrandr --newmode': 'BadName'}
+        x11vnc_log {str} -- name in X11VNC_LOGS replayed by x11vnc, and in
+                            X0VNCSERVER_LOGS by x0vncserver (default: 'connect_disconnect')
+        sleep_scale {float} -- factor applied to `sleep` durations (default: 0)
+    """
+
+    def __init__(self, topology: str = 'laptop', latency: Dict[str, float] = None,
+                 failures: Dict[str, str] = None, x11vnc_log: str = 'connect_disconnect',
+                 sleep_scale: float = 0):
+        self.path: str = None
+        self.state_path: str = None
+        self.calls_path: str = None
+        self.emitted_path: str = None
+        self._environ: Dict[str, str] = {}
+        self.settings = {'topology': topology, 'latency': latency or {},
+                         'failures': failures or {}, 'x11vnc_log': x11vnc_log,
+                         'sleep_scale': sleep_scale}
+
+    def __enter__(self) -> 'Simulator':
+        self.path = tempfile.mkdtemp(prefix='virtscreen-sim-')
+        self.state_path = os.path.join(self.path, 'state.json')
+        self.calls_path = os.path.join(self.path, 'calls.jsonl')
+        self.emitted_path = os.path.join(self.path, 'emitted.jsonl')
+        bin_path = os.path.join(self.path, 'bin')
+        os.makedirs(bin_path)
+        os.makedirs(os.path.join(self.path, 'config', 'virtscreen'))
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for program in PROGRAMS:
+            script = os.path.join(bin_path, program)
+            with open(script, 'w') as f:
+                f.write(f"#!{sys.executable} -S\n"
+                        f"import sys\n"
+                        f"sys.path.insert(0, {package_parent!r})\n"
+                        f"from virtscreen.simulate import fake_main\n"
+                        f"fake_main({program!r}, {self.state_path!r})\n")
+            os.chmod(script, 0o755)
+        self.configure(**self.settings)
+        for key, value in (('PATH', bin_path + os.pathsep + os.environ.get('PATH', '')),
+                           ('XDG_CONFIG_HOME', os.path.join(self.path, 'config'))):
+            self._environ[key] = os.environ.get(key)
+            os.environ[key] = value
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for key, value in self._environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def configure(self, topology: str = None, latency: Dict[str, float] = None,
+                  failures: Dict[str, str] = None, x11vnc_log: str = None,
+                  sleep_scale: float = None) -> None:
+        """Change the simulation. A new topology resets the X server state."""
+        state = self._load() if os.path.exists(self.state_path) else {}
+        if topology is not None:
+            state['outputs'] = []
+            state['modes'] = {}
+            for output in TOPOLOGIES[topology]:
+                output = dict({'primary': False, 'mode': None, 'pos': [0, 0]}, **output)
+                output['modes'] = [output['mode']] if output['mode'] else []
+                if output['mode']:
+                    width, height = (int(v) for v in output['mode'].split('x'))
+                    state['modes'][output['mode']] = _modeline(width, height)
+                state['outputs'].append(output)
+        for key, value in (('latency', latency), ('failures', failures),
+                           ('x11vnc_log', x11vnc_log), ('sleep_scale', sleep_scale)):
+            if value is not None:
+                state[key] = value
+        state['calls'] = self.calls_path
+        state['emitted'] = self.emitted_path
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f)
+
+    def _load(self) -> dict:
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def calls(self) -> List[List[str]]:
+        """Command lines run so far"""
+        return [entry[1] for entry in _read_jsonl(self.calls_path)]
+
+    def emitted(self) -> List[list]:
+        """(time.time(), line) of each line printed by x11vnc or x0vncserver"""
+        return _read_jsonl(self.emitted_path)
+
+    def outputs(self) -> List[dict]:
+        return self._load()['outputs']
+
+
+def _read_jsonl(path: str) -> List[list]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _modeline(width: int, height: int) -> List:
+    """A CVT-like modeline at 60 Hz"""
+    htotal, vtotal = width + 448, height + 39
+    clock = round(htotal * vtotal * 60 / 1e6, 2)
+    return [clock, width, width + 80, width + 224, htotal,
+            height, height + 3, height + 13, vtotal]
+
+
+# The simulated programs. They run as separate processes started by the
+# scripts Simulator writes, so they only use the standard library.
+
+def fake_main(program: str, state_path: str) -> None:
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    args = sys.argv[1:]
+    command = ' '.join([program] + args)
+    with open(state['calls'], 'a') as f:
+        f.write(json.dumps([time.time(), [program] + args]) + '\n')
+    time.sleep(state['latency'].get(program, 0))
+    for prefix, message in state['failures'].items():
+        if command.startswith(prefix):
+            print(message, file=sys.stderr)
+            sys.exit(1)
+    code = {'xrandr': _xrandr, 'cvt': _cvt, 'x11vnc': _x11vnc, 'x0vncserver': _x0vncserver,
+            'sleep': _sleep}[program](state, args)
+    if program == 'xrandr':  # The only program changing the state
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.tmp', state_path)
+    sys.exit(code)
+
+
+def _fail(message: str) -> int:
+    print(message, file=sys.stderr)
+    return 1
+
+
+def _xrandr(state: dict, args: List[str]) -> int:
+    outputs = {output['name']: output for output in state['outputs']}
+    if not args:
+        _xrandr_print(state)
+        return 0
+    action = args[0]
+    if action == '--newmode':
+        if args[1] in state['modes']:
+            return _fail("X Error of failed request:  BadName (named color or font does not exist)")
+        state['modes'][args[1]] = [float(args[2])] + [int(v) for v in args[3:11]]
+        return 0
+    if action in ('--addmode', '--delmode'):
+        output, mode = outputs.get(args[1]), args[2]
+        if output is None or mode not in state['modes']:
+            return _fail(f'xrandr: cannot find mode "{mode}"')
+        if action == '--addmode':
+            if mode not in output['modes']:
+                output['modes'].append(mode)
+            return 0
+        if output['mode'] == mode:
+            return _fail("X Error of failed request:  BadAccess (attempt to access private resource denied)")
+        if mode in output['modes']:
+            output['modes'].remove(mode)
+        return 0
+    if action == '--rmmode':
+        if args[1] not in state['modes']:
+            return _fail(f'xrandr: cannot find mode "{args[1]}"')
+        if any(args[1] in output['modes'] for output in state['outputs']):
+            return _fail("X Error of failed request:  BadAccess (attempt to access private resource denied)")
+        del state['modes'][args[1]]
+        return 0
+    if action != '--output':
+        return _fail(f"xrandr: unrecognized option '{action}'")
+    # --output NAME [options] [--output NAME [options]] ...
+    current, i = None, 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--output':
+            current = outputs.get(args[i + 1])
+            if current is None:
+                return _fail(f'warning: output {args[i + 1]} not found; ignoring')
+            i += 2
+            continue
+        if arg == '--mode':
+            if args[i + 1] not in current['modes']:
+                return _fail(f'xrandr: cannot find mode {args[i + 1]}')
+            current['mode'] = args[i + 1]
+            i += 2
+        elif arg == '--off':
+            current['mode'] = None
+            i += 1
+        elif arg == '--preferred':
+            if current['mode'] is None and current['modes']:
+                current['mode'] = current['modes'][0]
+            i += 1
+        elif arg == '--pos':
+            current['pos'] = [int(v) for v in args[i + 1].split('x')]
+            i += 2
+        elif arg in ('--left-of', '--right-of', '--above', '--below'):
+            other = outputs.get(args[i + 1])
+            if other is None or other['mode'] is None or current['mode'] is None:
+                return _fail(f'xrandr: cannot find crtc for output {current["name"]}')
+            width, height = _size(state, current)
+            other_width, other_height = _size(state, other)
+            x, y = other['pos']
+            current['pos'] = {'--left-of': [x - width, y], '--right-of': [x + other_width, y],
+                              '--above': [x, y - height], '--below': [x, y + other_height]}[arg]
+            i += 2
+        else:
+            return _fail(f"xrandr: unrecognized option '{arg}'")
+    # The X server keeps the screen origin at 0x0
+    active = [output for output in state['outputs'] if output['mode']]
+    if active:
+        dx = min(output['pos'][0] for output in active)
+        dy = min(output['pos'][1] for output in active)
+        for output in active:
+            output['pos'] = [output['pos'][0] - dx, output['pos'][1] - dy]
+    return 0
+
+
+def _size(state: dict, output: dict) -> List[int]:
+    modeline = state['modes'][output['mode']]
+    return [modeline[1], modeline[5]]
+
+
+def _xrandr_print(state: dict) -> None:
+    active = [output for output in state['outputs'] if output['mode']]
+    width = max([o['pos'][0] + _size(state, o)[0] for o in active] or [0])
+    height = max([o['pos'][1] + _size(state, o)[1] for o in active] or [0])
+    lines = [f"Screen 0: minimum 8 x 8, current {width} x {height}, maximum 32767 x 32767"]
+    attached = set()
+    for output in state['outputs']:
+        line = output['name'] + (' connected' if output['connected'] else ' disconnected')
+        if output['primary']:
+            line += ' primary'
+        if output['mode']:
+            w, h = _size(state, output)
+            line += f" {w}x{h}+{output['pos'][0]}+{output['pos'][1]}"
+        line += ' (normal left inverted right x axis y axis)'
+        if output['connected']:
+            line += ' 344mm x 194mm'
+        lines.append(line)
+        for mode in output['modes']:
+            attached.add(mode)
+            current = '*' if mode == output['mode'] else ' '
+            lines.append(f"   {mode:<16} 60.00{current}+")
+    for index, (mode, modeline) in enumerate(state['modes'].items()):
+        if mode in attached:
+            continue
+        lines.append(f"  {mode} (0x{0x4b + index:x}) {modeline[0]:.3f}MHz -HSync +VSync")
+        lines.append(f"        h: width  {modeline[1]} start {modeline[2]} end {modeline[3]}"
+                     f" total {modeline[4]} skew    0 clock  63.67KHz")
+        lines.append(f"        v: height {modeline[5]} start {modeline[6]} end {modeline[7]}"
+                     f" total {modeline[8]}           clock  59.92Hz")
+    print('\n'.join(lines))
+
+
+def _cvt(state: dict, args: List[str]) -> int:
+    width, height = int(args[0]), int(args[1])
+    modeline = _modeline(width, height)
+    print(f"# {width}x{height} 59.92 Hz (CVT) hsync: 63.67 kHz; pclk: {modeline[0]:.2f} MHz")
+    print(f'Modeline "{width}x{height}_60.00"  {modeline[0]:.2f}  '
+          + ' '.join(str(v) for v in modeline[1:5]) + '  '
+          + ' '.join(str(v) for v in modeline[5:]) + '  -hsync +vsync')
+    return 0
+
+
+def _sleep(state: dict, args: List[str]) -> int:
+    time.sleep(float(args[0]) * state['sleep_scale'])
+    return 0
+
+
+def _x11vnc(state: dict, args: List[str]) -> int:
+    if '-opts' in args:
+        for option in X11VNC_OPTIONS:
+            print(f"{option:<16}(simulated)")
+        return 0
+    if '-R' in args:
+        return 0
+    if '-storepasswd' in args:
+        with open(args[args.index('-storepasswd') + 1], 'wb') as f:
+            f.write(b'\x00' * 8)
+        return 0
+    return _serve(state, X11VNC_LOGS, args)
+
+
+def _x0vncserver(state: dict, args: List[str]) -> int:
+    return _serve(state, X0VNCSERVER_LOGS, args)
+
+
+def _serve(state: dict, logs: Dict[str, List[list]], args: List[str]) -> int:
+    """Replay the log stream of a VNC server, then wait to be stopped"""
+    # Exit cleanly when stopped, like the servers do after cleaning up
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: sys.exit(0))
+    port = args[args.index('-rfbport') + 1] if '-rfbport' in args else '5900'
+    with open(state['emitted'], 'a') as emitted:
+        for delay, line in logs[state['x11vnc_log']]:
+            time.sleep(delay)
+            line = line.format(port=port)
+            emitted_time = time.time()
+            print(line, flush=True)
+            emitted.write(json.dumps([emitted_time, line]) + '\n')
+            emitted.flush()
+    code = EXIT_CODES.get(state['x11vnc_log'])
+    if code is not None:
+        return code
+    while True:
+        signal.pause()
@@ -0,0 +1,217 @@
+"""VNC authentication and password files
+
+VNC authentication encrypts a 16 byte challenge with DES, keyed by the
+password. Password files (x11vnc -storepasswd, vncpasswd -f) hold the
+password DES encrypted with a fixed key. Both use DES with the bits of each
+key byte reversed, a quirk of the original VNC implementation.
+
+x11vnc -passwdfile takes a list of plain text passwords instead: full access
+passwords, then view-only passwords after a __BEGIN_VIEWONLY__ line. With
+the read: prefix the list is read again for every new connection. Only the
+first 8 characters of a password count: VNC authentication keys DES with
+them and ignores the rest.
+"""
+
+import os
+import tempfile
+from typing import List, Tuple
+
+# Fixed key of VNC password files
+PASSWORD_FILE_KEY = bytes([23, 82, 107, 6, 35, 78, 88, 7])
+CHALLENGE_SIZE = 16
+# Characters of a password used by VNC authentication
+PASSWORD_LENGTH = 8
+# Separates full access and view-only passwords of x11vnc -passwdfile
+VIEWONLY_MARKER = '__BEGIN_VIEWONLY__'
+# Keywords of x11vnc -passwdfile, also found inside lines
+_KEYWORDS = (VIEWONLY_MARKER, '__SKIP__', '__COMM__', '__EMPTY__')
+
+_IP = (58, 50, 42, 34, 26, 18, 10, 2, 60, 52, 44, 36, 28, 20, 12, 4,
+       62, 54, 46, 38, 30, 22, 14, 6, 64, 56, 48, 40, 32, 24, 16, 8,
+       57, 49, 41, 33, 25, 17, 9, 1, 59, 51, 43, 35, 27, 19, 11, 3,
+       61, 53, 45, 37, 29, 21, 13, 5, 63, 55, 47, 39, 31, 23, 15, 7)
+_FP = (40, 8, 48, 16, 56, 24, 64, 32, 39, 7, 47, 15, 55, 23, 63, 31,
+       38, 6, 46, 14, 54, 22, 62, 30, 37, 5, 45, 13, 53, 21, 61, 29,
+       36, 4, 44, 12, 52, 20, 60, 28, 35, 3, 43, 11, 51, 19, 59, 27,
+       34, 2, 42, 10, 50, 18, 58, 26, 33, 1, 41, 9, 49, 17, 57, 25)
+_E = (32, 1, 2, 3, 4, 5, 4, 5, 6, 7, 8, 9, 8, 9, 10, 11, 12, 13,
+      12, 13, 14, 15, 16, 17, 16, 17, 18, 19, 20, 21, 20, 21, 22, 23, 24, 25,
+      24, 25, 26, 27, 28, 29, 28, 29, 30, 31, 32, 1)
+_P = (16, 7, 20, 21, 29, 12, 28, 17, 1, 15, 23, 26, 5, 18, 31, 10,
+      2, 8, 24, 14, 32, 27, 3, 9, 19, 13, 30, 6, 22, 11, 4, 25)
+_PC1 = (57, 49, 41, 33, 25, 17, 9, 1, 58, 50, 42, 34, 26, 18,
+        10, 2, 59, 51, 43, 35, 27, 19, 11, 3, 60, 52, 44, 36,
+        63, 55, 47, 39, 31, 23, 15, 7, 62, 54, 46, 38, 30, 22,
+        14, 6, 61, 53, 45, 37, 29, 21, 13, 5, 28, 20, 12, 4)
+_PC2 = (14, 17, 11, 24, 1, 5, 3, 28, 15, 6, 21, 10,
+        23, 19, 12, 4, 26, 8, 16, 7, 27, 20, 13, 2,
+        41, 52, 31, 37, 47, 55, 30, 40, 51, 45, 33, 48,
+        44, 49, 39, 56, 34, 53, 46, 42, 50, 36, 29, 32)
+_SHIFTS = (1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1)
+_SBOXES = (
+    (14, 4, 13, 1, 2, 15, 11, 8, 3, 10, 6, 12, 5, 9, 0, 7,
+     0, 15, 7, 4, 14, 2, 13, 1, 10, 6, 12, 11, 9, 5, 3, 8,
+     4, 1, 14, 8, 13, 6, 2, 11, 15, 12, 9, 7, 3, 10, 5, 0,
+     15, 12, 8, 2, 4, 9, 1, 7, 5, 11, 3, 14, 10, 0, 6, 13),
+    (15, 1, 8, 14, 6, 11, 3, 4, 9, 7, 2, 13, 12, 0, 5, 10,
+     3, 13, 4, 7, 15, 2, 8, 14, 12, 0, 1, 10, 6, 9, 11, 5,
+     0, 14, 7, 11, 10, 4, 13, 1, 5, 8, 12, 6, 9, 3, 2, 15,
+     13, 8, 10, 1, 3, 15, 4, 2, 11, 6, 7, 12, 0, 5, 14, 9),
+    (10, 0, 9, 14, 6, 3, 15, 5, 1, 13, 12, 7, 11, 4, 2, 8,
+     13, 7, 0, 9, 3, 4, 6, 10, 2, 8, 5, 14, 12, 11, 15, 1,
+     13, 6, 4, 9, 8, 15, 3, 0, 11, 1, 2, 12, 5, 10, 14, 7,
+     1, 10, 13, 0, 6, 9, 8, 7, 4, 15, 14, 3, 11, 5, 2, 12),
+    (7, 13, 14, 3, 0, 6, 9, 10, 1, 2, 8, 5, 11, 12, 4, 15,
+     13, 8, 11, 5, 6, 15, 0, 3, 4, 7, 2, 12, 1, 10, 14, 9,
+     10, 6, 9, 0, 12, 11, 7, 13, 15, 1, 3, 14, 5, 2, 8, 4,
+     3, 15, 0, 6, 10, 1, 13, 8, 9, 4, 5, 11, 12, 7, 2, 14),
+    (2, 12, 4, 1, 7, 10, 11, 6, 8, 5, 3, 15, 13, 0, 14, 9,
+     14, 11, 2, 12, 4, 7, 13, 1, 5, 0, 15, 10, 3, 9, 8, 6,
+     4, 2, 1, 11, 10, 13, 7, 8, 15, 9, 12, 5, 6, 3, 0, 14,
+     11, 8, 12, 7, 1, 14, 2, 13, 6, 15, 0, 9, 10, 4, 5, 3),
+    (12, 1, 10, 15, 9, 2, 6, 8, 0, 13, 3, 4, 14, 7, 5, 11,
+     10, 15, 4, 2, 7, 12, 9, 5, 6, 1, 13, 14, 0, 11, 3, 8,
+     9, 14, 15, 5, 2, 8, 12, 3, 7, 0, 4, 10, 1, 13, 11, 6,
+     4, 3, 2, 12, 9, 5, 15, 10, 11, 14, 1, 7, 6, 0, 8, 13),
+    (4, 11, 2, 14, 15, 0, 8, 13, 3, 12, 9, 7, 5, 10, 6, 1,
+     13, 0, 11, 7, 4, 9, 1, 10, 14, 3, 5, 12, 2, 15, 8, 6,
+     1, 4, 11, 13, 12, 3, 7, 14, 10, 15, 6, 8, 0, 5, 9, 2,
+     6, 11, 13, 8, 1, 4, 10, 7, 9, 5, 0, 15, 14, 2, 3, 12),
+    (13, 2, 8, 4, 6, 15, 11, 1, 10, 9, 3, 14, 5, 0, 12, 7,
+     1, 15, 13, 8, 10, 3, 7, 4, 12, 5, 6, 11, 0, 14, 9, 2,
+     7, 11, 4, 1, 9, 12, 14, 2, 0, 6, 10, 13, 15, 3, 5, 8,
+     2, 1, 14, 7, 4, 10, 8, 13, 15, 12, 9, 0, 3, 5, 6, 11),
+)
+
+
+def _permute(value: int, table: tuple, width: int) -> int:
+    out = 0
+    for position in table:
+        out = (out << 1) | ((value >> (width - position)) & 1)
+    return out
+
+
+def _subkeys(key: bytes) -> List[int]:
+    key = _permute(int.from_bytes(key, 'big'), _PC1, 64)
+    c, d = key >> 28, key & 0xfffffff
+    subkeys = []
+    for shift in _SHIFTS:
+        c = ((c << shift) | (c >> (28 - shift))) & 0xfffffff
+        d = ((d << shift) | (d >> (28 - shift))) & 0xfffffff
+        subkeys.append(_permute((c << 28) | d, _PC2, 56))
+    return subkeys
+
+
+def _feistel(half: int, subkey: int) -> int:
+    expanded = _permute(half, _E, 32) ^ subkey
+    out = 0
+    for i, sbox in enumerate(_SBOXES):
+        six = (expanded >> (42 - 6 * i)) & 0x3f
+        out = (out << 4) | sbox[((six & 0x20) >> 4 | (six & 1)) * 16 + ((six >> 1) & 0xf)]
+    return _permute(out, _P, 32)
+
+
+def _des_block(block: bytes, subkeys: List[int]) -> bytes:
+    value = _permute(int.from_bytes(block, 'big'), _IP, 64)
+    left, right = value >> 32, value & 0xffffffff
+    for subkey in subkeys:
+        left, right = right, left ^ _feistel(right, subkey)
+    return _permute((right << 32) | left, _FP, 64).to_bytes(8, 'big')
+
+
+def des_encrypt(key: bytes, data: bytes) -> bytes:
+    """Standard DES in ECB mode. The data length must be a multiple of 8."""
+    subkeys = _subkeys(key)
+    return b''.join(_des_block(data[i:i + 8], subkeys) for i in range(0, len(data), 8))
+
+
+def des_decrypt(key: bytes, data: bytes) -> bytes:
+    subkeys = _subkeys(key)[::-1]
+    return b''.join(_des_block(data[i:i + 8], subkeys) for i in range(0, len(data), 8))
+
+
+def _vnc_key(key: bytes) -> bytes:
+    """Pad or truncate to 8 bytes and reverse the bits of each byte"""
+    key = key[:8].ljust(8, b'\0')
+    return bytes(int(f"{byte:08b}"[::-1], 2) for byte in key)
+
+
+def challenge_response(password: str, challenge: bytes) -> bytes:
+    """Response of a client to the challenge of VNC authentication"""
+    return des_encrypt(_vnc_key(password.encode('latin-1')), challenge)
+
+
+def encrypt_password(password: str) -> bytes:
+    """Password in the format of a VNC password file"""
+    return des_encrypt(_vnc_key(PASSWORD_FILE_KEY), password.encode('latin-1')[:8].ljust(8, b'\0'))
+
+
+def decrypt_password(data: bytes) -> str:
+    """Password of a VNC password file. Raises ValueError if it is too short."""
+    if len(data) < 8:
+        raise ValueError("VNC password file is too short")
+    return des_decrypt(_vnc_key(PASSWORD_FILE_KEY), data[:8]).rstrip(b'\0').decode('latin-1')
+
+
+def _write_private(path: str, data: bytes) -> None:
+    """Write a file readable only by the user. The data is written to a
+    temporary file first and renamed, so a server reading the file never
+    sees it half written."""
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def write_password_file(password: str, path: str) -> None:
+    _write_private(path, encrypt_password(password))
+
+
+def read_password_file(path: str) -> str:
+    """Raises OSError or ValueError"""
+    with open(path, 'rb') as f:
+        return decrypt_password(f.read())
+
+
+def write_password_list(full: List[str], view_only: List[str], path: str) -> None:
+    """Write passwords in the format of x11vnc -passwdfile.
+    Raises ValueError for a password x11vnc would read differently, or a
+    view-only password x11vnc could not tell from a full access one."""
+    for password in full + view_only:
+        if not password or '\n' in password or '\r' in password:
+            raise ValueError("Passwords cannot be empty or contain line breaks")
+        if password.startswith('#'):
+            raise ValueError("Passwords cannot start with #")
+        for keyword in _KEYWORDS:
+            if keyword in password:
+                raise ValueError(f"Passwords cannot contain {keyword}")
+    significant = {password[:PASSWORD_LENGTH] for password in full}
+    for password in view_only:
+        if password[:PASSWORD_LENGTH] in significant:
+            raise ValueError(f"A view-only password has the same first {PASSWORD_LENGTH} "
+                             "characters as a full access password")
+    # Without the marker, x11vnc reads the second line of a two line list as
+    # a view-only password
+    lines = full
+    if view_only or len(full) == 2:
+        lines = full + [VIEWONLY_MARKER] + view_only
+    _write_private(path, ''.join(line + '\n' for line in lines).encode('utf-8'))
+
+
+def read_password_list(path: str) -> Tuple[List[str], List[str]]:
+    """Full access and view-only passwords of an x11vnc -passwdfile.
+    Raises OSError."""
+    full: List[str] = []
+    view_only: List[str] = []
+    passwords = full
+    with open(path, 'rb') as f:
+        for line in f.read().decode('utf-8', 'replace').split('\n'):
+            if line == VIEWONLY_MARKER:
+                passwords = view_only
+            elif line:
+                passwords.append(line)
+    return full, view_only
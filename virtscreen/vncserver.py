@@ -0,0 +1,184 @@
+"""VNC server backends"""
+
+import re
+import sys
+import shlex
+import shutil
+from abc import ABC, abstractmethod
+from ctypes.util import find_library
+from typing import Dict, List, Tuple, Type
+
+from .display import Display
+from .process import SubprocessWrapper
+
+
+class VNCServer(SubprocessWrapper, ABC):
+    """Interface of a VNC server backend.
+
+    A backend builds the command line of a server serving a region of the
+    X screen, discovers the options the installed server supports, parses
+    its output for client events. Passwords are given as a VNC password file
+    (vncauth.write_password_file), or to servers supporting it, as an
+    x11vnc -passwdfile list read again for every connection.
+    """
+    name: str = ''  # Value of vnc.server in config.json
+    title: str = ''  # Human readable name
+    program: str = ''  # Executable
+    supports_inetd: bool = False  # Can serve a socket on stdio (on-demand mode)
+    supports_remote: bool = False  # Can be tuned at runtime by x11vnc -R
+    supports_options: bool = False  # Uses x11vncOptions and customX11vncArgs
+    supports_passwdfile: bool = False  # Takes a password list with view-only passwords
+
+    def __init__(self):
+        super(VNCServer, self).__init__()
+        self.clients: int = 0
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which(cls.program) is not None
+
+    def discover_options(self) -> Tuple[str, ...]:
+        """Options supported by the installed server"""
+        return ()
+
+    @abstractmethod
+    def build_args(self, port: int, clip: Display, options: str = '',
+                   password_path: str = None, inetd: bool = False) -> str:
+        """Command line serving the clip region on the port, or on stdio if inetd.
+        password_path is a password list if supports_passwdfile."""
+
+    @abstractmethod
+    def parse_output(self, data: str) -> int:
+        """Update the number of connected clients from the server output.
+
+        Returns:
+            int -- the new number of clients, or None if unchanged
+        """
+
+
+class X11VNCServer(VNCServer):
+    """x11vnc backend"""
+    name = 'x11vnc'
+    title = 'x11vnc'
+    program = 'x11vnc'
+    supports_inetd = True
+    supports_remote = True
+    supports_options = True
+    supports_passwdfile = True
+
+    pattern_connected = re.compile(r"^.*Got connection from client.*$", re.M)
+    pattern_count = re.compile(r"^.*client_count: (\d+)\s*$", re.M)
+
+    def discover_options(self) -> Tuple[str, ...]:
+        ret = self.run('x11vnc -opts')
+        return tuple(m.group(1) for m in re.finditer(r"\s*(-\w+)\s+", ret))
+
+    def build_args(self, port: int, clip: Display, options: str = '',
+                   password_path: str = None, inetd: bool = False) -> str:
+        geometry = f"{clip.width}x{clip.height}+{clip.x_offset}+{clip.y_offset}"
+        arg = f"x11vnc -clip {geometry} {options}"
+        if password_path:
+            arg += f" -passwdfile read:{password_path}"
+        if inetd:
+            arg += " -inetd"
+        else:
+            arg += f" -rfbport {port}"
+        return arg
+
+    def parse_output(self, data: str) -> int:
+        clients = self.clients
+        if self.pattern_connected.search(data):
+            clients += 1
+        counts = self.pattern_count.findall(data)
+        if counts:
+            clients = int(counts[-1])
+        if clients == self.clients:
+            return None
+        self.clients = clients
+        return clients
+
+
+class X0VNCServer(VNCServer):
+    """TigerVNC x0vncserver backend"""
+    name = 'x0vncserver'
+    title = 'TigerVNC (x0vncserver)'
+    program = 'x0vncserver'
+
+    pattern_accepted = re.compile(r"Connections: accepted")
+    pattern_closed = re.compile(r"Connections: closed")
+
+    def build_args(self, port: int, clip: Display, options: str = '',
+                   password_path: str = None, inetd: bool = False) -> str:
+        geometry = f"{clip.width}x{clip.height}+{clip.x_offset}+{clip.y_offset}"
+        arg = f"x0vncserver -rfbport {port} -Geometry {geometry} -AlwaysShared"
+        if password_path:
+            arg += f" -SecurityTypes VncAuth -PasswordFile {password_path}"
+        else:
+            arg += " -SecurityTypes None"
+        return arg
+
+    def parse_output(self, data: str) -> int:
+        clients = self.clients
+        clients += len(self.pattern_accepted.findall(data))
+        clients -= len(self.pattern_closed.findall(data))
+        clients = max(clients, 0)
+        if clients == self.clients:
+            return None
+        self.clients = clients
+        return clients
+
+
+class BuiltinVNCServer(VNCServer):
+    """Built-in RFB server (virtscreen.rfb), capturing only the virtual screen"""
+    name = 'builtin'
+    title = 'Built-in (experimental)'
+    program = sys.executable
+    supports_inetd = True
+
+    pattern_count = re.compile(r"^.*client_count: (\d+)\s*$", re.M)
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        return find_library('X11') is not None
+
+    def build_args(self, port: int, clip: Display, options: str = '',
+                   password_path: str = None, inetd: bool = False) -> str:
+        geometry = f"{clip.width}x{clip.height}+{clip.x_offset}+{clip.y_offset}"
+        arg = f"{shlex.quote(sys.executable)} -m virtscreen.rfb --clip {geometry}"
+        if password_path:
+            arg += f" --rfbauth {password_path}"
+        if inetd:
+            arg += " --inetd"
+        else:
+            arg += f" --port {port}"
+        return arg
+
+    def parse_output(self, data: str) -> int:
+        counts = self.pattern_count.findall(data)
+        if not counts or int(counts[-1]) == self.clients:
+            return None
+        self.clients = int(counts[-1])
+        return self.clients
+
+
+SERVERS: Dict[str, Type[VNCServer]] = {
+    server.name: server for server in (X11VNCServer, X0VNCServer, BuiltinVNCServer)
+}
+
+
+def get_server(name: str) -> VNCServer:
+    """Create a backend by name. Raises RuntimeError if not usable."""
+    if name not in SERVERS:
+        raise RuntimeError(f"Unknown VNC server: {name}")
+    server = SERVERS[name]
+    if not server.available():
+        raise RuntimeError(f"{server.title} is not installed.")
+    return server()
+
+
+def available_servers() -> List[str]:
+    return [name for name, server in SERVERS.items() if server.available()]
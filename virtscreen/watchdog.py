@@ -0,0 +1,133 @@
+"""Stall watchdog of the VNC server"""
+
+import os
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from . import metrics
+
+
+class ProcessSample(object):
+    """CPU time and I/O of a process, from /proc/<pid>/stat and io"""
+    __slots__ = ['state', 'cpu', 'io']
+
+    def __init__(self, state: str, cpu: float, io: Optional[int]):
+        self.state: str = state  # R, S, D, T, Z, ...
+        self.cpu: float = cpu  # seconds in user and kernel mode
+        self.io: Optional[int] = io  # bytes read and written, None if not readable
+
+    @classmethod
+    def read(cls, pid: int) -> 'ProcessSample':
+        """Raises OSError if the process is gone"""
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces and parentheses
+            fields = f.read().rpartition(')')[2].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        try:
+            with open(f"/proc/{pid}/io") as f:
+                counters = dict(line.split(':') for line in f if ':' in line)
+            io = int(counters['rchar']) + int(counters['wchar'])
+        except (OSError, KeyError, ValueError):
+            io = None
+        return cls(fields[0], cpu, io)
+
+
+class StallWatchdog:
+    """Detect a VNC server hung while a client is connected, e.g. blocked on
+    an X server grab or spinning without sending updates.
+
+    A serving VNC server polls the X server all the time, so its I/O keeps
+    growing. The server is suspected to stall when neither its I/O nor its
+    output has progressed for the timeout. If probing is enabled, the
+    suspicion is confirmed by connecting to the port: a working server
+    sends the RFB protocol version at once."""
+
+    BUSY = 0.9  # Share of a CPU core of a spinning server
+    PROBE_TIMEOUT = 3.0  # seconds
+
+    def __init__(self, pid: Callable[[], int], port: int, on_stall: Callable[[str], None],
+                 timeout: float = 10, probe: bool = True, interval: float = 1.0):
+        self.pid: Callable[[], int] = pid
+        self.port: int = port
+        self.on_stall: Callable[[str], None] = on_stall
+        self.timeout: float = timeout
+        self.probe: bool = probe
+        self.interval: float = interval
+        self.previous: ProcessSample = None
+        self.progress: float = 0.0  # Event loop time of the last progress
+        self.probing: asyncio.Task = None
+        self.handle: asyncio.Handle = None
+
+    def start(self) -> None:
+        self.previous = None
+        self.progress = asyncio.get_event_loop().time()
+        self._schedule()
+
+    def stop(self) -> None:
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.probing is not None:
+            self.probing.cancel()
+            self.probing = None
+
+    def _schedule(self) -> None:
+        self.handle = asyncio.get_event_loop().call_later(self.interval, self._tick)
+
+    def feed_output(self, data: str) -> None:
+        """Any output of the server is a heartbeat."""
+        self.progress = asyncio.get_event_loop().time()
+
+    def _tick(self) -> None:
+        self._schedule()
+        try:
+            current = ProcessSample.read(self.pid())
+        except (OSError, AttributeError):
+            return  # Exited, which the server process handles
+        previous, self.previous = self.previous, current
+        if previous is None:
+            return
+        now = asyncio.get_event_loop().time()
+        cpu = (current.cpu - previous.cpu) / self.interval
+        if current.io is None:
+            # Without I/O counters, only a spinning server is detected
+            if cpu < self.BUSY:
+                self.progress = now
+        elif current.io != previous.io:
+            self.progress = now
+        if now - self.progress < self.timeout or self.probing is not None:
+            return
+        if cpu >= self.BUSY:
+            reason = f"spinning at {cpu:.0%} CPU without I/O for {self.timeout:g} s"
+        else:
+            reason = f"no I/O for {self.timeout:g} s (process state {current.state})"
+        if self.probe:
+            self.probing = asyncio.ensure_future(self._probe(reason))
+        else:
+            self._stalled(reason)
+
+    async def _probe(self, reason: str) -> None:
+        """Connect to the server and wait for the RFB protocol version"""
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection('127.0.0.1', self.port), self.PROBE_TIMEOUT)
+            banner = await asyncio.wait_for(reader.readexactly(12), self.PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            banner = b''
+        finally:
+            if writer is not None:
+                writer.close()
+        self.probing = None
+        if banner.startswith(b'RFB '):
+            logging.info(f"VNC server answered the watchdog probe after {reason}")
+            self.progress = asyncio.get_event_loop().time()
+            return
+        self._stalled(reason + ", no answer on the port")
+
+    def _stalled(self, reason: str) -> None:
+        logging.error(f"VNC server stalled: {reason}")
+        metrics.record('watchdog', state='stalled', reason=reason)
+        self.stop()
+        self.on_stall(reason)
@@ -1,18 +1,62 @@
 """XRandr parser"""
 
+import os
 import re
+import json
 import atexit
 import subprocess
 import logging
-from typing import List
+from typing import Dict, List, Set, Tuple
 
 from .display import Display
-from .process import SubprocessWrapper
+from .process import SubprocessWrapper, is_virtscreen
+from .layout import solve_position
+from .path import VIRT_MODES_PATH
 
 
 VIRT_SCREEN_SUFFIX = "_virt"
 
 
+def _load_owners() -> Dict[str, List[int]]:
+    """Pids of the VirtScreen instances using each mode"""
+    try:
+        with open(VIRT_MODES_PATH, 'r') as f:
+            owners = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return owners if isinstance(owners, dict) else {}
+
+
+def _save_owners(owners: Dict[str, List[int]]) -> None:
+    try:
+        with open(VIRT_MODES_PATH + '.tmp', 'w') as f:
+            json.dump(owners, f)
+        os.replace(VIRT_MODES_PATH + '.tmp', VIRT_MODES_PATH)
+    except OSError as e:
+        logging.warning(f"Cannot write {VIRT_MODES_PATH}: {e}")
+
+
+def _update_owner(mode: str, owned: bool) -> None:
+    """Record or forget this process as an owner of a mode, and forget
+    instances no longer running"""
+    pid = os.getpid()
+    owners = {}
+    for name, pids in _load_owners().items():
+        pids = [p for p in pids if p != pid and is_virtscreen(p)]
+        if pids:
+            owners[name] = pids
+    if owned:
+        owners.setdefault(mode, []).append(pid)
+    _save_owners(owners)
+
+
+def _foreign_modes() -> Set[str]:
+    """Modes owned by other running VirtScreen instances"""
+    pid = os.getpid()
+    return set(mode for mode, pids in _load_owners().items()
+               if any(p != pid and is_virtscreen(p) for p in pids))
+
+
 class XRandR(SubprocessWrapper):
     """XRandr parser class"""
 
@@ -25,11 +69,15 @@ class XRandR(SubprocessWrapper):
         self.virt_name: str = ''
         self.virt_idx: int = None
         self.primary_idx: int = None
+        # Mode of the virtual screen created by this instance
+        self.owned_mode: str = ''
         # Primary display
         self._update_screens()
 
     def _update_screens(self) -> None:
-        output = self.run("xrandr")
+        self._parse_screens(self.run("xrandr"))
+
+    def _parse_screens(self, output: str) -> None:
         self.primary = None
         self.virt = None
         self.screens = []
@@ -96,6 +144,8 @@ class XRandR(SubprocessWrapper):
             self.check_output(f"xrandr --newmode {self.mode_name} {mode}")
             # Add mode again
             self.check_output(args_addmode)
+        self.owned_mode = self.mode_name
+        _update_owner(self.mode_name, True)
         # After adding mode the program should delete the mode automatically on exit
         atexit.register(self.delete_virtual_screen)
 
@@ -107,13 +157,23 @@ class XRandR(SubprocessWrapper):
         self._update_screens()
         return self.virt
 
-    def create_virtual_screen(self, width, height, portrait=False, hidpi=False, pos='') -> None:
+    def create_virtual_screen(self, width, height, portrait=False, hidpi=False, pos='',
+                              relative_to='') -> None:
         self._update_screens()
         logging.info(f"creating: {self.virt}")
         self._add_screen_mode(width, height, portrait, hidpi)
         arg_pos = ['left', 'right', 'above', 'below']
         xrandr_pos = ['--left-of', '--right-of', '--above', '--below']
-        if pos and pos in arg_pos:
+        if pos == 'auto' or (relative_to and pos in arg_pos):
+            # Compute absolute positions avoiding overlaps with all outputs
+            side = '' if pos == 'auto' else pos
+            positions = solve_position(self.screens, self.virt.name, self.virt.width,
+                                       self.virt.height, relative_to, side)
+            x, y = positions.pop(self.virt.name)
+            pos = f"--pos {x}x{y}"
+            for name, (x, y) in positions.items():
+                pos += f" --output {name} --pos {x}x{y}"
+        elif pos and pos in arg_pos:
             # convert pos for xrandr
             pos = xrandr_pos[arg_pos.index(pos)]
             pos += ' ' + self.primary.name
@@ -126,6 +186,22 @@ class XRandR(SubprocessWrapper):
         self.check_output(f"xrandr --output {self.virt.name} {pos}")
         self._update_screens()
 
+    def restore_virtual_screen(self, width, height, portrait, hidpi,
+                               positions: Dict[str, Tuple[int, int]]) -> None:
+        """Create the virtual screen with the saved absolute positions of all
+        outputs, in a single xrandr call."""
+        self._update_screens()
+        logging.info(f"restoring: {self.virt}")
+        self._add_screen_mode(width, height, portrait, hidpi)
+        x, y = positions[self.virt.name]
+        arg = f"xrandr --output {self.virt.name} --mode {self.mode_name} --pos {x}x{y}"
+        active = set(screen.name for screen in self.screens if screen.active)
+        for name, (x, y) in positions.items():
+            if name != self.virt.name and name in active:
+                arg += f" --output {name} --pos {x}x{y}"
+        self.check_output(arg)
+        self._update_screens()
+
     def delete_virtual_screen(self) -> None:
         self._update_screens()
         try:
@@ -135,5 +211,76 @@ class XRandR(SubprocessWrapper):
             return
         self.run(f"xrandr --output {self.virt.name} --off")
         self.run(f"xrandr --delmode {self.virt.name} {self.mode_name}")
+        if self.owned_mode:
+            _update_owner(self.owned_mode, False)
+        self.owned_mode = ''
         atexit.unregister(self.delete_virtual_screen)
         self._update_screens()
+
+    def _find_virt_modes(self) -> Tuple[Dict[str, List[Tuple[str, bool]]], List[str]]:
+        """Find VirtScreen modes in the X server.
+
+        Returns:
+            Tuple -- {output: [(mode, in use)]} of modes added to outputs, and
+                     modes not added to any output.
+        """
+        output = self.run("xrandr")
+        attached: Dict[str, List[Tuple[str, bool]]] = {}
+        unattached: List[str] = []
+        current = None
+        header = re.compile(r"^(\S+)\s+(connected|disconnected)")
+        for line in output.splitlines():
+            match = header.match(line)
+            if match:
+                current = match.group(1)
+                continue
+            if not line[:1].isspace():
+                current = None
+                continue
+            fields = line.split()
+            if not fields or not fields[0].endswith(VIRT_SCREEN_SUFFIX):
+                continue
+            if 'MHz' in line:
+                # Modes not added to any output are listed like
+                # "  1368x1024_virt (0x4b) 115.500MHz -HSync +VSync"
+                unattached.append(fields[0])
+            elif current is not None:
+                attached.setdefault(current, []).append((fields[0], '*' in line))
+        return attached, unattached
+
+    def reconcile(self) -> List[str]:
+        """Remove VirtScreen modes and enabled virtual outputs left over by
+        a previous instance, e.g. after a crash, SIGKILL or logout.
+
+        The mode owned by this instance, and modes of other running
+        instances (e.g. the GUI and virtscreen --auto), are kept, so it is
+        idempotent and safe to run periodically.
+
+        Returns:
+            List[str] -- executed xrandr commands
+        """
+        attached, unattached = self._find_virt_modes()
+        foreign = _foreign_modes()
+        commands = []
+        stale = set(mode for mode in unattached
+                    if mode != self.owned_mode and mode not in foreign)
+        for name, modes in attached.items():
+            for mode, in_use in modes:
+                if mode == self.owned_mode and name == self.virt_name:
+                    continue
+                if mode in foreign:
+                    continue
+                if in_use:
+                    commands.append(f"xrandr --output {name} --off")
+                commands.append(f"xrandr --delmode {name} {mode}")
+                if mode != self.owned_mode:
+                    stale.add(mode)
+        commands += [f"xrandr --rmmode {mode}" for mode in sorted(stale)]
+        for command in commands:
+            logging.info(f"Cleaning up leftover: {command}")
+            result = self.run(command)
+            if result:
+                logging.warning(f"{command}: {result.strip()}")
+        if commands:
+            self._update_screens()
+        return commands